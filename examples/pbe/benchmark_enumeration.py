@@ -0,0 +1,444 @@
+from multiprocessing import Pool, TimeoutError
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dsl_loader import add_dsl_choice_arg, load_DSL
+
+from synth.filter import DFTAFilter, ObsEqFilter
+from synth.filter.constraints import add_dfta_constraints
+from synth.generation.sampler import LexiconSampler
+from synth.semantic.evaluator import DSLEvaluator
+from synth.syntax import (
+    ProbDetGrammar,
+    ProbUGrammar,
+    hs_enumerate_prob_grammar,
+    bs_enumerate_prob_grammar,
+    bps_enumerate_prob_grammar,
+    hs_enumerate_prob_u_grammar,
+    hs_enumerate_bucket_prob_grammar,
+    hs_enumerate_cost_prob_grammar,
+    cd_enumerate_prob_grammar,
+    ProgramEnumerator,
+    Type,
+    CFG,
+    UCFG,
+    STRING,
+    List as TList,
+    auto_type,
+)
+from synth.syntax.program import Program
+
+import argparse
+
+# Fixed grammars: DSL -> (type request, max depth)
+GRAMMARS = {
+    "deepcoder": ("int list -> int list", 5),
+    "deepcoder.raw": ("int list -> int list", 4),
+    "dreamcoder": ("int list -> int list", 4),
+    "regexp": ("string list -> bool", 8),
+    "transduction": ("string -> string", 4),
+    "calculator": ("int -> int -> int", 6),
+}
+
+SEARCH_ALGOS: Dict[str, Callable[[ProbDetGrammar], ProgramEnumerator]] = {
+    "hs": hs_enumerate_prob_grammar,
+    "chs": hs_enumerate_cost_prob_grammar,
+    "bucket": lambda x: hs_enumerate_bucket_prob_grammar(x, 3),
+    "bps": bps_enumerate_prob_grammar,
+    "bs": bs_enumerate_prob_grammar,
+    "cd": lambda x: cd_enumerate_prob_grammar(x, 20),
+    # Enumerates the same programs through the unambiguous grammar machinery
+    "uhs": lambda x: hs_enumerate_prob_u_grammar(
+        ProbUGrammar.uniform(UCFG.from_CFG(x.grammar))  # type: ignore
+    ),
+}
+
+EVALUATOR_MODES = ["default", "compile", "vectorize"]
+FILTERS = ["dfta", "obs-eq"]
+
+parser = argparse.ArgumentParser(
+    description="Benchmark enumeration algorithms, the evaluator and filters on fixed grammars, results are written in JSON"
+)
+add_dsl_choice_arg(parser)
+parser.add_argument(
+    "-s",
+    "--search",
+    nargs="*",
+    choices=list(SEARCH_ALGOS.keys()),
+    default=list(SEARCH_ALGOS.keys()),
+    help="benchmarked enumeration algorithms (default: all)",
+)
+parser.add_argument(
+    "--evaluator",
+    nargs="*",
+    choices=EVALUATOR_MODES,
+    default=EVALUATOR_MODES,
+    help="benchmarked evaluator modes (default: all)",
+)
+parser.add_argument(
+    "--filter",
+    nargs="*",
+    choices=FILTERS,
+    default=FILTERS,
+    help="benchmarked filters (default: all)",
+)
+parser.add_argument(
+    "-n",
+    "--programs",
+    type=int,
+    default=100000,
+    help="number of programs enumerated per benchmark (default: 100000)",
+)
+parser.add_argument(
+    "--warmup",
+    type=int,
+    default=1000,
+    help="number of programs enumerated before measuring (default: 1000)",
+)
+parser.add_argument(
+    "--depth",
+    type=int,
+    default=None,
+    help="max depth of the grammar (default: per DSL)",
+)
+parser.add_argument(
+    "--examples",
+    type=int,
+    default=5,
+    help="number of sampled inputs used by the evaluator and filters (default: 5)",
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    default=1,
+    help="number of runs of each benchmark, the median is reported (default: 1)",
+)
+parser.add_argument(
+    "--seed",
+    type=int,
+    default=None,
+    help="use a random PCFG generated with this seed instead of the uniform one",
+)
+parser.add_argument(
+    "-t",
+    "--timeout",
+    type=float,
+    default=300,
+    help="timeout of a single run in s (default: 300)",
+)
+parser.add_argument(
+    "-o",
+    "--output",
+    type=str,
+    default=os.path.join(tempfile.gettempdir(), "benchmark.json"),
+    help="output file (default: benchmark.json in the temporary directory)",
+)
+parser.add_argument(
+    "--compare",
+    type=str,
+    default=None,
+    help="results of a previous run, exits with code 1 if throughput regressed",
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=0.1,
+    help="relative throughput loss tolerated by --compare (default: 0.1)",
+)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def load_grammar(
+    dsl_name: str, depth: Optional[int], seed: Optional[int]
+) -> Tuple[Any, ProbDetGrammar]:
+    dsl_module = load_DSL(dsl_name)
+    type_request, default_depth = GRAMMARS[dsl_name]
+    cfg = CFG.depth_constraint(
+        dsl_module.dsl,
+        auto_type(type_request),
+        depth or default_depth,
+        constant_types=getattr(dsl_module, "constant_types", set()),
+    )
+    if seed is None:
+        return dsl_module, ProbDetGrammar.uniform(cfg)
+    return dsl_module, ProbDetGrammar.random(cfg, seed=seed)
+
+
+def milestones(n: int) -> List[int]:
+    out = []
+    k = 1
+    while k < n:
+        out.append(k)
+        k *= 10
+    return out + [n]
+
+
+def enumerate_programs(
+    enumerator: ProgramEnumerator, n: int, timeout: float
+) -> Tuple[int, float, Dict[str, float]]:
+    """
+    Enumerate at most n programs and returns the number of programs, the time taken and the time to the k-th program for the milestones.
+    """
+    targets = milestones(n)
+    time_to_kth: Dict[str, float] = {}
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    for _ in enumerator:
+        count += 1
+        elapsed = time.perf_counter() - start
+        if count == targets[len(time_to_kth)]:
+            time_to_kth[str(count)] = elapsed
+            if count >= n:
+                break
+        if elapsed > timeout:
+            break
+    return count, elapsed, time_to_kth
+
+
+def sample_inputs(
+    dsl_module: Any, arguments: List[Type], examples: int, seed: Optional[int]
+) -> List[List[Any]]:
+    sampler = LexiconSampler(dsl_module.lexicon, seed=seed or 0)
+    lengths = LexiconSampler(list(range(1, 9)), seed=seed or 0)
+
+    def sample(arg: Type) -> Any:
+        if arg.is_instance(TList):
+            return [sample(arg.types[0]) for _ in range(lengths.sample())]  # type: ignore
+        elif arg == STRING:
+            return "".join(str(sampler.sample()) for _ in range(lengths.sample()))
+        return sampler.sample()
+
+    return [[sample(arg) for arg in arguments] for _ in range(examples)]
+
+
+def bench_enumeration(
+    dsl_name: str, name: str, n: int, warmup: int, timeout: float, params: Dict
+) -> Dict[str, Any]:
+    _, pcfg = load_grammar(dsl_name, params["depth"], params["seed"])
+    enumerate_programs(SEARCH_ALGOS[name](pcfg), warmup, timeout)
+    gc.collect()
+    rss_before = peak_rss_mb()
+    enumerator = SEARCH_ALGOS[name](pcfg)
+    count, elapsed, time_to_kth = enumerate_programs(enumerator, n, timeout)
+    return {
+        "programs": count,
+        "time": elapsed,
+        "throughput": count / max(elapsed, 1e-9),
+        "time_to_kth": time_to_kth,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_increase_mb": peak_rss_mb() - rss_before,
+        "programs_in_banks": enumerator.programs_in_banks(),
+        "bytes_in_banks": enumerator.bytes_in_banks(),
+    }
+
+
+def __programs_and_inputs__(
+    dsl_name: str, n: int, params: Dict
+) -> Tuple[Any, ProbDetGrammar, List[Program], List[List[Any]]]:
+    dsl_module, pcfg = load_grammar(dsl_name, params["depth"], params["seed"])
+    programs: List[Program] = []
+    for program in hs_enumerate_prob_grammar(pcfg):
+        programs.append(program)
+        if len(programs) >= n:
+            break
+    inputs = sample_inputs(
+        dsl_module,
+        pcfg.type_request.arguments(),
+        params["examples"],
+        params["seed"],
+    )
+    return dsl_module, pcfg, programs, inputs
+
+
+def bench_evaluator(
+    dsl_name: str, name: str, n: int, warmup: int, timeout: float, params: Dict
+) -> Dict[str, Any]:
+    dsl_module, _, programs, inputs = __programs_and_inputs__(
+        dsl_name, n + warmup, params
+    )
+    evaluator = dsl_module.evaluator
+    if isinstance(evaluator, DSLEvaluator):
+        evaluator.use_compilation = name == "compile"
+        if name == "vectorize":
+            evaluator.register_vectorized_semantics(
+                getattr(dsl_module, "vectorized_semantics", {})
+            )
+        evaluator.register_inputs(inputs)
+    errors = 0
+    count = 0
+    start = time.perf_counter()
+    for i, program in enumerate(programs):
+        if i == warmup:
+            errors = 0
+            start = time.perf_counter()
+        try:
+            evaluator.eval_batch(program, inputs)
+        except Exception:
+            errors += 1
+        if i >= warmup:
+            count += 1
+            if time.perf_counter() - start > timeout:
+                break
+    elapsed = time.perf_counter() - start
+    return {
+        "programs": count,
+        "evaluations": count * len(inputs),
+        "errors": errors,
+        "time": elapsed,
+        "throughput": count * len(inputs) / max(elapsed, 1e-9),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_filter(
+    dsl_name: str, name: str, n: int, warmup: int, timeout: float, params: Dict
+) -> Dict[str, Any]:
+    dsl_module, pcfg, programs, inputs = __programs_and_inputs__(dsl_name, n, params)
+    if name == "dfta":
+        base_grammar = CFG.infinite(
+            dsl_module.dsl,
+            pcfg.type_request,
+            constant_types=getattr(dsl_module, "constant_types", set()),
+        )
+        filter: Any = DFTAFilter(
+            add_dfta_constraints(base_grammar, dsl_module.constraints, progress=False)
+        )
+    else:
+        filter = ObsEqFilter(dsl_module.evaluator, inputs)
+    accepted = 0
+    count = 0
+    start = time.perf_counter()
+    for program in programs:
+        try:
+            accepted += filter.accept(program)
+        except Exception:
+            pass
+        count += 1
+        if time.perf_counter() - start > timeout:
+            break
+    elapsed = time.perf_counter() - start
+    return {
+        "programs": count,
+        "accepted": accepted,
+        "time": elapsed,
+        "throughput": count / max(elapsed, 1e-9),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+BENCHMARKS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "enumeration": bench_enumeration,
+    "evaluator": bench_evaluator,
+    "filter": bench_filter,
+}
+
+
+def run(
+    benchmark: str, dsl_name: str, name: str, args: Tuple, repeat: int
+) -> Dict[str, Any]:
+    """
+    Run a benchmark several times, each in a fresh process so that the peak RSS only depends on this benchmark, and keep the median run.
+    The timeout is only checked between programs, a run that takes more than twice the timeout is killed and has a throughput of 0.
+    """
+    timeout = args[2]
+    runs = []
+    for _ in range(repeat):
+        with Pool(1) as pool:
+            job = pool.apply_async(BENCHMARKS[benchmark], (dsl_name, name, *args))
+            try:
+                runs.append(job.get(2 * timeout))
+            except TimeoutError:
+                runs.append({"programs": 0, "time": 2 * timeout, "throughput": 0.0})
+    runs.sort(key=lambda r: r["throughput"])
+    result: Dict[str, Any] = {"benchmark": benchmark, "dsl": dsl_name, "name": name}
+    result.update(runs[len(runs) // 2])
+    result["throughputs"] = [r["throughput"] for r in runs]
+    return result
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline_file: str, tolerance: float
+) -> bool:
+    """
+    Print the throughput ratios against the baseline and returns True iff no benchmark regressed.
+    """
+    with open(baseline_file) as fd:
+        baseline = {
+            (r["benchmark"], r["dsl"], r["name"]): r for r in json.load(fd)["results"]
+        }
+    ok = True
+    for result in results:
+        key = (result["benchmark"], result["dsl"], result["name"])
+        if key not in baseline:
+            continue
+        ratio = result["throughput"] / max(baseline[key]["throughput"], 1e-9)
+        regressed = ratio < 1 - tolerance
+        ok &= not regressed
+        print(f"{'/'.join(key):<40} {ratio:6.2f}x{' REGRESSION' if regressed else ''}")
+    return ok
+
+
+if __name__ == "__main__":
+    parameters = parser.parse_args()
+    dsl_name: str = parameters.dsl
+    if dsl_name not in GRAMMARS:
+        print(f"no fixed grammar for DSL {dsl_name}!", file=sys.stderr)
+        sys.exit(1)
+    dsl_module = load_DSL(dsl_name)
+    params = {
+        "depth": parameters.depth,
+        "seed": parameters.seed,
+        "examples": parameters.examples,
+    }
+    args = (parameters.programs, parameters.warmup, parameters.timeout, params)
+
+    todo = [("enumeration", name) for name in parameters.search]
+    todo += [
+        ("evaluator", name)
+        for name in parameters.evaluator
+        if isinstance(dsl_module.evaluator, DSLEvaluator)
+        and (name != "vectorize" or hasattr(dsl_module, "vectorized_semantics"))
+    ]
+    todo += [
+        ("filter", name)
+        for name in parameters.filter
+        if name != "dfta" or hasattr(dsl_module, "constraints")
+    ]
+
+    results = []
+    for benchmark, name in todo:
+        result = run(benchmark, dsl_name, name, args, parameters.repeat)
+        results.append(result)
+        print(
+            f"{benchmark:<12} {name:<10} {result['throughput']:>12.0f}/s  peak RSS: {result.get('peak_rss_mb', 0):.0f} MB"
+        )
+
+    metadata = {
+        "dsl": dsl_name,
+        "type_request": GRAMMARS[dsl_name][0],
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "parameters": vars(parameters),
+    }
+    with open(parameters.output, "w") as fd:
+        json.dump({"metadata": metadata, "results": results}, fd, indent=2)
+    print("results saved to", parameters.output)
+
+    if parameters.compare is not None and not compare(
+        results, parameters.compare, parameters.tolerance
+    ):
+        sys.exit(1)
@@ -25,12 +25,14 @@ def add_dataset_choice_arg(parser: ArgumentParser) -> None:
     )
 
 
-def load_dataset(dsl_name: str, dataset_file: str, verbose: bool = True) -> Dataset:
+def load_dataset(
+    dsl_name: str, dataset_file: str, verbose: bool = True, lazy: bool = False
+) -> Dataset:
     dataset_file = dataset_file.format(dsl_name=dsl_name)
     if verbose:
         print(f"Loading {F.LIGHTCYAN_EX}{dataset_file}{F.RESET}...", end="")
     with chrono.clock("dataset.load") as c:
-        full_dataset: Dataset = Dataset.load(dataset_file, DatasetUnpickler)
+        full_dataset: Dataset = Dataset.load(dataset_file, DatasetUnpickler, lazy)
         if verbose:
             print(f"done in {c.elapsed_time():.2}s")
         return full_dataset
@@ -1,4 +1,17 @@
+import numpy as np
+
 from synth.semantic import DSLEvaluator
+from synth.semantic.vectorized import (
+    INT_BOUND,
+    vcount,
+    vfilter,
+    vmap,
+    vreduce,
+    vreverse,
+    vscanl,
+    vsort,
+    vzipwith,
+)
 from synth.syntax import DSL, INT, Arrow, PolymorphicType, List
 
 t0 = PolymorphicType("t0")
@@ -75,6 +88,62 @@ __semantics = {
     # 'MAP': lambda f: lambda l: list(map(f, l)),
 }
 
+# int(x / 2) goes through floats so it is exact only for small enough integers
+__exact_division = lambda m: m if m <= 2**53 else INT_BOUND + 1
+
+# Semantics evaluating a primitive on all examples at once with NumPy, see DSLEvaluator.register_vectorized_semantics
+__vectorized_semantics = {
+    "HEAD": vreduce(lambda v, mask: v[:, 0], allow_empty=False),
+    "TAIL": vreduce(
+        lambda v, mask: np.take_along_axis(v, mask.sum(axis=1)[:, None] - 1, axis=1)[
+            :, 0
+        ],
+        allow_empty=False,
+    ),
+    "MINIMUM": vreduce(
+        lambda v, mask: np.where(mask, v, INT_BOUND + 1).min(axis=1),
+        allow_empty=False,
+    ),
+    "MAXIMUM": vreduce(
+        lambda v, mask: np.where(mask, v, -INT_BOUND - 1).max(axis=1),
+        allow_empty=False,
+    ),
+    "LENGTH": vreduce(lambda v, mask: mask.sum(axis=1), lambda m, n: n),
+    "COUNT[<0]": vcount(lambda v: v < 0),
+    "COUNT[>0]": vcount(lambda v: v > 0),
+    "COUNT[EVEN]": vcount(lambda v: v % 2 == 0),
+    "COUNT[ODD]": vcount(lambda v: v % 2 == 1),
+    "SUM": vreduce(lambda v, mask: v.sum(axis=1), lambda m, n: m * n),
+    "SORT": vsort,
+    "REVERSE": vreverse,
+    "FILTER[<0]": vfilter(lambda v: v < 0),
+    "FILTER[>0]": vfilter(lambda v: v > 0),
+    "FILTER[EVEN]": vfilter(lambda v: v % 2 == 0),
+    "FILTER[ODD]": vfilter(lambda v: v % 2 == 1),
+    "MAP[+1]": vmap(lambda v: v + 1, lambda m: m + 1),
+    "MAP[-1]": vmap(lambda v: v - 1, lambda m: m + 1),
+    "MAP[*2]": vmap(lambda v: v * 2, lambda m: 2 * m),
+    "MAP[/2]": vmap(lambda v: np.sign(v) * (np.abs(v) // 2), __exact_division),
+    "MAP[*3]": vmap(lambda v: v * 3, lambda m: 3 * m),
+    "MAP[/3]": vmap(lambda v: np.sign(v) * (np.abs(v) // 3), __exact_division),
+    "MAP[*4]": vmap(lambda v: v * 4, lambda m: 4 * m),
+    "MAP[/4]": vmap(lambda v: np.sign(v) * (np.abs(v) // 4), __exact_division),
+    "MAP[**2]": vmap(lambda v: v * v, lambda m: m * m),
+    "MAP[*-1]": vmap(lambda v: -v),
+    "ZIPWITH[+]": vzipwith(np.add),
+    "ZIPWITH[-]": vzipwith(np.subtract),
+    "ZIPWITH[*]": vzipwith(np.multiply, lambda m1, m2: m1 * m2),
+    "ZIPWITH[max]": vzipwith(np.maximum, max),
+    "ZIPWITH[min]": vzipwith(np.minimum, max),
+    "SCAN1L[+]": vscanl(lambda v: np.cumsum(v, axis=1)),
+    "SCAN1L[-]": vscanl(
+        lambda v: np.cumsum(np.concatenate([v[:, :1], -v[:, 1:]], axis=1), axis=1)
+    ),
+    "SCAN1L[*]": vscanl(lambda v: np.cumprod(v, axis=1), lambda m, n: m**n),
+    "SCAN1L[min]": vscanl(lambda v: np.minimum.accumulate(v, axis=1), lambda m, n: m),
+    "SCAN1L[max]": vscanl(lambda v: np.maximum.accumulate(v, axis=1), lambda m, n: m),
+}
+
 __primitive_types = {
     "HEAD": Arrow(List(INT), INT),
     "TAIL": Arrow(List(INT), INT),
@@ -400,6 +469,8 @@ dsl = DSL(__primitive_types, __forbidden_patterns)
 dsl_raw = DSL(__primitive_types)
 evaluator = DSLEvaluator(dsl.instantiate_semantics(__semantics))
 evaluator.skip_exceptions.add(OverflowError)
+# Opt-in since NumPy only pays off when there are many examples or long lists
+vectorized_semantics = dsl.instantiate_semantics(__vectorized_semantics)
 lexicon = list(range(-256, 256 + 1))
 
 
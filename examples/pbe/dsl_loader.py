@@ -41,11 +41,15 @@ def __base_loader(
 #   reproduce_dataset: Callable - synth.pbe.task_generator.reproduce_int_dataset like function
 #   pretty_print_inputs: Callable[[List[Any]], str] - a function to change the default format to print the inputs to an example in a task
 #   pretty_print_solution: Callable[[Any], str] - a function to change the default format to print the solution to a task
+#   vectorized_semantics: Dict[Primitive, Callable] - vectorized semantics for DSLEvaluator.register_vectorized_semantics
 # =======================================================================================
 __dsl_funcs: Dict[str, Callable[[bool], Optional[SimpleNamespace]]] = {
-    "deepcoder": __base_loader("deepcoder.deepcoder"),
+    "deepcoder": __base_loader(
+        "deepcoder.deepcoder", ["dsl", "evaluator", "lexicon", "vectorized_semantics"]
+    ),
     "deepcoder.raw": __base_loader(
-        "deepcoder.deepcoder", [("dsl_raw", "dsl"), "evaluator", "lexicon"]
+        "deepcoder.deepcoder",
+        [("dsl_raw", "dsl"), "evaluator", "lexicon", "vectorized_semantics"],
     ),
     "dreamcoder": __base_loader(
         "dreamcoder.dreamcoder", ["dsl", "evaluator", "lexicon", "constraints"]
@@ -187,7 +187,7 @@ def produce_pcfgs(
     # ================================
     def save_pcfgs() -> None:
         print("Saving PCFGs...", end="")
-        save_object(file, pcfgs)
+        save_object(file, pcfgs, codec="zlib")
         print("done!")
 
     atexit.register(save_pcfgs)
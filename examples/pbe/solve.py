@@ -1,6 +1,19 @@
+from multiprocessing import Pool
 import os
+import signal
 import sys
-from typing import Any, Callable, Iterable, List, Optional, Set, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 import csv
 
 import tqdm
@@ -23,13 +36,14 @@ from synth.syntax import (
     hs_enumerate_prob_u_grammar,
     hs_enumerate_bucket_prob_grammar,
     hs_enumerate_bucket_prob_u_grammar,
+    hs_enumerate_cost_prob_grammar,
     cd_enumerate_prob_grammar,
     ProgramEnumerator,
     Type,
     CFG,
 )
 from synth.filter import DFTAFilter, ObsEqFilter
-from synth.filter.constraints import add_dfta_constraints
+from synth.filter.constraints import DFTACache
 from synth.syntax.program import Program
 from synth.task import Task
 from synth.utils import load_object
@@ -39,29 +53,38 @@ from synth.pbe.solvers import (
     PBESolver,
     CutoffPBESolver,
     RestartPBESolver,
+    ParallelPBESolver,
 )
 
 
 import argparse
 
-
 SOLVERS = {solver.name(): solver for solver in [NaivePBESolver, CutoffPBESolver]}
 base_solvers = {x: y for x, y in SOLVERS.items()}
-for meta_solver in [RestartPBESolver]:
+for meta_solver in [RestartPBESolver, ParallelPBESolver]:
     for name, solver in base_solvers.items():
-        SOLVERS[f"{meta_solver.name()}.{name}"] = lambda *args, **kwargs: meta_solver(
-            *args, solver_builder=solver, **kwargs
+        SOLVERS[f"{meta_solver.name()}.{name}"] = (
+            lambda *args, meta_solver=meta_solver, solver=solver, **kwargs: meta_solver(
+                *args, solver_builder=solver, **kwargs
+            )
         )
 
 SEARCH_ALGOS = {
     "cd_search": (lambda x: cd_enumerate_prob_grammar(x, 20), None),
-    "beap_search": (bps_enumerate_prob_grammar, None),
+    "beap_search": (
+        lambda x: bps_enumerate_prob_grammar(x, compact_bank=compact_bank),
+        None,
+    ),
     "heap_search": (hs_enumerate_prob_grammar, hs_enumerate_prob_u_grammar),
+    "cost_heap_search": (hs_enumerate_cost_prob_grammar, None),
     "bucket_search": (
         lambda x: hs_enumerate_bucket_prob_grammar(x, 3),
         lambda x: hs_enumerate_bucket_prob_u_grammar(x, 3),
     ),
-    "bee_search": (bs_enumerate_prob_grammar, None),
+    "bee_search": (
+        lambda x: bs_enumerate_prob_grammar(x, compact_bank=compact_bank),
+        None,
+    ),
 }
 
 PRUNING = {"dfta", "obs-eq"}
@@ -105,6 +128,42 @@ parser.add_argument(
 parser.add_argument(
     "-t", "--timeout", type=float, default=300, help="task timeout in s (default: 300)"
 )
+parser.add_argument(
+    "--compile",
+    action="store_true",
+    default=False,
+    help="compile programs into Python closures before evaluating them",
+)
+parser.add_argument(
+    "--cache-size",
+    type=int,
+    default=None,
+    help="maximum number of evaluations kept in the evaluator's cache (default: unbounded)",
+)
+parser.add_argument(
+    "--vectorize",
+    action="store_true",
+    default=False,
+    help="evaluate primitives on all examples at once with the DSL's vectorized semantics if available",
+)
+parser.add_argument(
+    "--compact-bank",
+    action="store_true",
+    default=False,
+    help="the bottom-up enumerators (beap_search, bee_search) do not keep programs in their bank but rebuild them when needed, uses less memory but is slower",
+)
+parser.add_argument(
+    "--splits",
+    type=int,
+    default=4,
+    help="number of grammar fragments enumerated in parallel by the parallel solvers (default: 4)",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="number of processes solving tasks in parallel (default: 1)",
+)
 
 parser.add_argument(
     "-p",
@@ -113,6 +172,12 @@ parser.add_argument(
     choices=list(x for x in PRUNING),
     help="runtime pruning",
 )
+parser.add_argument(
+    "--dfta-cache",
+    type=str,
+    default=None,
+    help="folder where the DFTA compiled from the constraints for the dfta pruning are saved to be shared across runs and workers (default: only kept in memory)",
+)
 parser.add_argument(
     "--filter",
     nargs="*",
@@ -134,6 +199,13 @@ support: Optional[str] = (
 )
 pruning: List[str] = parameters.pruning or []
 filter_files: List[str] = parameters.filter or []
+compile_programs: bool = parameters.compile
+cache_size: Optional[int] = parameters.cache_size
+vectorize: bool = parameters.vectorize
+workers: int = parameters.workers
+splits: int = parameters.splits
+compact_bank: bool = parameters.compact_bank
+dfta_cache = DFTACache(parameters.dfta_cache)
 
 if not os.path.exists(dataset_file) or not os.path.isfile(dataset_file):
     print("Dataset must be a valid dataset file!", file=sys.stderr)
@@ -144,6 +216,10 @@ elif support is not None and (
     print("Support dataset must be a valid dataset file!", file=sys.stderr)
     sys.exit(1)
 
+if workers > 1 and parameters.solver.startswith(ParallelPBESolver.name()):
+    print("parallel solvers cannot be used with more than one worker!", file=sys.stderr)
+    sys.exit(1)
+
 det_search, u_search = SEARCH_ALGOS[search_algo]
 custom_enumerate = u_search if constrained else det_search
 if custom_enumerate is None:
@@ -153,6 +229,13 @@ if custom_enumerate is None:
         file=sys.stderr,
     )
     sys.exit(1)
+if parameters.solver.startswith(ParallelPBESolver.name()) and u_search is None:
+    # Fragments are unambiguous grammars, enumerating them with another algorithm would silently replace the chosen one
+    print(
+        f"search algorithm {search_algo} does not support enumeration for UCFG, it cannot be used with parallel solvers!",
+        file=sys.stderr,
+    )
+    sys.exit(1)
 
 start_index = (
     0
@@ -161,7 +244,9 @@ start_index = (
 )
 dataset_name = dataset_file[start_index : dataset_file.index(".", start_index)]
 
-supported_type_requests = Dataset.load(support).type_requests() if support else None
+supported_type_requests = (
+    Dataset.load(support, lazy=True).type_requests() if support else None
+)
 
 # ================================
 # Load dftas files
@@ -177,18 +262,18 @@ filter_funs = [x.get_filter for x in filter_pot_funs if x is not None]
 # ================================
 
 
-def load_dsl_and_dataset() -> (
-    Tuple[Dataset[PBE], DSL, DSLEvaluator, List[str], Set[Type]]
-):
+def load_dsl() -> Tuple[DSL, DSLEvaluator, List[str], Set[Type]]:
     dsl_module = load_DSL(dsl_name)
     dsl, evaluator = dsl_module.dsl, dsl_module.evaluator
-    # ================================
-    # Load dataset
-    # ================================
-    full_dataset = load_dataset(dsl_name, dataset_file)
-
+    if isinstance(evaluator, DSLEvaluator):
+        evaluator.use_compilation = compile_programs
+        evaluator.cache_size = cache_size
+        if vectorize:
+            evaluator.register_vectorized_semantics(
+                getattr(dsl_module, "vectorized_semantics", {})
+            )
+        evaluator.clear_cache()
     return (
-        full_dataset,
         dsl,
         evaluator,
         getattr(dsl_module, "constraints", []),
@@ -196,6 +281,18 @@ def load_dsl_and_dataset() -> (
     )
 
 
+def load_dsl_and_dataset() -> (
+    Tuple[Dataset[PBE], DSL, DSLEvaluator, List[str], Set[Type]]
+):
+    dsl, evaluator, constraints, constant_types = load_dsl()
+    # ================================
+    # Load dataset
+    # ================================
+    full_dataset = load_dataset(dsl_name, dataset_file, lazy=True)
+
+    return (full_dataset, dsl, evaluator, constraints, constant_types)
+
+
 # Produce PCFGS ==========================================================
 
 
@@ -215,11 +312,8 @@ def setup_filters(
     for filter in filters:
         out = filter if out is None else out.intersection(filter)
     if "dfta" in pruning:
-        base_grammar = CFG.infinite(
-            dsl, task.type_request, constant_types=constant_types
-        )
         filter = DFTAFilter(
-            add_dfta_constraints(base_grammar, constraints, progress=False)
+            dfta_cache.get_compiled(dsl, task.type_request, constraints, constant_types)
         )
         out = filter if out is None else out.intersection(filter)
     if "obs-eq" in pruning:
@@ -230,6 +324,64 @@ def setup_filters(
     return out
 
 
+def build_solver(evaluator: DSLEvaluator) -> PBESolver:
+    kwargs: Dict[str, Any] = {}
+    if parameters.solver.startswith(ParallelPBESolver.name()):
+        # Parallel solvers enumerate fragments of the grammar, which are unambiguous grammars
+        kwargs["splits"] = splits
+        if u_search is not None:
+            kwargs["enumerator_builder"] = u_search
+    return method(evaluator=evaluator, **kwargs)
+
+
+def solve_task(
+    task: Task[PBE],
+    pcfg: Union[ProbDetGrammar, ProbUGrammar],
+    constant_types: Set[Type],
+) -> List[Any]:
+    """
+    Solve the task and returns its row of the trace, stats of the solver and cache of the evaluator are reset afterwards.
+    """
+    task_solved = False
+    solution = None
+    if isinstance(task.specification, PBEWithConstants):
+        pcfg = pcfg.instantiate_constants(task.specification.constants)
+    try:
+        enumerator = custom_enumerate(pcfg)
+        enumerator.filter = setup_filters(task, constant_types)
+        sol_generator = solver.solve(task, enumerator, timeout=task_timeout)
+        solution = next(sol_generator)
+        sol_generator.send(True)
+        task_solved = True
+    except StopIteration:
+        pass
+    out = [task_solved, solution] + [
+        solver.get_stats(name) for name in solver.available_stats()
+    ]
+    solver.reset_stats()
+    evaluator.clear_cache()
+    return out
+
+
+def __init_worker__(dataset: Dataset[PBE]) -> None:
+    # Each worker has its own DSL, evaluator and solver, hence its own cache and stats
+    global dsl, evaluator, constraints, constant_types, solver, full_dataset
+    # Interruptions are handled by the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    dsl, evaluator, constraints, constant_types = load_dsl()
+    solver = build_solver(evaluator)
+    # A LazyDataset is pickled as its path so tasks are only decoded by the worker solving them
+    full_dataset = dataset
+
+
+def __solve_task_in_worker__(
+    job: Tuple[int, Union[ProbDetGrammar, ProbUGrammar]],
+) -> Tuple[Optional[str], List[Any]]:
+    # The task is only decoded here, the main process only sees its name
+    task = full_dataset.tasks[job[0]]
+    return task.metadata.get("name", None), solve_task(task, job[1], constant_types)
+
+
 def enumerative_search(
     dataset: Dataset[PBE],
     evaluator: DSLEvaluator,
@@ -241,52 +393,53 @@ def enumerative_search(
     ],
     save_file: str,
     constant_types: Set[Type],
+    workers: int = 1,
 ) -> None:
     start = max(0, len(trace) - 1)
     pbar = tqdm.tqdm(total=len(pcfgs) - start, desc="Tasks", smoothing=0)
     i = 0
     solved = 0
     total = 0
-    tasks = [
-        t
-        for t in dataset.tasks
-        if supported_type_requests is None or t.type_request in supported_type_requests
-    ]
+    # Only indices are kept so that tasks of a LazyDataset are decoded one at a time when solved
+    indices: Sequence[int] = range(len(dataset.tasks))
+    if supported_type_requests is not None:
+        indices = dataset.indices_of_type_requests(supported_type_requests)
     stats_name = solver.available_stats()
     if start == 0:
         trace.append(["solved", "solution"] + stats_name)
-    for task, pcfg in zip(tasks[start:], pcfgs[start:]):
-        if task.metadata.get("name", None) is not None:
-            pbar.set_description_str(task.metadata["name"])
+    pool = None
+    if workers > 1:
+        pool = Pool(workers, __init_worker__, (dataset,))
+        # Results come back in the order of the tasks
+        results = pool.imap(
+            __solve_task_in_worker__, zip(indices[start:], pcfgs[start:])
+        )
+    for index, pcfg in zip(indices[start:], pcfgs[start:]):
         total += 1
-        task_solved = False
-        solution = None
-        if isinstance(task.specification, PBEWithConstants):
-            pcfg = pcfg.instantiate_constants(task.specification.constants)
         try:
-            enumerator = custom_enumerate(pcfg)
-            enumerator.filter = setup_filters(task, constant_types)
-            sol_generator = solver.solve(task, enumerator, timeout=task_timeout)
-            solution = next(sol_generator)
-            sol_generator.send(True)
-            task_solved = True
-            solved += 1
+            if pool is None:
+                task = dataset.tasks[index]
+                if task.metadata.get("name", None) is not None:
+                    pbar.set_description_str(task.metadata["name"])
+                out = solve_task(task, pcfg, constant_types)
+            else:
+                name, out = next(results)
+                if name is not None:
+                    pbar.set_description_str(name)
         except KeyboardInterrupt:
             break
-        except StopIteration:
-            pass
-        out = [task_solved, solution] + [solver.get_stats(name) for name in stats_name]
-        solver.reset_stats()
+        if out[0]:
+            solved += 1
         trace.append(out)
         pbar.update(1)
-        evaluator.clear_cache()
         # print("Cache hit:", evaluator.cache_hit_rate)
         # print("Programs tried:", trace[len(trace) - 1][2])
         if i % 10 == 0:
             pbar.set_postfix_str("Saving...")
             save(trace, save_file)
         pbar.set_postfix_str(f"Solved {solved}/{total}")
-
+    if pool is not None:
+        pool.terminate()
     pbar.close()
 
 
@@ -308,9 +461,9 @@ def load_pcfgs(
 # Main ====================================================================
 
 if __name__ == "__main__":
-    (full_dataset, dsl, evaluator, constraints, constant_types) = load_dsl_and_dataset()
+    full_dataset, dsl, evaluator, constraints, constant_types = load_dsl_and_dataset()
 
-    solver: PBESolver = method(evaluator=evaluator)
+    solver: PBESolver = build_solver(evaluator)
 
     pcfgs = load_pcfgs(pcfg_file)
     if pcfg_file is None:
@@ -347,6 +500,7 @@ if __name__ == "__main__":
         custom_enumerate,
         file,
         constant_types,
+        workers,
     )
     save(trace, file)
     print("csv file was saved as:", file)
@@ -12,4 +12,8 @@ from synth.filter.syntactic_filter import (
     SyntacticFilter,
     SetFilter,
 )
-from synth.filter.constraints import add_constraints, add_dfta_constraints
+from synth.filter.constraints import (
+    add_constraints,
+    add_dfta_constraints,
+    DFTACache,
+)
@@ -1,2 +1,3 @@
 from synth.filter.constraints.ttcfg_constraints import add_constraints
 from synth.filter.constraints.dfta_constraints import add_dfta_constraints
+from synth.filter.constraints.dfta_cache import DFTACache
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from synth.filter.constraints.dfta_constraints import add_dfta_constraints
+from synth.syntax.automata.tree_automaton import DFTA, CompiledDFTA
+from synth.syntax.dsl import DSL
+from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.det_grammar import DerivableProgram
+from synth.syntax.type_system import Type
+from synth.utils.data_storage import load_object, save_object
+
+# Must be increased whenever the compilation of constraints changes so that outdated files are not used
+CACHE_VERSION = 1
+
+
+class DFTACache:
+    """
+    Cache of the DFTA compiled by add_dfta_constraints on the infinite CFG of a DSL.
+
+    A compiled DFTA only depends on the DSL, the type request, the constant types, the constraints and the sketch,
+    it is stored under a stable hash of those inputs so changing any of them compiles a new DFTA.
+    Compiled DFTA are kept in memory and if directory is not None they are also saved in this directory,
+    so that they are shared across runs and processes.
+    The read-only forms returned by get_compiled are only kept in memory.
+
+    Parameters:
+    -----------
+    - directory: the folder where compiled DFTA are saved, if None they are only kept in memory
+    - codec: the codec used to save compiled DFTA (see synth.utils.data_storage.available_codecs())
+    """
+
+    def __init__(self, directory: Optional[str] = None, codec: str = "zlib") -> None:
+        self.directory = directory
+        self.codec = codec
+        self._memory: Dict[str, DFTA[Tuple[Type, Any], DerivableProgram]] = {}
+        self._compiled: Dict[str, CompiledDFTA[Tuple[Type, Any], DerivableProgram]] = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(
+        dsl: DSL,
+        type_request: Type,
+        constraints: Iterable[str],
+        constant_types: Set[Type] = set(),
+        sketch: Optional[str] = None,
+    ) -> str:
+        """
+        Stable hash of the inputs of the compilation, it does not depend on the order of the constraints.
+        """
+        lines = [f"version: {CACHE_VERSION}", f"type request: {type_request}"]
+        lines += sorted(
+            f"primitive: {P.primitive}: {P.type}" for P in dsl.list_primitives
+        )
+        lines += sorted(
+            f"forbidden: {pattern}: {sorted(forbidden)}"
+            for pattern, forbidden in dsl.forbidden_patterns.items()
+        )
+        lines += sorted(f"constant type: {t}" for t in constant_types)
+        lines += sorted(f"constraint: {c}" for c in constraints)
+        lines.append(f"sketch: {sketch}")
+        return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+    def get(
+        self,
+        dsl: DSL,
+        type_request: Type,
+        constraints: Iterable[str],
+        constant_types: Set[Type] = set(),
+        sketch: Optional[str] = None,
+    ) -> DFTA[Tuple[Type, Any], DerivableProgram]:
+        """
+        Returns the DFTA of the given constraints on CFG.infinite(dsl, type_request, constant_types=constant_types),
+        it is only compiled if it is neither in memory nor in the directory.
+        """
+        constraints = list(constraints)
+        key = DFTACache.key(dsl, type_request, constraints, constant_types, sketch)
+        dfta = self._memory.get(key)
+        if dfta is not None:
+            return dfta
+        path = self.__path__(key)
+        if path is not None and os.path.isfile(path):
+            try:
+                dfta = load_object(path)
+            except Exception:
+                # A corrupted file is compiled and saved again
+                dfta = None
+        if dfta is None:
+            base_grammar = CFG.infinite(
+                dsl, type_request, constant_types=constant_types
+            )
+            dfta = add_dfta_constraints(
+                base_grammar, constraints, sketch, progress=False
+            )
+            if path is not None:
+                self.__save__(path, dfta)
+        self._memory[key] = dfta
+        return dfta
+
+    def get_compiled(
+        self,
+        dsl: DSL,
+        type_request: Type,
+        constraints: Iterable[str],
+        constant_types: Set[Type] = set(),
+        sketch: Optional[str] = None,
+    ) -> CompiledDFTA[Tuple[Type, Any], DerivableProgram]:
+        """
+        Returns the compiled form (see DFTA.compile()) of the DFTA returned by get,
+        it is only computed once per DFTA so that filters of tasks with the same type request share it.
+        """
+        constraints = list(constraints)
+        key = DFTACache.key(dsl, type_request, constraints, constant_types, sketch)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = self.get(
+                dsl, type_request, constraints, constant_types, sketch
+            ).compile()
+            self._compiled[key] = compiled
+        return compiled
+
+    def clear(self) -> None:
+        """
+        Clear the DFTA kept in memory, saved files are kept.
+        """
+        self._memory.clear()
+        self._compiled.clear()
+
+    def __path__(self, key: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, f"{key}.dfta")
+
+    def __save__(self, path: str, dfta: DFTA) -> None:
+        # Write to a temporary file then rename it so that other processes never read a partially written file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            save_object(tmp, dfta, codec=self.codec)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def __len__(self) -> int:
+        return len(self._memory)
@@ -1,7 +1,7 @@
-from typing import Dict, Generic, TypeVar, Optional
+from typing import Dict, Generic, TypeVar, Optional, Union
 
 from synth.filter.filter import Filter
-from synth.syntax.automata.tree_automaton import DFTA
+from synth.syntax.automata.tree_automaton import DFTA, CompiledDFTA
 from synth.syntax.grammars.grammar import DerivableProgram
 from synth.syntax.program import Function, Program, Lambda
 
@@ -15,36 +15,48 @@ class DFTAFilter(Filter, Generic[V]):
     If accepting_dfta then rejects programs that are not in the language of the DFTA.
     If not accepting_dfta, rejects programs that are in the language of the DFTA.
 
+    The DFTA is compiled (see DFTA.compile()) so reading a node costs a few int lookups,
+    the DFTA must not be modified afterwards.
+    An already compiled DFTA can be given instead so that it is shared by several filters.
+    The state of each program is cached, if cache_size is not None the cache is emptied when it holds more than cache_size programs.
     """
 
     def __init__(
-        self, dfta: DFTA[V, DerivableProgram], accepting_dfta: bool = True
+        self,
+        dfta: Union[DFTA[V, DerivableProgram], CompiledDFTA[V, DerivableProgram]],
+        accepting_dfta: bool = True,
+        cache_size: Optional[int] = 1000000,
     ) -> None:
         self.dfta = dfta
-        self._cache: Dict[Program, V] = {}
+        self.compiled: CompiledDFTA[V, DerivableProgram] = (
+            dfta if isinstance(dfta, CompiledDFTA) else dfta.compile()
+        )
+        self.cache_size = cache_size
+        self._cache: Dict[Program, int] = {}
         self.accepting_dfta = accepting_dfta
 
-    def _get_prog_state(self, prog: Program) -> Optional[V]:
-        state = self._cache.get(prog, None)
+    def __state_of__(self, prog: Program) -> int:
+        state = self._cache.get(prog)
         if state is not None:
             return state
+        compiled = self.compiled
         if isinstance(prog, Function):
-            fun = prog.function
-            args = tuple(self._get_prog_state(arg) for arg in prog.arguments)
-            state = self.dfta.read(fun, args)  # type: ignore
-            if state is not None:
-                self._cache[prog] = state
-            return state
+            args = tuple([self.__state_of__(arg) for arg in prog.arguments])
+            state = compiled.read(compiled.letter(prog.function), args)  # type: ignore
         elif isinstance(prog, Lambda):
             assert False, "Not implemented"
         else:
-            state = self.dfta.read(prog, ())  # type: ignore
-            if state is not None:
-                self._cache[prog] = state
-            return state
+            state = compiled.read(compiled.letter(prog), ())  # type: ignore
+        if self.cache_size is not None and len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[prog] = state
+        return state
+
+    def _get_prog_state(self, prog: Program) -> Optional[V]:
+        return self.compiled.state(self.__state_of__(prog))
 
     def accept(self, obj: Program) -> bool:
-        return (self._get_prog_state(obj) is not None) == self.accepting_dfta
+        return (self.__state_of__(obj) >= 0) == self.accepting_dfta
 
     def reset_cache(self) -> None:
         self._cache.clear()
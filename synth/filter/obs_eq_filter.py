@@ -17,19 +17,15 @@ class ObsEqFilter(Filter):
         """
         Returns True iff the prog is unique wrt to outputs
         """
-        outputs = None
-        for inputs in self.inputs_list:
-            out = self.evaluator.eval(prog, inputs)
-            if out is None:
-                return False
-            elif isinstance(out, List):
-                out = tuple(out)
-            outputs = (outputs, out)
-        original = self._cache[prog.type].get(outputs)  # type: ignore
+        outputs = self.evaluator.eval_batch(prog, self.inputs_list)
+        if any(out is None for out in outputs):
+            return False
+        key = tuple(tuple(out) if isinstance(out, List) else out for out in outputs)
+        original = self._cache[prog.type].get(key)
         if original is not None and hash(original) != hash(prog):
             return False
         else:
-            self._cache[prog.type][outputs] = prog  # type: ignore
+            self._cache[prog.type][key] = prog
             return True
 
     def accept(self, obj: Program) -> bool:
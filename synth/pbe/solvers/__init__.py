@@ -5,3 +5,4 @@ from synth.pbe.solvers.pbe_solver import (
     MetaPBESolver,
 )
 from synth.pbe.solvers.restart_pbe_solver import RestartPBESolver
+from synth.pbe.solvers.parallel_pbe_solver import ParallelPBESolver
@@ -0,0 +1,221 @@
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from multiprocessing.synchronize import Event
+from queue import Empty
+from typing import Any, Callable, Generator, Optional, Sequence, Set, Tuple, Union
+
+from synth.filter import Filter
+from synth.semantic.evaluator import DSLEvaluator
+from synth.specification import PBE
+from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.enumeration.grammar_splitter import split
+from synth.syntax.grammars.enumeration.program_enumerator import ProgramEnumerator
+from synth.syntax.grammars.enumeration.u_heap_search import enumerate_prob_u_grammar
+from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
+from synth.syntax.grammars.tagged_u_grammar import ProbUGrammar
+from synth.syntax.grammars.u_cfg import UCFG
+from synth.syntax.program import Program
+from synth.task import Task
+from synth.utils import chrono
+from synth.pbe.solvers.pbe_solver import MetaPBESolver, NaivePBESolver, PBESolver
+
+# Seconds waited for a message before checking that processes are still alive
+_POLL_INTERVAL = 1
+
+
+class ParallelPBESolver(MetaPBESolver):
+    """
+    A solver that splits the grammar of the enumerator into fragments of balanced probability mass (see grammar_splitter.split)
+    and enumerates each fragment in a separate process, programs are tested with the subsolver.
+    All processes are stopped as soon as a solution is accepted.
+    Only finite grammars can be split, with recursive grammars or a single split this solver behaves as its subsolver.
+
+    Processes are forked so that the evaluator does not need to be pickled, programs found are sent back to the main process.
+    If a process dies without reporting, for example killed by the OS, the other processes are stopped and a RuntimeError is raised.
+
+    Parameters:
+    -----------
+    - splits: the number of fragments, hence of processes
+    - enumerator_builder: creates the enumerator of a fragment, the filter of the original enumerator is given to each of them,
+    fragments are enumerated with this builder whatever the algorithm of the original enumerator
+    - desired_ratio: the maximum ratio between the probability masses of the most and the least probable fragments targeted by the splitting
+    """
+
+    def __init__(
+        self,
+        evaluator: DSLEvaluator,
+        solver_builder: Callable[..., PBESolver] = NaivePBESolver,
+        splits: int = 4,
+        enumerator_builder: Callable[
+            [ProbUGrammar], ProgramEnumerator[None]
+        ] = enumerate_prob_u_grammar,
+        desired_ratio: float = 1.1,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(evaluator, solver_builder, **kwargs)
+        self.splits = splits
+        self.enumerator_builder = enumerator_builder
+        self.desired_ratio = desired_ratio
+
+    @classmethod
+    def name(cls) -> str:
+        return "parallel"
+
+    def _close_task_solving_(
+        self,
+        task: Task[PBE],
+        enumerator: ProgramEnumerator[None],
+        time_used: float,
+        solution: bool,
+        last_program: Optional[Program],
+    ) -> None:
+        # Programs were tested by the subsolvers of the processes
+        self._stats["time"] += time_used
+        self._stats["programs"] += self._programs
+        if last_program is not None:
+            self._stats["program_probability"] = enumerator.probability(last_program)
+        self.evaluator.release_inputs([ex.inputs for ex in task.specification.examples])
+
+    def solve(
+        self, task: Task[PBE], enumerator: ProgramEnumerator[None], timeout: float = 60
+    ) -> Generator[Program, bool, None]:
+        grammar = enumerator.G.grammar  # type: ignore
+        if self.splits <= 1 or (isinstance(grammar, CFG) and grammar.is_recursive()):
+            # Fragments of recursive grammars could not be enumerated
+            try:
+                yield from self.subsolver.solve(task, enumerator, timeout)
+            finally:
+                for name, val in self.subsolver._stats.items():
+                    self._stats[name] = val
+            return
+        with chrono.clock(f"solve.{self.name()}.{self.subsolver.name()}") as c:  # type: ignore
+            self._init_task_solving_(task, enumerator, timeout)
+            fragments, _ = split(
+                __as_u_grammar__(enumerator.G),  # type: ignore
+                self.splits,
+                self.desired_ratio,
+            )
+            context = multiprocessing.get_context("fork")
+            queue: Queue = context.Queue()
+            stop = context.Event()
+            processes = [
+                context.Process(
+                    target=self.__search_fragment__,
+                    args=(task, i, fragment, enumerator.filter, timeout, queue, stop),
+                    daemon=True,
+                )
+                for i, fragment in enumerate(fragments)
+            ]
+            for process in processes:
+                process.start()
+            reported: Set[int] = set()
+            solution = None
+            try:
+                while len(reported) < len(processes):
+                    kind, fragment, value = self.__next_message__(
+                        queue, processes, reported
+                    )
+                    if kind == "programs":
+                        self._programs += value
+                        reported.add(fragment)
+                    elif kind == "died":
+                        reported.add(fragment)
+                        raise RuntimeError(
+                            f"the process enumerating fragment {fragment} died with exit code {value}"
+                        )
+                    else:
+                        should_stop = yield value
+                        if should_stop:
+                            solution = value
+                            break
+            finally:
+                # Also reached when the caller stops iterating
+                stop.set()
+                while len(reported) < len(processes):
+                    kind, fragment, value = self.__next_message__(
+                        queue, processes, reported
+                    )
+                    if kind == "programs":
+                        self._programs += value
+                    if kind != "solution":
+                        reported.add(fragment)
+                for process in processes:
+                    process.join()
+                self._close_task_solving_(
+                    task, enumerator, c.elapsed_time(), solution is not None, solution
+                )
+
+    def __next_message__(
+        self, queue: Queue, processes: Sequence[BaseProcess], reported: Set[int]
+    ) -> Tuple[str, int, Any]:
+        """
+        Returns the next message sent by a process.
+        Returns ("died", fragment, exit code) if the process of a fragment that did not report exited without sending its last message.
+        """
+        while True:
+            try:
+                return queue.get(timeout=_POLL_INTERVAL)  # type: ignore
+            except Empty:
+                pass
+            for fragment, process in enumerate(processes):
+                if fragment not in reported and not process.is_alive():
+                    # The messages of a process are flushed before it exits normally
+                    try:
+                        return queue.get(timeout=_POLL_INTERVAL)  # type: ignore
+                    except Empty:
+                        return ("died", fragment, process.exitcode)
+
+    def __search_fragment__(
+        self,
+        task: Task[PBE],
+        index: int,
+        fragment: ProbUGrammar,
+        filter: Optional[Filter[Program]],
+        timeout: float,
+        queue: Queue,
+        stop: Event,
+    ) -> None:
+        """
+        Body of the process enumerating a fragment.
+        Sends ("solution", index, program) for each solution found and ("programs", index, number of programs tested) when done.
+        """
+        programs = 0
+        try:
+            with chrono.clock(f"solve.{self.name()}.fragment") as c:  # type: ignore
+                enumerator = self.enumerator_builder(fragment)
+                enumerator.filter = filter
+                for batch in enumerator.batches(self.subsolver.batch_size):
+                    if stop.is_set():
+                        break
+                    for program in batch:
+                        if c.elapsed_time() >= timeout:
+                            return
+                        programs += 1
+                        if self.subsolver._test_(task, program):
+                            queue.put(("solution", index, program))
+        finally:
+            queue.put(("programs", index, programs))
+
+
+def __as_u_grammar__(pcfg: Union[ProbDetGrammar, ProbUGrammar]) -> ProbUGrammar:
+    """
+    Returns the given grammar as a ProbUGrammar, deterministic grammars must be based on a CFG.
+    """
+    if isinstance(pcfg, ProbUGrammar):
+        return pcfg
+    cfg = pcfg.grammar
+    assert isinstance(
+        cfg, CFG
+    ), f"cannot split a deterministic grammar that is not a CFG: {type(cfg)}"
+    # UCFG.from_CFG drops the information part of the states of the CFG
+    probabilities = {
+        (S[0], S[1][0]): {
+            P: {tuple(cfg.rules[S][P][0]): pcfg.probabilities[S][P]}
+            for P in cfg.rules[S]
+        }
+        for S in cfg.rules
+    }
+    return ProbUGrammar(
+        UCFG.from_CFG(cfg), probabilities, {(cfg.start[0], cfg.start[1][0]): 1.0}
+    )
@@ -10,8 +10,17 @@ from synth.utils import chrono
 
 
 class PBESolver(ABC):
-    def __init__(self, evaluator: DSLEvaluator, **kwargs: Any) -> None:
+    """
+    Parameters:
+    -----------
+    - batch_size: programs are enumerated by batches of this size (see ProgramEnumerator.batches)
+    """
+
+    def __init__(
+        self, evaluator: DSLEvaluator, batch_size: int = 100, **kwargs: Any
+    ) -> None:
         self.evaluator = evaluator
+        self.batch_size = batch_size
         self._stats: Dict[str, Any] = {}
         self._init_stats_()
 
@@ -57,6 +66,9 @@ class PBESolver(ABC):
         self, task: Task[PBE], enumerator: ProgramEnumerator[None], timeout: float = 60
     ) -> None:
         self._programs = 0
+        self.evaluator.register_inputs(
+            [ex.inputs for ex in task.specification.examples]
+        )
 
     def _close_task_solving_(
         self,
@@ -64,43 +76,55 @@ class PBESolver(ABC):
         enumerator: ProgramEnumerator[None],
         time_used: float,
         solution: bool,
-        last_program: Program,
+        last_program: Optional[Program],
     ) -> None:
         self._stats["time"] += time_used
-        self._stats["program_probability"] = enumerator.probability(last_program)
+        if last_program is not None:
+            self._stats["program_probability"] = enumerator.probability(last_program)
         self._stats["programs"] += self._programs
+        self.evaluator.release_inputs([ex.inputs for ex in task.specification.examples])
 
     def solve(
         self, task: Task[PBE], enumerator: ProgramEnumerator[None], timeout: float = 60
     ) -> Generator[Program, bool, None]:
         """
         Solve the given task by enumerating programs with the given enumerator.
-        When the timeout is reached, this function returns.
+        When the timeout is reached or all programs were enumerated, this function returns.
         When a program that satisfies the task has been found, yield it.
         The calling function should then send True if and only if it accepts the solution.
         If False is sent the search continues.
         """
         with chrono.clock(f"solve.{self.name()}") as c:  # type: ignore
             self._init_task_solving_(task, enumerator, timeout)
+            # Last tested program
+            program: Optional[Program] = None
             try:
-                for program in enumerator:
-                    time = c.elapsed_time()
-                    if time >= timeout:
-                        self._close_task_solving_(
-                            task, enumerator, time, False, program
-                        )
-                        return
-                    self._programs += 1
-                    if self._test_(task, program):
-                        should_stop = yield program
-                        if should_stop:
+                for batch in enumerator.batches(self.batch_size):
+                    for next_program in batch:
+                        time = c.elapsed_time()
+                        if time >= timeout:
                             self._close_task_solving_(
-                                task, enumerator, time, True, program
+                                task, enumerator, time, False, program
                             )
                             return
+                        program = next_program
+                        self._programs += 1
+                        if self._test_(task, program):
+                            should_stop = yield program
+                            if should_stop:
+                                self._close_task_solving_(
+                                    task, enumerator, c.elapsed_time(), True, program
+                                )
+                                return
             except StopIteration as e:
-                self._close_task_solving_(task, enumerator, time, False, program)
+                self._close_task_solving_(
+                    task, enumerator, c.elapsed_time(), False, program
+                )
                 raise e
+            # All programs were enumerated
+            self._close_task_solving_(
+                task, enumerator, c.elapsed_time(), False, program
+            )
 
     def _test_(self, task: Task[PBE], program: Program) -> bool:
         """
@@ -110,15 +134,11 @@ class PBESolver(ABC):
         POSTCOND:
             0 <= self._score <= 1
         """
-        failed = False
-        success = 0
-        for ex in task.specification.examples:
-            if self.evaluator.eval(program, ex.inputs) != ex.output:
-                failed = True
-            else:
-                success += 1
-        self._score = success / len(task.specification.examples)
-        return not failed
+        examples = task.specification.examples
+        outputs = self.evaluator.eval_batch(program, [ex.inputs for ex in examples])
+        success = sum(1 for out, ex in zip(outputs, examples) if out == ex.output)
+        self._score = success / len(examples)
+        return success == len(examples)
 
 
 class NaivePBESolver(PBESolver):
@@ -173,7 +193,7 @@ class MetaPBESolver(PBESolver, ABC):
         enumerator: ProgramEnumerator[None],
         time_used: float,
         solution: bool,
-        last_program: Program,
+        last_program: Optional[Program],
     ) -> None:
         self.subsolver._close_task_solving_(
             task, enumerator, time_used, solution, last_program
@@ -198,11 +218,15 @@ class CutoffPBESolver(PBESolver):
         return "cutoff"
 
     def _test_(self, task: Task[PBE], program: Program) -> bool:
-        n = 0
-        for ex in task.specification.examples:
-            if self.evaluator.eval(program, ex.inputs) != ex.output:
-                self._score = n / len(task.specification.examples)
+        examples = task.specification.examples
+        # Most programs fail on the first example, the other ones are evaluated together
+        if self.evaluator.eval(program, examples[0].inputs) != examples[0].output:
+            self._score = 0
+            return False
+        outputs = self.evaluator.eval_batch(program, [ex.inputs for ex in examples[1:]])
+        for n, (out, ex) in enumerate(zip(outputs, examples[1:])):
+            if out != ex.output:
+                self._score = (n + 1) / len(examples)
                 return False
-            n += 1
         self._score = 1
         return True
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Generator, List, Tuple
+from typing import Any, Callable, Generator, List, Optional, Tuple
 from synth.semantic.evaluator import DSLEvaluator
 
 
@@ -52,7 +52,7 @@ class RestartPBESolver(MetaPBESolver):
         enumerator: ProgramEnumerator[None],
         time_used: float,
         solution: bool,
-        last_program: Program,
+        last_program: Optional[Program],
     ) -> None:
         super()._close_task_solving_(
             task, enumerator, time_used, solution, last_program
@@ -111,5 +111,8 @@ class RestartPBESolver(MetaPBESolver):
         if self.uniform_prior > 0:
             pcfg = pcfg + (pcfg.uniform(pcfg.grammar) * self.uniform_prior)
         pcfg.normalise()
+        # Reuse the work already done by the enumerator when it supports it
+        if enumerator.update_probabilities(pcfg):
+            return enumerator
         new_enumerator = enumerator.clone(pcfg)
         return new_enumerator
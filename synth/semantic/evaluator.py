@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Set
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
 
 from synth.syntax.program import Constant, Function, Primitive, Program, Variable
 
@@ -9,6 +11,25 @@ class Evaluator(ABC):
     def eval(self, program: Program, input: Any) -> Any:
         pass
 
+    def eval_batch(self, program: Program, inputs_list: List[Any]) -> List[Any]:
+        """
+        Evaluate the program on each of the given inputs and return the list of outputs.
+        """
+        return [self.eval(program, input) for input in inputs_list]
+
+    def register_inputs(self, inputs_list: List[Any]) -> Optional[List[int]]:
+        """
+        Register inputs that are going to be evaluated many times, until they are released with release_inputs().
+        Evaluators may use it to evaluate them faster, by default it does nothing.
+        """
+        return None
+
+    def release_inputs(self, inputs_list: List[Any]) -> None:
+        """
+        Release inputs registered with register_inputs(), by default it does nothing.
+        """
+        pass
+
     @abstractmethod
     def clear_cache(self) -> None:
         """
@@ -17,6 +38,9 @@ class Evaluator(ABC):
         pass
 
 
+_MISSING = object()
+
+
 def __tuplify__(element: Any) -> Any:
     if isinstance(element, List):
         return tuple(__tuplify__(x) for x in element)
@@ -25,54 +49,422 @@ def __tuplify__(element: Any) -> Any:
 
 
 class DSLEvaluator(Evaluator):
-    def __init__(self, semantics: Dict[Primitive, Any], use_cache: bool = True) -> None:
+    """
+    Evaluates programs using the given semantics.
+
+    Parameters:
+    -----------
+    - semantics: the semantic of each primitive
+    - use_cache: cache the evaluation of all subprograms for each input
+    - use_compilation: compile each program once into a Python closure and call it on each input instead of walking the program tree at every call
+    - cache_size: if not None, the maximum number of evaluations kept in the cache, the least recently used ones are evicted first
+    - compiled_cache_size: if not None, the maximum number of compiled programs kept, the least recently used ones are evicted first
+    - vectorized_semantics: optional vectorized semantic of some primitives used by eval_batch, see register_vectorized_semantics()
+    """
+
+    def __init__(
+        self,
+        semantics: Dict[Primitive, Any],
+        use_cache: bool = True,
+        use_compilation: bool = False,
+        cache_size: Optional[int] = None,
+        vectorized_semantics: Optional[Dict[Primitive, Callable]] = None,
+        compiled_cache_size: Optional[int] = 100000,
+    ) -> None:
         super().__init__()
         self.semantics = semantics
         self.use_cache = use_cache
+        self.use_compilation = use_compilation
+        self.cache_size = cache_size
+        self.compiled_cache_size = compiled_cache_size
+        self.vectorized_semantics: Dict[Primitive, Callable] = {}
+        if vectorized_semantics is not None:
+            self.register_vectorized_semantics(vectorized_semantics)
+        # cache key of an input -> program -> output
         self._cache: Dict[Any, Dict[Program, Any]] = {}
+        # (cache key, program) of the evaluations in the cache from the least to the most recently used, only if cache_size is not None
+        self._lru: "OrderedDict[Tuple[Any, Program], None]" = OrderedDict()
         self._cons_cache: Dict[Any, Dict[Program, Any]] = {}
+        # from the least to the most recently used
+        self._compiled: "OrderedDict[Program, Callable[[List], Any]]" = OrderedDict()
+        # id(input) -> (input, example id)
+        self._registered: Dict[int, Tuple[List, int]] = {}
+        # tuplified input -> example id
+        self._example_ids: Dict[Any, int] = {}
         self.skip_exceptions: Set[Exception] = set()
         # Statistics
         self._total_requests = 0
         self._cache_hits = 0
+        self._cache_evictions = 0
+        self._compiled_requests = 0
+        self._compiled_hits = 0
+
+    def register_inputs(self, inputs_list: List[List]) -> List[int]:
+        """
+        Register inputs that are going to be evaluated many times and return their example ids.
+        Equal inputs get the same example id.
+
+        The example id of a registered input is directly used as its cache key,
+        which avoids converting and hashing the whole input at each evaluation.
+        A registered input is recognised by its identity, thus it must not be modified while registered.
+        Registrations are dropped by release_inputs() and clear_cache().
+        """
+        ids = []
+        for input in inputs_list:
+            key = __tuplify__(input)
+            example_id = self._example_ids.get(key)
+            if example_id is None:
+                example_id = len(self._example_ids)
+                self._example_ids[key] = example_id
+            # Keeping a reference to input guarantees that its id is not reused
+            self._registered[id(input)] = (input, example_id)
+            ids.append(example_id)
+        return ids
+
+    def release_inputs(self, inputs_list: List[List]) -> None:
+        """
+        Release registered inputs so that they are no longer kept alive by this evaluator.
+        Their example ids and cached evaluations are kept until clear_cache().
+        """
+        for input in inputs_list:
+            self._registered.pop(id(input), None)
+
+    def register_vectorized_semantics(
+        self, vectorized_semantics: Dict[Primitive, Callable]
+    ) -> None:
+        """
+        Register vectorized semantics that eval_batch uses to evaluate a primitive on all inputs at once.
+
+        The vectorized semantic of a primitive with k arguments is a k-ary (not curried) function,
+        its i-th argument is the column of the values of the i-th argument of the primitive, one value per input.
+        A column is a list or any object with a tolist() method, such as a NumPy array,
+        see synth.semantic.vectorized for helpers.
+        It returns the column of outputs, or None when it cannot handle its arguments,
+        in which case the scalar semantic is used on each input instead.
+        It is only used when the primitive is applied to all of its arguments.
+        """
+        self.vectorized_semantics.update(vectorized_semantics)
+
+    def __evaluations_for__(self, input: List) -> Tuple[Any, Dict[Program, Any]]:
+        """
+        Returns the cache key of input and its cached evaluations.
+        """
+        if not self.use_cache:
+            return None, {}
+        registered = self._registered.get(id(input))
+        if registered is not None:
+            key = registered[1]
+        else:
+            key = __tuplify__(input)
+            if self._example_ids:
+                key = self._example_ids.get(key, key)
+        evaluations = self._cache.get(key)
+        if evaluations is None:
+            evaluations = {}
+            self._cache[key] = evaluations
+        return key, evaluations
+
+    def __use__(self, key: Any, program: Program) -> None:
+        """
+        Mark the evaluation of program on the input with the given cache key as the most recently used one.
+        """
+        entry = (key, program)
+        try:
+            self._lru.move_to_end(entry)
+        except KeyError:
+            self._lru[entry] = None
+
+    def __evict__(self) -> None:
+        """
+        Evict the least recently used evaluations while the cache is over budget.
+        """
+        while len(self._lru) > self.cache_size:  # type: ignore
+            key, program = self._lru.popitem(last=False)[0]
+            evaluations = self._cache[key]
+            del evaluations[program]
+            if len(evaluations) == 0:
+                del self._cache[key]
+            self._cache_evictions += 1
 
     def eval(self, program: Program, input: List) -> Any:
-        key = __tuplify__(input)
-        if self.use_cache and key not in self._cache:
-            self._cache[key] = {}
-        evaluations: Dict[Program, Any] = self._cache[key] if self.use_cache else {}
+        key, evaluations = self.__evaluations_for__(input)
+        bounded = self.use_cache and self.cache_size is not None
         if program in evaluations:
+            self._total_requests += 1
+            self._cache_hits += 1
+            if bounded:
+                self.__use__(key, program)
             return evaluations[program]
         try:
-            for sub_prog in program.depth_first_iter():
-                self._total_requests += 1
-                if sub_prog in evaluations:
-                    self._cache_hits += 1
-                    continue
-                if isinstance(sub_prog, Primitive):
-                    evaluations[sub_prog] = self.semantics[sub_prog]
-                elif isinstance(sub_prog, Variable):
-                    evaluations[sub_prog] = input[sub_prog.variable]
-                elif isinstance(sub_prog, Constant):
-                    evaluations[sub_prog] = sub_prog.value
-                elif isinstance(sub_prog, Function):
-                    fun = evaluations[sub_prog.function]
-                    for arg in sub_prog.arguments:
-                        fun = fun(evaluations[arg])
-                    evaluations[sub_prog] = fun
+            out = self.__eval__(program, input, key, evaluations, bounded)
         except Exception as e:
             if type(e) in self.skip_exceptions:
                 evaluations[program] = None
-                return None
+                if bounded:
+                    self.__use__(key, program)
+                out = None
             else:
                 raise e
+        finally:
+            if bounded:
+                self.__evict__()
+        return out
 
+    def __eval__(
+        self,
+        program: Program,
+        input: List,
+        key: Any,
+        evaluations: Dict[Program, Any],
+        bounded: bool,
+    ) -> Any:
+        if self.use_compilation:
+            self._total_requests += 1
+            evaluations[program] = self.compile(program)(input)
+            if bounded:
+                self.__use__(key, program)
+            return evaluations[program]
+        for sub_prog in program.depth_first_iter():
+            self._total_requests += 1
+            if sub_prog in evaluations:
+                self._cache_hits += 1
+                if bounded:
+                    self.__use__(key, sub_prog)
+                continue
+            if isinstance(sub_prog, Primitive):
+                evaluations[sub_prog] = self.semantics[sub_prog]
+            elif isinstance(sub_prog, Variable):
+                evaluations[sub_prog] = input[sub_prog.variable]
+            elif isinstance(sub_prog, Constant):
+                evaluations[sub_prog] = sub_prog.value
+            elif isinstance(sub_prog, Function):
+                fun = evaluations[sub_prog.function]
+                for arg in sub_prog.arguments:
+                    fun = fun(evaluations[arg])
+                evaluations[sub_prog] = fun
+            if bounded:
+                self.__use__(key, sub_prog)
         return evaluations[program]
 
+    def eval_batch(self, program: Program, inputs_list: List[Any]) -> List[Any]:
+        """
+        Evaluate the program on each of the given inputs and return the list of outputs.
+        The program is traversed only once: each subprogram is evaluated on all inputs at once.
+        """
+        if self.use_compilation or len(inputs_list) == 0:
+            return [self.eval(program, input) for input in inputs_list]
+        keys, all_evaluations = zip(
+            *[self.__evaluations_for__(input) for input in inputs_list]
+        )
+        bounded = self.use_cache and self.cache_size is not None
+        cached = [evaluations.get(program, _MISSING) for evaluations in all_evaluations]
+        if all(out is not _MISSING for out in cached):
+            self._total_requests += len(cached)
+            self._cache_hits += len(cached)
+            if bounded:
+                for key in keys:
+                    self.__use__(key, program)
+            return cached
+        try:
+            return self.__eval_batch__(program, inputs_list, keys, all_evaluations)
+        finally:
+            if bounded:
+                self.__evict__()
+
+    def __eval_batch__(
+        self,
+        program: Program,
+        inputs_list: List[Any],
+        keys: Sequence[Any],
+        all_evaluations: Sequence[Dict[Program, Any]],
+    ) -> List[Any]:
+        bounded = self.use_cache and self.cache_size is not None
+        # failed[i] is True iff an exception to skip occured on the i-th input
+        failed = [False] * len(inputs_list)
+        columns: Dict[Program, List[Any]] = {}
+        for sub_prog in program.depth_first_iter():
+            if sub_prog in columns:
+                continue
+            self._total_requests += len(inputs_list)
+            if isinstance(sub_prog, Primitive):
+                columns[sub_prog] = [self.semantics[sub_prog]] * len(inputs_list)
+            elif isinstance(sub_prog, Variable):
+                columns[sub_prog] = [input[sub_prog.variable] for input in inputs_list]
+            elif isinstance(sub_prog, Constant):
+                columns[sub_prog] = [sub_prog.value] * len(inputs_list)
+            elif isinstance(sub_prog, Function):
+                vectorized = self.__eval_vectorized__(
+                    sub_prog, columns, keys, all_evaluations, failed
+                )
+                if vectorized is not None:
+                    columns[sub_prog] = vectorized
+                    continue
+                functions = columns[sub_prog.function]
+                arguments = [
+                    self.__as_list__(columns, arg) for arg in sub_prog.arguments
+                ]
+                column = []
+                for i, evaluations in enumerate(all_evaluations):
+                    fun = evaluations.get(sub_prog, _MISSING)
+                    if fun is not _MISSING:
+                        self._cache_hits += 1
+                        if bounded:
+                            self.__use__(keys[i], sub_prog)
+                    elif failed[i]:
+                        fun = None
+                    else:
+                        try:
+                            fun = functions[i]
+                            for arg in arguments:
+                                fun = fun(arg[i])
+                            evaluations[sub_prog] = fun
+                            if bounded:
+                                self.__use__(keys[i], sub_prog)
+                        except Exception as e:
+                            if type(e) in self.skip_exceptions:
+                                failed[i] = True
+                                fun = None
+                            else:
+                                raise e
+                    column.append(fun)
+                columns[sub_prog] = column
+        if isinstance(columns[program], list):
+            outputs = columns[program]
+        else:
+            outputs = self.__as_list__(columns, program)
+            for key, evaluations, out in zip(keys, all_evaluations, outputs):
+                evaluations[program] = out
+                if bounded:
+                    self.__use__(key, program)
+        for i, evaluations in enumerate(all_evaluations):
+            if failed[i]:
+                outputs[i] = None
+                evaluations[program] = None
+                if bounded:
+                    self.__use__(keys[i], program)
+        return outputs
+
+    def __eval_vectorized__(
+        self,
+        program: Function,
+        columns: Dict[Program, Any],
+        keys: Sequence[Any],
+        all_evaluations: Sequence[Dict[Program, Any]],
+        failed: List[bool],
+    ) -> Any:
+        """
+        Returns the column of outputs of program computed by its vectorized semantic or None if it cannot be used.
+        """
+        head = program.function
+        if not isinstance(head, Primitive):
+            return None
+        vectorized = self.vectorized_semantics.get(head)
+        if (
+            vectorized is None
+            or len(program.arguments) != len(head.type.arguments())
+            or any(failed)
+        ):
+            return None
+        if self.use_cache:
+            cached = [
+                evaluations.get(program, _MISSING) for evaluations in all_evaluations
+            ]
+            if all(out is not _MISSING for out in cached):
+                self._cache_hits += len(cached)
+                if self.cache_size is not None:
+                    for key in keys:
+                        self.__use__(key, program)
+                return cached
+        try:
+            return vectorized(*[columns[arg] for arg in program.arguments])
+        except Exception:
+            # The scalar semantic decides what happens
+            return None
+
+    def __as_list__(self, columns: Dict[Program, Any], program: Program) -> List:
+        """
+        Returns the column of program as a list, converting it in place if it was computed by a vectorized semantic.
+        """
+        column = columns[program]
+        if not isinstance(column, list):
+            column = column.tolist()
+            columns[program] = column
+        return column  # type: ignore
+
+    def compile(self, program: Program) -> Callable[[List], Any]:
+        """
+        Compile the given program into a function that takes the list of inputs and returns the output of the program.
+        Compiled subprograms are memoized, so compiling a program whose subprograms were already compiled only costs its root.
+        """
+        self._compiled_requests += 1
+        compiled = self._compiled.get(program)
+        if compiled is None:
+            compiled = self.__compile__(program)
+            self._compiled[program] = compiled
+            if (
+                self.compiled_cache_size is not None
+                and len(self._compiled) > self.compiled_cache_size
+            ):
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled_hits += 1
+            self._compiled.move_to_end(program)
+        return compiled
+
+    def __compile__(self, program: Program) -> Callable[[List], Any]:
+        if isinstance(program, Primitive):
+            value = self.semantics[program]
+            return lambda input: value
+        elif isinstance(program, Variable):
+            return itemgetter(program.variable)
+        elif isinstance(program, Constant):
+            # The value is read at call time since a constant can be assigned later on
+            return lambda input: program.value
+        elif isinstance(program, Function):
+            args = [self.compile(arg) for arg in program.arguments]
+            if isinstance(program.function, Primitive):
+                f = self.semantics[program.function]
+                if len(args) == 1:
+                    a0 = args[0]
+                    return lambda input: f(a0(input))
+                elif len(args) == 2:
+                    a0, a1 = args
+                    return lambda input: f(a0(input))(a1(input))
+                elif len(args) == 3:
+                    a0, a1, a2 = args
+                    return lambda input: f(a0(input))(a1(input))(a2(input))
+                head = lambda input: f
+            else:
+                head = self.compile(program.function)
+
+            def call(input: List) -> Any:
+                fun = head(input)
+                for arg in args:
+                    fun = fun(arg(input))
+                return fun
+
+            return call
+        assert False, "Not implemented"
+
     def clear_cache(self) -> None:
         self._cache = {}
+        self._lru = OrderedDict()
         self._cons_cache = {}
+        self._compiled = OrderedDict()
+        self._registered = {}
+        self._example_ids = {}
 
     @property
     def cache_hit_rate(self) -> float:
         return self._cache_hits / self._total_requests
+
+    @property
+    def cache_evictions(self) -> int:
+        """
+        Number of evaluations evicted from the cache because it was full.
+        """
+        return self._cache_evictions
+
+    @property
+    def compiled_hit_rate(self) -> float:
+        return self._compiled_hits / self._compiled_requests
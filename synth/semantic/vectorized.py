@@ -0,0 +1,265 @@
+"""
+Helpers to write vectorized semantics of list and integer primitives with NumPy.
+
+A vectorized semantic takes one column per argument, a column holds the values of this argument for all inputs evaluated at once,
+and returns the column of outputs or None to fall back to the scalar semantic (see DSLEvaluator.register_vectorized_semantics).
+Columns of integers are 1D arrays and columns of lists of integers are PaddedLists.
+All helpers return None when their arguments are not integers or lists of integers,
+or when a value could leave [-INT_BOUND, INT_BOUND] since NumPy silently overflows where Python does not.
+The latter is checked before computing anything with the growth functions, which bound the absolute value of the outputs.
+"""
+
+from typing import Callable, List, Optional, Union
+
+import numpy as np
+
+INT_BOUND = 2**62 - 1
+
+
+class PaddedLists:
+    """
+    Column of lists of integers, one list per input, stored as a 2D array padded with zeros.
+
+    Parameters:
+    -----------
+    - values: array of shape (number of inputs, max length)
+    - lengths: array of shape (number of inputs,) with the length of each list
+    """
+
+    __slots__ = ("values", "lengths")
+
+    def __init__(self, values: np.ndarray, lengths: np.ndarray) -> None:
+        self.values = values
+        self.lengths = lengths
+
+    @classmethod
+    def from_lists(cls, lists: List[List[int]]) -> Optional["PaddedLists"]:
+        """
+        Returns the padded representation of the given lists or None if one of them is not a list or has an element out of the bounds.
+        """
+        if any(type(l) != list for l in lists):
+            return None
+        lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        width = int(lengths.max()) if len(lists) > 0 else 0
+        values = np.zeros((len(lists), width), dtype=np.int64)
+        flat = [x for l in lists for x in l]
+        if flat:
+            # Elements are integers since the type of the primitive says so
+            try:
+                array = np.fromiter(flat, dtype=np.int64, count=len(flat))
+            except (OverflowError, TypeError):
+                return None
+            if array.max() > INT_BOUND or array.min() < -INT_BOUND:
+                return None
+            # Row-major order of the mask matches the order of flat
+            values[np.arange(width) < lengths[:, None]] = array
+        return cls(values, lengths)
+
+    def mask(self) -> np.ndarray:
+        """
+        Boolean array of the same shape as values, True iff the value is part of a list.
+        """
+        return np.arange(self.values.shape[1]) < self.lengths[:, None]
+
+    def max_abs(self) -> int:
+        """
+        Maximum absolute value of the elements of the lists.
+        """
+        if self.values.size == 0:
+            return 0
+        return int(np.abs(self.values).max())
+
+    def tolist(self) -> List[List[int]]:
+        return [row[:n] for row, n in zip(self.values.tolist(), self.lengths.tolist())]
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __repr__(self) -> str:
+        return f"PaddedLists({self.tolist()})"
+
+
+def as_padded(column: Union[List, PaddedLists]) -> Optional[PaddedLists]:
+    """
+    Returns the column as PaddedLists or None if it is not possible.
+    """
+    if isinstance(column, PaddedLists):
+        return column
+    return PaddedLists.from_lists(column)
+
+
+def as_array(column: Union[List, np.ndarray]) -> Optional[np.ndarray]:
+    """
+    Returns the column of integers as a 1D array or None if it is not possible.
+    """
+    if isinstance(column, np.ndarray):
+        return column
+    if any(type(x) != int or abs(x) > INT_BOUND for x in column):
+        return None
+    return np.asarray(column, dtype=np.int64)
+
+
+def __padded__(values: np.ndarray, lengths: np.ndarray) -> PaddedLists:
+    # Values are in the bounds thanks to the growth functions, only the padding needs to be reset
+    mask = np.arange(values.shape[1]) < lengths[:, None]
+    return PaddedLists(np.where(mask, values, 0), lengths)
+
+
+def vmap(
+    f: Callable[[np.ndarray], np.ndarray], growth: Callable[[int], int] = lambda m: m
+) -> Callable[[Union[List, PaddedLists]], Optional[PaddedLists]]:
+    """
+    Vectorized semantic of a map over lists of integers.
+
+    Parameters:
+    -----------
+    - f: elementwise function on arrays of integers
+    - growth: given the maximum absolute value of the inputs, an upper bound on the absolute value of the outputs of f, used to avoid overflows
+    """
+
+    def aux(column: Union[List, PaddedLists]) -> Optional[PaddedLists]:
+        lists = as_padded(column)
+        if lists is None or growth(lists.max_abs()) > INT_BOUND:
+            return None
+        return __padded__(f(lists.values), lists.lengths)
+
+    return aux
+
+
+def vfilter(
+    predicate: Callable[[np.ndarray], np.ndarray],
+) -> Callable[[Union[List, PaddedLists]], Optional[PaddedLists]]:
+    """
+    Vectorized semantic of a filter over lists of integers, predicate is an elementwise function on arrays returning booleans.
+    """
+
+    def aux(column: Union[List, PaddedLists]) -> Optional[PaddedLists]:
+        lists = as_padded(column)
+        if lists is None:
+            return None
+        keep = predicate(lists.values) & lists.mask()
+        # Stable sort moves kept elements to the front while preserving their order
+        order = np.argsort(~keep, axis=1, kind="stable")
+        values = np.take_along_axis(lists.values, order, axis=1)
+        return __padded__(values, keep.sum(axis=1))
+
+    return aux
+
+
+def vcount(
+    predicate: Callable[[np.ndarray], np.ndarray],
+) -> Callable[[Union[List, PaddedLists]], Optional[np.ndarray]]:
+    """
+    Vectorized semantic of the number of elements of a list of integers that satisfy predicate.
+    """
+
+    def aux(column: Union[List, PaddedLists]) -> Optional[np.ndarray]:
+        lists = as_padded(column)
+        if lists is None:
+            return None
+        return (predicate(lists.values) & lists.mask()).sum(axis=1)  # type: ignore
+
+    return aux
+
+
+def vzipwith(
+    f: Callable[[np.ndarray, np.ndarray], np.ndarray],
+    growth: Callable[[int, int], int] = lambda m1, m2: m1 + m2,
+) -> Callable[
+    [Union[List, PaddedLists], Union[List, PaddedLists]], Optional[PaddedLists]
+]:
+    """
+    Vectorized semantic of zipping two lists of integers with f, the output is as long as the shortest list.
+
+    Parameters:
+    -----------
+    - f: elementwise binary function on arrays of integers
+    - growth: given the maximum absolute values of both inputs, an upper bound on the absolute value of the outputs of f
+    """
+
+    def aux(
+        column1: Union[List, PaddedLists], column2: Union[List, PaddedLists]
+    ) -> Optional[PaddedLists]:
+        l1 = as_padded(column1)
+        l2 = as_padded(column2)
+        if l1 is None or l2 is None or growth(l1.max_abs(), l2.max_abs()) > INT_BOUND:
+            return None
+        width = min(l1.values.shape[1], l2.values.shape[1])
+        values = f(l1.values[:, :width], l2.values[:, :width])
+        return __padded__(values, np.minimum(l1.lengths, l2.lengths))
+
+    return aux
+
+
+def vscanl(
+    accumulate: Callable[[np.ndarray], np.ndarray],
+    growth: Callable[[int, int], int] = lambda m, n: m * n,
+) -> Callable[[Union[List, PaddedLists]], Optional[PaddedLists]]:
+    """
+    Vectorized semantic of a scanl1 over lists of integers.
+
+    Parameters:
+    -----------
+    - accumulate: computes the scan along the rows of a 2D array, for example lambda v: np.cumsum(v, axis=1)
+    - growth: given the maximum absolute value and the maximum length of the inputs, an upper bound on the absolute value of the outputs
+    """
+
+    def aux(column: Union[List, PaddedLists]) -> Optional[PaddedLists]:
+        lists = as_padded(column)
+        if lists is None or growth(lists.max_abs(), lists.values.shape[1]) > INT_BOUND:
+            return None
+        # Padding is after the elements of each list so it does not change the scan of the elements
+        return __padded__(accumulate(lists.values), lists.lengths)
+
+    return aux
+
+
+def vreduce(
+    reduce: Callable[[np.ndarray, np.ndarray], np.ndarray],
+    growth: Callable[[int, int], int] = lambda m, n: m,
+    allow_empty: bool = True,
+) -> Callable[[Union[List, PaddedLists]], Optional[np.ndarray]]:
+    """
+    Vectorized semantic of a function from lists of integers to integers.
+
+    Parameters:
+    -----------
+    - reduce: given the padded values and the mask, computes the output for each row
+    - growth: given the maximum absolute value and the maximum length of the inputs, an upper bound on the absolute value of the outputs
+    - allow_empty: if False, falls back to the scalar semantic as soon as one list is empty
+    """
+
+    def aux(column: Union[List, PaddedLists]) -> Optional[np.ndarray]:
+        lists = as_padded(column)
+        if (
+            lists is None
+            or growth(lists.max_abs(), lists.values.shape[1]) > INT_BOUND
+            or (not allow_empty and (lists.lengths == 0).any())
+        ):
+            return None
+        return reduce(lists.values, lists.mask())
+
+    return aux
+
+
+def vreverse(column: Union[List, PaddedLists]) -> Optional[PaddedLists]:
+    """
+    Vectorized semantic of reversing lists of integers.
+    """
+    lists = as_padded(column)
+    if lists is None:
+        return None
+    index = np.maximum(lists.lengths[:, None] - 1 - np.arange(lists.values.shape[1]), 0)
+    return __padded__(np.take_along_axis(lists.values, index, axis=1), lists.lengths)
+
+
+def vsort(column: Union[List, PaddedLists]) -> Optional[PaddedLists]:
+    """
+    Vectorized semantic of sorting lists of integers.
+    """
+    lists = as_padded(column)
+    if lists is None:
+        return None
+    # Padding is sent to the end of each row
+    values = np.sort(np.where(lists.mask(), lists.values, INT_BOUND + 1), axis=1)
+    return __padded__(values, lists.lengths)
@@ -30,7 +30,7 @@ from synth.syntax.type_system import (
     STRING,
     UNIT,
 )
-from synth.syntax.automata import DFA, DFTA
+from synth.syntax.automata import DFA, DFTA, CompiledDFTA
 from synth.syntax.grammars import (
     CFG,
     UCFG,
@@ -49,6 +49,7 @@ from synth.syntax.grammars import (
     hs_enumerate_prob_u_grammar,
     hs_enumerate_bucket_prob_grammar,
     hs_enumerate_bucket_prob_u_grammar,
+    hs_enumerate_cost_prob_grammar,
     cd_enumerate_prob_grammar,
     split,
 )
@@ -1,2 +1,2 @@
 from synth.syntax.automata.dfa import DFA
-from synth.syntax.automata.tree_automaton import DFTA
+from synth.syntax.automata.tree_automaton import DFTA, CompiledDFTA
@@ -3,6 +3,7 @@ from itertools import product
 from typing import (
     Callable,
     Dict,
+    FrozenSet,
     Generic,
     List,
     Literal,
@@ -130,29 +131,99 @@ class DFTA(Generic[U, V]):
         self.__remove_unreachable__()
         self.__remove_unproductive__()
 
+    def __encode__(
+        self,
+    ) -> Tuple[
+        List[U], List[Tuple[V, Tuple[int, ...], int]], List[List[Tuple[int, int]]]
+    ]:
+        """
+        Number the states so that they are hashed only once.
+        Returns the states, the rules on state ids and for each state id the (rule index, position) that consume it.
+        """
+        ids: Dict[U, int] = {}
+        states: List[U] = []
+
+        def get_id(q: U) -> int:
+            i = ids.get(q)
+            if i is None:
+                i = len(states)
+                ids[q] = i
+                states.append(q)
+            return i
+
+        rules = [
+            (letter, tuple(map(get_id, args)), get_id(dst))
+            for (letter, args), dst in self.rules.items()
+        ]
+        consumers: List[List[Tuple[int, int]]] = [[] for _ in states]
+        for r, (_, args, __) in enumerate(rules):
+            for k, arg in enumerate(args):
+                consumers[arg].append((r, k))
+        return states, rules, consumers
+
     def read_product(self, other: "DFTA[W, V]") -> "DFTA[Tuple[U, W], V]":
         """
-        Read self and other
+        Read self and other.
+
+        Only the pairs of states reachable from the leaves are built:
+        each new pair (p, q) only looks at the rules of self consuming p
+        and at the rules of other with the same letter consuming q at the same position.
         """
+        s_states, s_rules, s_consumers = self.__encode__()
+        o_states, o_rules, o_consumers = other.__encode__()
+        # (letter, arity, position, state of other) -> rules of other
+        index: Dict[Tuple[V, int, int, int], List[int]] = defaultdict(list)
+        for q, consumers in enumerate(o_consumers):
+            for r, k in consumers:
+                letter, args, _ = o_rules[r]
+                index[(letter, len(args), k, q)].append(r)
+        pair_rules: Dict[
+            Tuple[V, Tuple[Tuple[int, int], ...]],
+            Tuple[int, int],
+        ] = {}
+        reached: Set[Tuple[int, int]] = set()
+        queue: List[Tuple[int, int]] = []
+
+        def add(
+            letter: V, args: Tuple[Tuple[int, int], ...], dst: Tuple[int, int]
+        ) -> None:
+            pair_rules[(letter, args)] = dst
+            if dst not in reached:
+                reached.add(dst)
+                queue.append(dst)
+
+        # Leaves
+        o_leaves = {letter: dst for letter, args, dst in o_rules if len(args) == 0}
+        for letter, args1, dst1 in s_rules:
+            if len(args1) == 0 and letter in o_leaves:
+                add(letter, (), (dst1, o_leaves[letter]))
+        # Propagate upward
+        while queue:
+            p, q = queue.pop()
+            for r1, k in s_consumers[p]:
+                letter, args1, dst1 = s_rules[r1]
+                for r2 in index.get((letter, len(args1), k, q), []):
+                    _, args2, dst2 = o_rules[r2]
+                    new_args = tuple(zip(args1, args2))
+                    if all(arg in reached for arg in new_args):
+                        add(letter, new_args, (dst1, dst2))
+        # Decode states
+        decoded = {(p, q): (s_states[p], o_states[q]) for p, q in reached}
         rules: Dict[
             Tuple[
                 V,
                 Tuple[Tuple[U, W], ...],
             ],
             Tuple[U, W],
-        ] = {}
-        # Update rules
-        for (l1, args1), dst1 in self.rules.items():
-            for (l2, args2), dst2 in other.rules.items():
-                if len(args1) != len(args2) or l1 != l2:
-                    continue
-                S = (l1, tuple((a, b) for a, b in zip(args1, args2)))
-                rules[S] = (dst1, dst2)
-        # Update final states
-        finals = set()
-        for dst1 in self.finals:
-            for dst2 in other.finals:
-                finals.add((dst1, dst2))
+        ] = {
+            (letter, tuple(decoded[arg] for arg in args)): decoded[dst]
+            for (letter, args), dst in pair_rules.items()
+        }
+        finals = {
+            decoded[(p, q)]
+            for p, q in reached
+            if s_states[p] in self.finals and o_states[q] in other.finals
+        }
         out = DFTA(rules, finals)
         return out
 
@@ -163,52 +234,92 @@ class DFTA(Generic[U, V]):
     ) -> "DFTA[X, V]":
         """
         Read self or other.
+
+        A state (a, b) means that self is in a and other in b, None means that the automaton has no rule to read the tree.
+        Only the pairs of states reachable from the leaves are built.
         """
-        rules: Dict[
-            Tuple[
-                V,
-                Tuple[X, ...],
-            ],
-            X,
+        s_states, s_rules, s_consumers = self.__encode__()
+        o_states, o_rules, o_consumers = other.__encode__()
+        s_lookup = {(letter, args): dst for letter, args, dst in s_rules}
+        o_lookup = {(letter, args): dst for letter, args, dst in o_rules}
+        # -1 stands for None
+        pair_rules: Dict[
+            Tuple[V, Tuple[Tuple[int, int], ...]],
+            Tuple[int, int],
         ] = {}
-        # Update rules
-        mapping_s = defaultdict(list)
-        mapping_o = defaultdict(list)
-        # Compute all alternatives
-        finals = set()
-        ostates = other.states
-        for a in self.states:
-            for b in ostates:
-                f = fusion(a, b)
-                mapping_o[b].append(f)
-                mapping_s[a].append(f)
-            mapping_s[a].append(fusion(a, None))
-            if a in self.finals:
-                finals |= set(mapping_s[a])
-        for b in ostates:
-            mapping_o[b].append(fusion(None, b))
-            if b in other.finals:
-                finals |= set(mapping_o[b])
+        reached: Set[Tuple[int, int]] = set()
+        queue: List[Tuple[int, int]] = []
+        # reached pairs indexed by their first and second component
+        by_first: List[List[Tuple[int, int]]] = [[] for _ in s_states]
+        by_second: List[List[Tuple[int, int]]] = [[] for _ in o_states]
 
-        for (l1, args1), dst1 in self.rules.items():
-            cases = [mapping_s[x] for x in args1]
-            new_dst = fusion(dst1, None)
-            for new_args in product(*cases):
-                rules[(l1, new_args)] = new_dst
-
-        for (l2, args2), dst2 in other.rules.items():
-            cases = [mapping_o[x] for x in args2]
-            new_dst = fusion(None, dst2)
-            for new_args in product(*cases):
-                rules[(l2, new_args)] = new_dst
-        for (l1, args1), dst1 in self.rules.items():
-            for (l2, args2), dst2 in other.rules.items():
-                if len(args1) != len(args2) or l1 != l2:
-                    continue
-                S = (l1, tuple(fusion(a, b) for a, b in zip(args1, args2)))
-                rules[S] = fusion(dst1, dst2)
+        def add(
+            letter: V, args: Tuple[Tuple[int, int], ...], dst: Tuple[int, int]
+        ) -> None:
+            pair_rules[(letter, args)] = dst
+            if dst not in reached:
+                reached.add(dst)
+                queue.append(dst)
+                if dst[0] >= 0:
+                    by_first[dst[0]].append(dst)
+                if dst[1] >= 0:
+                    by_second[dst[1]].append(dst)
 
-        out = DFTA(rules, finals)
+        # Leaves
+        for letter, args1, dst1 in s_rules:
+            if len(args1) == 0:
+                add(letter, (), (dst1, o_lookup.get((letter, ()), -1)))
+        for letter, args2, dst2 in o_rules:
+            if len(args2) == 0:
+                add(letter, (), (s_lookup.get((letter, ()), -1), dst2))
+        # Propagate upward
+        while queue:
+            state = queue.pop()
+            a, b = state
+            if a >= 0:
+                for r1, k in s_consumers[a]:
+                    letter, args1, dst1 = s_rules[r1]
+                    cases = [
+                        by_first[x] if j != k else [state] for j, x in enumerate(args1)
+                    ]
+                    for new_args in product(*cases):
+                        seconds = tuple(y for _, y in new_args)
+                        dst2 = (
+                            -1 if -1 in seconds else o_lookup.get((letter, seconds), -1)
+                        )
+                        add(letter, new_args, (dst1, dst2))
+            if b >= 0:
+                for r2, k in o_consumers[b]:
+                    letter, args2, dst2 = o_rules[r2]
+                    cases = [
+                        by_second[x] if j != k else [state] for j, x in enumerate(args2)
+                    ]
+                    for new_args in product(*cases):
+                        firsts = tuple(x for x, _ in new_args)
+                        dst1 = (
+                            -1 if -1 in firsts else s_lookup.get((letter, firsts), -1)
+                        )
+                        add(letter, new_args, (dst1, dst2))
+        # Decode states and apply fusion once per state
+        fused = {
+            (a, b): fusion(
+                s_states[a] if a >= 0 else None, o_states[b] if b >= 0 else None
+            )
+            for a, b in reached
+        }
+        finals = {
+            fused[(a, b)]
+            for a, b in reached
+            if (a >= 0 and s_states[a] in self.finals)
+            or (b >= 0 and o_states[b] in other.finals)
+        }
+        out = DFTA(
+            {
+                (letter, tuple(fused[q] for q in args)): fused[dst]
+                for (letter, args), dst in pair_rules.items()
+            },
+            finals,
+        )
         out.reduce()
         return out
 
@@ -226,93 +337,91 @@ class DFTA(Generic[U, V]):
         """
         Assumes this is a reduced DTFA
 
-        Adapted algorithm from:
-        Brainerd, Walter S.. “The Minimalization of Tree Automata.” Inf. Control. 13 (1968): 484-491.
+        Partition refinement in the style of Hopcroft's algorithm:
+        the signature of a state is the set of its contexts, a context being a rule consuming it with the other arguments and the class of the destination.
+        Two states stay in the same class as long as they have the same signature.
+        When a class splits, all groups but the largest one get a new class
+        and only the signatures of the arguments of the rules producing a moved state are recomputed.
         """
-        # 1. Build consumer_of
-        consumer_of: Dict[
-            U,
-            List[
-                Tuple[
-                    Tuple[
-                        V,
-                        Tuple[U, ...],
-                    ],
-                    int,
-                ]
-            ],
-        ] = {q: [] for q in self.states}
-        for l, args in self.rules:
-            for k, ik in enumerate(args):
-                consumer_of[ik].append(((l, args), k))
-        # 2. Init equiv classes
-        state2cls: Dict[U, int] = {
-            q: 0 if q not in self.finals else 1 for q in self.states
-        }
-        cls2states: Dict[int, Tuple[U, ...]] = {
-            j: tuple({q for q, i in state2cls.items() if i == j}) for j in [0, 1]
+        states, rules, consumers = self.__encode__()
+        # arguments of the rules producing each state
+        producers: List[Set[int]] = [set() for _ in states]
+        for _, args, dst in rules:
+            producers[dst].update(args)
+
+        # 1. Init equiv classes
+        state2cls: List[int] = [int(q in self.finals) for q in states]
+        cls2states: List[Set[int]] = [set(), set()]
+        for q, i in enumerate(state2cls):
+            cls2states[i].add(q)
+        signatures: List[FrozenSet] = [frozenset() for _ in states]
+        # the signature shared by the states of each class, None when unknown
+        cls2signature: List[Optional[FrozenSet]] = [None, None]
+
+        # 2. Refine until all states of a class have the same signature
+        dirty = set(range(len(states)))
+        while dirty:
+            touched: Dict[int, List[int]] = defaultdict(list)
+            for q in dirty:
+                signatures[q] = frozenset(
+                    (
+                        rules[r][0],
+                        k,
+                        rules[r][1][:k] + rules[r][1][k + 1 :],
+                        state2cls[rules[r][2]],
+                    )
+                    for r, k in consumers[q]
+                )
+                touched[state2cls[q]].append(q)
+            dirty = set()
+            for i, changed in touched.items():
+                groups: Dict[FrozenSet, List[int]] = defaultdict(list)
+                for q in changed:
+                    groups[signatures[q]].append(q)
+                # the states that did not change keep the signature of the class
+                ref = cls2signature[i]
+                unchanged = len(cls2states[i]) - len(changed)
+                sizes = {sig: len(group) for sig, group in groups.items()}
+                if unchanged > 0:
+                    sizes[ref] = sizes.get(ref, 0) + unchanged  # type: ignore
+                if len(sizes) == 1:
+                    cls2signature[i] = next(iter(sizes))
+                    continue
+                # the largest group keeps the class
+                kept = max(sizes, key=lambda sig: sizes[sig])
+                cls2signature[i] = kept
+                for sig in sizes:
+                    if sig == kept:
+                        continue
+                    group = groups[sig]
+                    if unchanged > 0 and sig == ref:
+                        group = list(cls2states[i].difference(changed)) + group
+                    n = len(cls2states)
+                    cls2states.append(set(group))
+                    cls2signature.append(sig)
+                    cls2states[i].difference_update(group)
+                    for q in group:
+                        state2cls[q] = n
+                        dirty |= producers[q]
+
+        f: Callable[[Tuple[U, ...]], W] = mapping or (lambda x: x)  # type: ignore
+        new_states = [f(tuple([states[q] for q in sorted(cls)])) for cls in cls2states]
+        new_rules: Dict[Tuple[V, Tuple[W, ...]], W] = {}
+        for l, args, dst in rules:
+            t_args = tuple([new_states[state2cls[q]] for q in args])
+            new_rules[(l, t_args)] = new_states[state2cls[dst]]
+        new_finals: Set[W] = {
+            new_states[state2cls[q]]
+            for q, state in enumerate(states)
+            if state in self.finals
         }
+        return DFTA(new_rules, new_finals)
 
-        n = 1
-        finished = False
-
-        # Routine
-        def are_equivalent(a: U, b: U) -> bool:
-            for S, k in consumer_of[a]:
-                P, args = S
-                # Replacing a at index k with b
-                newS = (P, tuple([p if j != k else b for j, p in enumerate(args)]))
-                # Check that rules[S] and rules[newS] go into the same equi. class
-                dst_cls = state2cls[self.rules[S]]
-                out = self.rules.get(newS)
-                if out is None or state2cls[out] != dst_cls:
-                    return False
-            # Symmetry with b
-            for S, k in consumer_of[b]:
-                P, args = S
-                dst_cls = state2cls[self.rules[S]]
-                newS = (P, tuple([p if j != k else a for j, p in enumerate(args)]))
-                out = self.rules.get(newS)
-                if out is None or state2cls[out] != dst_cls:
-                    return False
-            return True
-
-        # 3. Main loop
-        while not finished:
-            finished = True
-            # For each equivalence class
-            for i in range(n + 1):
-                cls = list(cls2states[i])
-                while cls:
-                    new_cls = []
-                    representative = cls.pop()
-                    new_cls.append(representative)
-                    next_cls = []
-                    for q in cls:
-                        if are_equivalent(representative, q):
-                            new_cls.append(q)
-                        else:
-                            next_cls.append(q)
-                    cls = next_cls
-                    if len(cls) != 0:
-                        # Create new equivalence class
-                        n += 1
-                        for q in new_cls:
-                            state2cls[q] = n
-                        cls2states[n] = tuple(new_cls)
-                        finished = False
-                    else:
-                        # new_cls (now) has NOT changed from cls (previous iter.), they are the same
-                        # thus we just need to re-set it (because there might have been multiple iterations)
-                        # i is a free slot since other classes are added at the end
-                        cls2states[i] = tuple(new_cls)
-
-        f = mapping or (lambda x: x)  # type: ignore
-        new_rules = {}
-        for (l, args), dst in self.rules.items():
-            t_args = tuple([f(cls2states[state2cls[q]]) for q in args])
-            new_rules[(l, t_args)] = f(cls2states[state2cls[dst]])
-        return DFTA(new_rules, {f(cls2states[state2cls[q]]) for q in self.finals})  # type: ignore
+    def compile(self) -> "CompiledDFTA[U, V]":
+        """
+        Returns a read-only form of this DFTA where states and letters are numbered, see CompiledDFTA.
+        """
+        return CompiledDFTA(self)
 
     def map_states(self, mapping: Callable[[U], X]) -> "DFTA[X, V]":
         return DFTA(
@@ -337,3 +446,72 @@ class DFTA(Generic[U, V]):
                 s += " (FINAL)"
             s += "\n"
         return s
+
+
+class CompiledDFTA(Generic[U, V]):
+    """
+    Read-only form of a DFTA where states and letters are numbered by small ints, -1 stands for no state.
+
+    Reading a letter is a lookup in a list for leaves and in a dict with int keys otherwise,
+    so that the nested tuples that are the states of products and minimised DFTA are never hashed.
+    The DFTA must not be modified afterwards.
+    """
+
+    def __init__(self, dfta: DFTA[U, V]) -> None:
+        states, rules, _ = dfta.__encode__()
+        self.states: List[U] = states
+        self.finals: List[bool] = [q in dfta.finals for q in states]
+        self.letter_ids: Dict[V, int] = {}
+        for letter, _, __ in rules:
+            if letter not in self.letter_ids:
+                self.letter_ids[letter] = len(self.letter_ids)
+        self._base = len(states) + 1
+        self._nletters = len(self.letter_ids)
+        self.leaves: List[int] = [-1] * self._nletters
+        self.transitions: Dict[int, int] = {}
+        for letter, args, dst in rules:
+            letter_id = self.letter_ids[letter]
+            if len(args) == 0:
+                self.leaves[letter_id] = dst
+            else:
+                self.transitions[self.key(letter_id, args)] = dst
+
+    def key(self, letter: int, args: Tuple[int, ...]) -> int:
+        """
+        The unique int that encodes reading letter with the given states as arguments.
+        """
+        key = 0
+        for arg in args:
+            key = key * self._base + arg + 1
+        return key * self._nletters + letter
+
+    def letter(self, letter: V) -> int:
+        """
+        The number of the given letter or -1 if it is not read by the DFTA.
+        """
+        return self.letter_ids.get(letter, -1)
+
+    def read(self, letter: int, args: Tuple[int, ...]) -> int:
+        """
+        The state reached by reading the given letter number with the given state numbers as arguments or -1.
+        """
+        if letter < 0:
+            return -1
+        if len(args) == 0:
+            return self.leaves[letter]
+        for arg in args:
+            if arg < 0:
+                return -1
+        return self.transitions.get(self.key(letter, args), -1)
+
+    def state(self, state: int) -> Optional[U]:
+        """
+        The state of the DFTA with the given number.
+        """
+        return None if state < 0 else self.states[state]
+
+    def size(self) -> int:
+        """
+        Return the number of rules.
+        """
+        return len(self.transitions) + sum(1 for q in self.leaves if q >= 0)
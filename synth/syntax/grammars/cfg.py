@@ -1,6 +1,6 @@
 from collections import deque
 from functools import lru_cache
-from typing import Deque, Dict, Literal, Set, Tuple, List
+from typing import Callable, Deque, Dict, Literal, Set, Tuple, List
 
 from synth.syntax.dsl import DSL
 from synth.syntax.grammars.det_grammar import DerivableProgram
@@ -14,6 +14,38 @@ CFGState = Tuple[NGram, int]
 CFGNonTerminal = Tuple[Type, Tuple[CFGState, NoneType]]
 
 
+def __derivations__(
+    dsl: DSL,
+) -> Callable[[Type], Tuple[List[Primitive], List[Tuple[Primitive, List[Type]]]]]:
+    """
+    Returns a memoized function mapping a type to the primitives of the DSL of exactly this type
+    and to the primitives whose type ends with it along with their arguments, both in DSL order.
+    Primitives are first indexed by return type since a type ending with t returns t.returns().
+    """
+    by_return: Dict[Type, List[Primitive]] = {}
+    for P in dsl.list_primitives:
+        by_return.setdefault(P.type.returns(), []).append(P)
+    memo: Dict[Type, Tuple[List[Primitive], List[Tuple[Primitive, List[Type]]]]] = {}
+
+    def derivations(
+        current_type: Type,
+    ) -> Tuple[List[Primitive], List[Tuple[Primitive, List[Type]]]]:
+        if current_type not in memo:
+            constants = []
+            functions = []
+            for P in by_return.get(current_type.returns(), []):
+                type_P = P.type
+                if type_P == current_type:
+                    constants.append(P)
+                arguments_P = type_P.ends_with(current_type)
+                if arguments_P is not None:
+                    functions.append((P, arguments_P))
+            memo[current_type] = (constants, functions)
+        return memo[current_type]
+
+    return derivations
+
+
 class CFG(TTCFG[CFGState, NoneType]):
     """
     Represents a deterministic Context Free Grammar (CFG).
@@ -176,6 +208,8 @@ class CFG(TTCFG[CFGState, NoneType]):
         list_to_be_treated: Deque[CFGNonTerminal] = deque()
         initital_ctx = (return_type, ((NGram(n_gram), 0), None))
         list_to_be_treated.append(initital_ctx)
+        seen: Set[CFGNonTerminal] = {initital_ctx}
+        derivations = __derivations__(dsl)
 
         while len(list_to_be_treated) > 0:
             non_terminal = list_to_be_treated.pop()
@@ -196,10 +230,9 @@ class CFG(TTCFG[CFGState, NoneType]):
                         cst = Constant(current_type)
                         rules[non_terminal][cst] = ([], None)
                 # Try to add constants from the DSL
-                for P in dsl.list_primitives:
-                    type_P = P.type
-                    if type_P == current_type:
-                        rules[non_terminal][P] = ([], None)
+                constants, functions = derivations(current_type)
+                for P in constants:
+                    rules[non_terminal][P] = ([], None)
                 # Function call
                 if depth < max_depth - 1:
                     predecessors = non_terminal[1][0][0]
@@ -211,26 +244,24 @@ class CFG(TTCFG[CFGState, NoneType]):
                         set(),
                     )
                     # DSL Primitives
-                    for P in dsl.list_primitives:
+                    for P, arguments_P in functions:
                         if P.primitive in forbidden:
                             continue
-                        type_P = P.type
-                        arguments_P = type_P.ends_with(current_type)
-                        if arguments_P is not None:
-                            decorated_arguments_P = []
-                            for i, arg in enumerate(arguments_P):
-                                new_predecessors = predecessors.successor((P, i))
-                                new_context = (
-                                    arg,
-                                    ((new_predecessors, depth + 1), None),
-                                )
-                                decorated_arguments_P.append(
-                                    (arg, (new_predecessors, depth + 1))
-                                )
-                                if new_context not in list_to_be_treated:
-                                    list_to_be_treated.appendleft(new_context)
-
-                            rules[non_terminal][P] = (decorated_arguments_P, None)
+                        decorated_arguments_P = []
+                        for i, arg in enumerate(arguments_P):
+                            new_predecessors = predecessors.successor((P, i))
+                            new_context = (
+                                arg,
+                                ((new_predecessors, depth + 1), None),
+                            )
+                            decorated_arguments_P.append(
+                                (arg, (new_predecessors, depth + 1))
+                            )
+                            if new_context not in seen:
+                                seen.add(new_context)
+                                list_to_be_treated.appendleft(new_context)
+
+                        rules[non_terminal][P] = (decorated_arguments_P, None)
                     # Try to use variable as if there were functions
                     if depth >= min_variable_depth:
                         for vi, varg in enumerate(args):
@@ -247,7 +278,8 @@ class CFG(TTCFG[CFGState, NoneType]):
                                     decorated_arguments_V.append(
                                         (arg, (new_predecessors, depth + 1))
                                     )
-                                    if new_context not in list_to_be_treated:
+                                    if new_context not in seen:
+                                        seen.add(new_context)
                                         list_to_be_treated.appendleft(new_context)
 
                                 rules[non_terminal][V] = (decorated_arguments_V, None)
@@ -266,7 +298,8 @@ class CFG(TTCFG[CFGState, NoneType]):
                                 decorated_arguments_self.append(
                                     (arg, (new_predecessors, depth + 1))
                                 )
-                                if new_context not in list_to_be_treated:
+                                if new_context not in seen:
+                                    seen.add(new_context)
                                     list_to_be_treated.appendleft(new_context)
 
                             rules[non_terminal][P] = (decorated_arguments_self, None)
@@ -311,7 +344,8 @@ class CFG(TTCFG[CFGState, NoneType]):
         list_to_be_treated: Deque[CFGNonTerminal] = deque()
         initital_ctx = (return_type, ((NGram(n_gram), 0), None))
         list_to_be_treated.append(initital_ctx)
-        done: Set[CFGNonTerminal] = set()
+        seen: Set[CFGNonTerminal] = {initital_ctx}
+        derivations = __derivations__(dsl)
 
         while len(list_to_be_treated) > 0:
             non_terminal = list_to_be_treated.pop()
@@ -320,10 +354,6 @@ class CFG(TTCFG[CFGState, NoneType]):
             if non_terminal not in rules:
                 rules[non_terminal] = {}
 
-            if non_terminal in done:
-                continue
-            done.add(non_terminal)
-
             # Add variables rules
             for i in range(len(args)):
                 if current_type == args[i]:
@@ -333,10 +363,9 @@ class CFG(TTCFG[CFGState, NoneType]):
                 cst = Constant(current_type)
                 rules[non_terminal][cst] = ([], None)
             # Try to add constants from the DSL
-            for P in dsl.list_primitives:
-                type_P = P.type
-                if type_P == current_type:
-                    rules[non_terminal][P] = ([], None)
+            constants, functions = derivations(current_type)
+            for P in constants:
+                rules[non_terminal][P] = ([], None)
             # Function call
             predecessors = non_terminal[1][0][0]
             last_pred = predecessors.last() if len(predecessors) > 0 else None
@@ -347,26 +376,21 @@ class CFG(TTCFG[CFGState, NoneType]):
                 set(),
             )
             # DSL Primitives
-            for P in dsl.list_primitives:
+            for P, arguments_P in functions:
                 if P.primitive in forbidden:
                     continue
-                type_P = P.type
-                arguments_P = type_P.ends_with(current_type)
-                if arguments_P is not None:
-                    decorated_arguments_P = []
-                    for i, arg in enumerate(arguments_P):
-                        new_predecessors = predecessors.successor((P, i))
-                        new_context = (
-                            arg,
-                            ((new_predecessors, 0), None),
-                        )
-                        decorated_arguments_P.append((arg, (new_predecessors, 0)))
-                        if (
-                            new_context not in list_to_be_treated
-                            and new_context not in done
-                        ):
-                            list_to_be_treated.appendleft(new_context)
-                    rules[non_terminal][P] = (decorated_arguments_P, None)
+                decorated_arguments_P = []
+                for i, arg in enumerate(arguments_P):
+                    new_predecessors = predecessors.successor((P, i))
+                    new_context = (
+                        arg,
+                        ((new_predecessors, 0), None),
+                    )
+                    decorated_arguments_P.append((arg, (new_predecessors, 0)))
+                    if new_context not in seen:
+                        seen.add(new_context)
+                        list_to_be_treated.appendleft(new_context)
+                rules[non_terminal][P] = (decorated_arguments_P, None)
             # Try to use variable as if there were functions
             for vi, varg in enumerate(args):
                 arguments_V = varg.ends_with(current_type)
@@ -380,7 +404,8 @@ class CFG(TTCFG[CFGState, NoneType]):
                             ((new_predecessors, 0), None),
                         )
                         decorated_arguments_V.append((arg, (new_predecessors, 0)))
-                        if new_context not in list_to_be_treated:
+                        if new_context not in seen:
+                            seen.add(new_context)
                             list_to_be_treated.appendleft(new_context)
                         rules[non_terminal][V] = (decorated_arguments_V, None)
             # Try to call self
@@ -396,7 +421,8 @@ class CFG(TTCFG[CFGState, NoneType]):
                             ((new_predecessors, 0), None),
                         )
                         decorated_arguments_self.append((arg, (new_predecessors, 0)))
-                        if new_context not in list_to_be_treated:
+                        if new_context not in seen:
+                            seen.add(new_context)
                             list_to_be_treated.appendleft(new_context)
                     rules[non_terminal][P] = (decorated_arguments_self, None)
 
@@ -1,6 +1,7 @@
 from synth.syntax.grammars.enumeration.heap_search import (
     enumerate_prob_grammar as hs_enumerate_prob_grammar,
     enumerate_bucket_prob_grammar as hs_enumerate_bucket_prob_grammar,
+    enumerate_cost_prob_grammar as hs_enumerate_cost_prob_grammar,
 )
 from synth.syntax.grammars.enumeration.u_heap_search import (
     enumerate_prob_u_grammar as hs_enumerate_prob_u_grammar,
@@ -1,3 +1,4 @@
+from array import array
 from itertools import product
 from heapq import heappush, heappop, heapify
 from typing import (
@@ -6,6 +7,7 @@ from typing import (
     Generic,
     List,
     Optional,
+    Sequence,
     Set,
     Tuple,
     TypeVar,
@@ -17,9 +19,10 @@ import numpy as np
 
 from synth.filter.filter import Filter
 from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.enumeration.program_bank import ProgramBank
 from synth.syntax.grammars.enumeration.program_enumerator import ProgramEnumerator
 from synth.syntax.grammars.grammar import DerivableProgram
-from synth.syntax.program import Program, Function
+from synth.syntax.program import Program
 from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
 from synth.syntax.grammars.tagged_u_grammar import ProbUGrammar
 from synth.syntax.type_system import Type
@@ -43,24 +46,46 @@ class BeapSearch(
     ProgramEnumerator[None],
     Generic[U, V, W],
 ):
+    """
+    Bottom-up enumeration by increasing cost where the probabilities of G are costs.
+    If max_cost is set only programs with a cost strictly lower than max_cost are enumerated and combinations with a larger cost are never queued,
+    thus the enumeration always terminates.
+    If compact_bank is True programs are not kept in the bank but rebuilt when needed, see ProgramBank, this uses less memory but is slower.
+    """
+
     def __init__(
-        self, G: ProbDetGrammar[U, V, W], filter: Optional[Filter[Program]] = None
+        self,
+        G: ProbDetGrammar[U, V, W],
+        filter: Optional[Filter[Program]] = None,
+        max_cost: Optional[float] = None,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        compact_bank: bool = False,
     ) -> None:
-        super().__init__(filter)
+        super().__init__(filter, max_size, max_depth)
         assert isinstance(G.grammar, CFG)
         self.G = G
         self.cfg: CFG = G.grammar
+        self.max_cost = max_cost
         self._deleted: Set[Program] = set()
 
         # S -> cost list
         # IDEA: Change from cost list to increase diffs
         self._cost_lists: Dict[Tuple[Type, U], List[float]] = {}
-        # S -> cost_index -> program list
-        self._bank: Dict[Tuple[Type, U], Dict[int, List[Program]]] = {}
+        # S -> cost_index -> programs
+        self._bank: ProgramBank[U] = ProgramBank(self._is_bounded_(), compact_bank)
         # S -> heap of HeapElement queued
         self._queues: Dict[Tuple[Type, U], List[HeapElement]] = {}
         # S -> cost index set
         self._empties: Dict[Tuple[Type, U], Set[int]] = {}
+        # Enumeration of the start non-terminal:
+        # entries of the current cost index and their programs if already built, position of the next one to yield
+        self._pending: array = array("q")
+        self._pending_programs: List[Optional[Program]] = []
+        self._position = 0
+        # next cost index, no program left
+        self._start_cost_index = 0
+        self._done = False
 
         self._non_terminal_for: Dict[
             Tuple[Type, U], Dict[DerivableProgram, List[Tuple[Type, U]]]
@@ -68,7 +93,6 @@ class BeapSearch(
 
         for S in self.G.grammar.rules:
             self._cost_lists[S] = []
-            self._bank[S] = {}
             self._empties[S] = set()
             self._queues[S] = []
             self._non_terminal_for[S] = {
@@ -118,22 +142,59 @@ class BeapSearch(
                     self._queues[S] = new_queue
                     self._cost_lists[S][0] = self._queues[S][0].cost
 
-    def generator(self) -> Generator[Program, None, None]:
-        self._init_non_terminal_(self.G.start)
-        self._reevaluate_()
-        n = 0
-        failed = False
-        while not failed:
+    def _next_bucket_(self) -> bool:
+        """
+        Generate the entries of the next non empty cost index of the start non-terminal in self._pending.
+        Returns False iff there is no program left.
+        """
+        if self._start_cost_index == 0:
+            self._init_non_terminal_(self.G.start)
+            self._reevaluate_()
+        while not self._done:
             self._failed_by_empties = False
-            failed = True
-            for prog in self.query(self.G.start, n):
-                failed = False
-                yield prog
-            failed = failed and not self._failed_by_empties
-            n += 1
+            pairs = list(self._query_entries_(self.G.start, self._start_cost_index))
+            self._pending = array("q", [entry for entry, _ in pairs])
+            self._pending_programs = [program for _, program in pairs]
+            self._position = 0
+            self._start_cost_index += 1
+            self._done = len(self._pending) == 0 and not self._failed_by_empties
+            if len(self._pending) > 0:
+                return True
+        return False
+
+    def generator(self) -> Generator[Program, None, None]:
+        # The state is kept in attributes so that the enumeration can be saved and resumed
+        while self._position < len(self._pending) or self._next_bucket_():
+            program = self._pending_program_(self._position)
+            self._position += 1
+            yield program
+
+    def buckets(self) -> Generator[List[Program], None, None]:
+        """
+        Generator of the programs grouped by cost, by increasing cost.
+        """
+        while self._position < len(self._pending) or self._next_bucket_():
+            start = self._position
+            self._position = len(self._pending)
+            yield [self._pending_program_(i) for i in range(start, self._position)]
+
+    def _pending_program_(self, position: int) -> Program:
+        program = self._pending_programs[position]
+        if program is None:
+            return self._bank.program(self._pending[position])
+        return program
+
+    def batches(self, size: int = 100) -> Generator[List[Program], None, None]:
+        """
+        Same as ProgramEnumerator.batches() but batches are made of whole cost buckets, unless a bucket has more than size programs.
+        """
+        return self._batches_from_buckets_(self.buckets(), size)
 
     def programs_in_banks(self) -> int:
-        return sum(sum(len(x) for x in val.values()) for val in self._bank.values())
+        return len(self._bank)
+
+    def bytes_in_banks(self) -> int:
+        return self._bank.nbytes()
 
     def programs_in_queues(self) -> int:
         return sum(len(val) for val in self._queues.values())
@@ -141,13 +202,24 @@ class BeapSearch(
     def query(
         self, S: Tuple[Type, U], cost_index: int
     ) -> Generator[Program, None, None]:
+        for entry, program in self._query_entries_(S, cost_index):
+            yield program if program is not None else self._bank.program(entry)
+
+    def _query_entries_(
+        self, S: Tuple[Type, U], cost_index: int
+    ) -> Generator[Tuple[int, Optional[Program]], None, None]:
+        """
+        Generates the new entries of S with the given cost index along with their program if it was built to be checked.
+        """
         # When we return this way, it actually mean that we have generated all programs that this non terminal could generate
         if cost_index >= len(self._cost_lists[S]):
             return
         cost = self._cost_lists[S][cost_index]
+        if self.max_cost is not None and cost >= self.max_cost:
+            return
         has_generated_program = False
         no_successor = True
-        bank = self._bank[S]
+        bank = self._bank
         queue = self._queues[S]
         while len(queue) > 0 and queue[0].cost == cost:
             element = heappop(queue)
@@ -187,7 +259,8 @@ class BeapSearch(
                 index_cost = element.combination.copy()
                 index_cost[i] += 1
                 new_cost = cost - cl[index_cost[i] - 1] + cl[index_cost[i]]
-                heappush(queue, HeapElement(new_cost, index_cost, element.P))
+                if self.max_cost is None or new_cost < self.max_cost:
+                    heappush(queue, HeapElement(new_cost, index_cost, element.P))
                 # Avoid duplication with this condition
                 if index_cost[i] > 1:
                     break
@@ -195,21 +268,24 @@ class BeapSearch(
             if is_allowed_empty:
                 continue
 
-            if cost_index not in bank:
-                bank[cost_index] = []
+            bank.add_bucket(S, cost_index)
+            # Programs are built once, before being added if they need to be checked
+            check = self.filter is not None or len(self._deleted) > 0
+            bounded = self._is_bounded_()
             for new_args in product(*args_possibles):
-                if len(args_possibles) > 0:
-                    new_program: Program = Function(element.P, list(new_args))
-                else:
-                    new_program = element.P
-                if new_program in self._deleted:
-                    continue
-                elif not self._should_keep_subprogram(new_program):
-                    self._deleted.add(new_program)
+                if bounded and not self._within_bounds_(*bank.bounds(new_args)):
                     continue
+                new_program = None
+                if check:
+                    new_program = bank.build(element.P, new_args)
+                    if new_program in self._deleted:
+                        continue
+                    elif not self._should_keep_subprogram(new_program):
+                        self._deleted.add(new_program)
+                        continue
                 has_generated_program = True
-                bank[cost_index].append(new_program)
-                yield new_program
+                entry = bank.add(S, cost_index, element.P, new_args, new_program)
+                yield entry, new_program
         if not has_generated_program:
             # If we failed because of allowed empties we can tag this as allowed empty
             if not no_successor:
@@ -217,37 +293,32 @@ class BeapSearch(
                 self._failed_by_empties = True
         if len(queue) > 0:
             next_cost = queue[0].cost
-            self._cost_lists[S].append(next_cost)
+            if self.max_cost is None or next_cost < self.max_cost:
+                self._cost_lists[S].append(next_cost)
 
     def _query_list_(
         self, S: Tuple[Type, U], cost_index: int
-    ) -> Tuple[bool, List[Program]]:
+    ) -> Tuple[bool, Sequence[int]]:
         """
-        returns is_allowed_empty, programs
+        returns is_allowed_empty, entries
         """
         # It's an empty cost index but a valid one
         if cost_index in self._empties[S]:
             return True, []
         if cost_index >= len(self._cost_lists[S]):
             return False, []
-        bank = self._bank[S]
-        if cost_index in bank:
-            return False, bank[cost_index]
-        for x in self.query(S, cost_index):
+        bucket = self._bank.bucket(S, cost_index)
+        if bucket is not None:
+            return False, bucket
+        for x in self._query_entries_(S, cost_index):
             pass
         if cost_index in self._empties[S]:
             return True, []
-        return False, bank[cost_index]
+        return False, self._bank.add_bucket(S, cost_index)
 
     def merge_program(self, representative: Program, other: Program) -> None:
         self._deleted.add(other)
-        for S in self.G.rules:
-            if S[0] != other.type:
-                continue
-            local_bank = self._bank[S]
-            for programs in local_bank.values():
-                if other in programs:
-                    programs.remove(other)
+        self._bank.remove(other)
 
     def probability(self, program: Program) -> float:
         return self.G.probability(program)
@@ -258,12 +329,29 @@ class BeapSearch(
 
     def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "BeapSearch[U, V, W]":
         assert isinstance(G, ProbDetGrammar)
-        enum = self.__class__(G)
+        enum = self.__class__(
+            G,
+            max_cost=self.max_cost,
+            max_size=self.max_size,
+            max_depth=self.max_depth,
+            compact_bank=self._bank.compact,
+        )
         enum._deleted = self._deleted.copy()
         return enum
 
 
-def enumerate_prob_grammar(G: ProbDetGrammar[U, V, W]) -> BeapSearch[U, V, W]:
+def enumerate_prob_grammar(
+    G: ProbDetGrammar[U, V, W],
+    threshold: float = 0,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    compact_bank: bool = False,
+) -> BeapSearch[U, V, W]:
+    """
+    Enumerate the programs of G by decreasing probability.
+    If threshold > 0 only programs with a probability strictly higher than threshold are enumerated and the enumeration terminates.
+    If compact_bank is True programs are not kept in memory but rebuilt when needed, which uses less memory but is slower.
+    """
     Gp: ProbDetGrammar = ProbDetGrammar(
         G.grammar,
         {
@@ -271,4 +359,11 @@ def enumerate_prob_grammar(G: ProbDetGrammar[U, V, W]) -> BeapSearch[U, V, W]:
             for S, val in G.probabilities.items()
         },
     )
-    return BeapSearch(Gp)
+    max_cost = -np.log(threshold) if threshold > 0 else None
+    return BeapSearch(
+        Gp,
+        max_cost=max_cost,
+        max_size=max_size,
+        max_depth=max_depth,
+        compact_bank=compact_bank,
+    )
@@ -1,4 +1,5 @@
 from collections import defaultdict
+from array import array
 from itertools import product
 from heapq import heappush, heappop
 from typing import (
@@ -18,9 +19,10 @@ import numpy as np
 
 from synth.filter.filter import Filter
 from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.enumeration.program_bank import ProgramBank
 from synth.syntax.grammars.enumeration.program_enumerator import ProgramEnumerator
 from synth.syntax.grammars.grammar import DerivableProgram
-from synth.syntax.program import Program, Function
+from synth.syntax.program import Program
 from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
 from synth.syntax.grammars.tagged_u_grammar import ProbUGrammar
 from synth.syntax.type_system import Type
@@ -44,17 +46,31 @@ class BeeSearch(
     ProgramEnumerator[None],
     Generic[U, V, W],
 ):
+    """
+    Bottom-up enumeration by increasing cost where the probabilities of G are costs.
+    If max_cost is set only programs with a cost strictly lower than max_cost are enumerated and combinations with a larger cost are never queued,
+    thus the enumeration always terminates.
+    If compact_bank is True programs are not kept in the bank but rebuilt when needed, see ProgramBank, this uses less memory but is slower.
+    """
+
     def __init__(
-        self, G: ProbDetGrammar[U, V, W], filter: Optional[Filter[Program]] = None
+        self,
+        G: ProbDetGrammar[U, V, W],
+        filter: Optional[Filter[Program]] = None,
+        max_cost: Optional[float] = None,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        compact_bank: bool = False,
     ) -> None:
-        super().__init__(filter)
+        super().__init__(filter, max_size, max_depth)
         assert isinstance(G.grammar, CFG)
         self.G = G
+        self.max_cost = max_cost
         self._deleted: Set[Program] = set()
 
         self._cost_list: List[float] = []
-        # S -> cost_index -> program list
-        self._bank: Dict[Tuple[Type, U], Dict[int, List[Program]]] = {}
+        # S -> cost_index -> programs
+        self._bank: ProgramBank[U] = ProgramBank(self._is_bounded_(), compact_bank)
         # S -> heap of HeapElement queued
         self._prog_queued: Dict[Tuple[Type, U], List[HeapElement]] = {}
         # S -> max index currently queued
@@ -63,9 +79,19 @@ class BeeSearch(
             Tuple[Type, U], List[Tuple[List[int], DerivableProgram, Optional[int]]]
         ] = defaultdict(list)
         self._has_merged = False
+        # S -> for each cost index the smallest size and depth of the programs of S with this cost index or a larger one,
+        # once S has no combination left, the sizes and depths are 0 if not bounded
+        self._finished: Dict[Tuple[Type, U], Tuple[List[int], List[int]]] = {}
+        # Enumeration of the start non-terminal:
+        # entries of the current cost and their programs if already built, position of the next one to yield
+        self._pending: array = array("q")
+        self._pending_programs: List[Optional[Program]] = []
+        self._position = 0
+        # programs left to enumerate (negative if infinite)
+        self._remaining: Optional[int] = None
+        self._infinite = False
         # Fill terminals first
         for S in self.G.rules:
-            self._bank[S] = {}
             self._prog_queued[S] = []
 
             for P in self.G.rules[S]:
@@ -100,6 +126,8 @@ class BeeSearch(
                 return
         # No need to delay add it
         new_cost = self._index_cost2real_cost_(S, P, index_cost)
+        if self.max_cost is not None and new_cost >= self.max_cost:
+            return
         heappush(
             self._prog_queued[S],
             HeapElement(new_cost, index_cost, P),
@@ -123,19 +151,28 @@ class BeeSearch(
         return True, len(cost_list) - 1
 
     def _add_program_(
-        self, S: Tuple[Type, U], new_program: Program, cost_index: int
-    ) -> bool:
-        if new_program in self._deleted:
-            return False
-        if not self._should_keep_subprogram(new_program):
-            self._deleted.add(new_program)
-            return False
-        local_bank = self._bank[S]
-        if cost_index not in local_bank:
-            local_bank[cost_index] = []
-        # assert max(local_bank.keys()) + 1 == len(self._cost_lists[S]), f"index:{cost_index} {local_bank.keys()} vs {len(self._cost_lists[S])}"
-        local_bank[cost_index].append(new_program)
-        return True
+        self,
+        S: Tuple[Type, U],
+        P: DerivableProgram,
+        args: Tuple[int, ...],
+        cost_index: int,
+    ) -> Optional[Tuple[int, Optional[Program]]]:
+        """
+        Returns the entry of the new program in the bank along with the program if it was built to be checked,
+        or None if it was rejected.
+        """
+        if self._is_bounded_() and not self._within_bounds_(*self._bank.bounds(args)):
+            return None
+        # Programs are built once, before being added if they need to be checked
+        new_program = None
+        if self.filter is not None or len(self._deleted) > 0:
+            new_program = self._bank.build(P, args)
+            if new_program in self._deleted:
+                return None
+            if not self._should_keep_subprogram(new_program):
+                self._deleted.add(new_program)
+                return None
+        return self._bank.add(S, cost_index, P, args, new_program), new_program
 
     def _index_cost2real_cost_(
         self, S: Tuple[Type, U], P: DerivableProgram, indices: List[int]
@@ -151,28 +188,59 @@ class BeeSearch(
         Sp = self.G.rules[S][P][0][index]  # type: ignore
         return (Sp[0], (Sp[1], None))  # type: ignore
 
-    def generator(self) -> Generator[Program, None, None]:
-        progs = self.G.programs()
-        infinite = progs < 0
-        failed = 0
-        while (
-            infinite
-            or (self._has_merged and failed < 1000)
-            or (not self._has_merged and progs > 0)
-        ):
+    def _next_bucket_(self) -> bool:
+        """
+        Generate the entries of the start non-terminal with the next cheapest cost in self._pending.
+        Returns False iff there is no program left.
+        """
+        if self._remaining is None:
+            self._remaining = self.G.programs()
+            self._infinite = self._remaining < 0
+        # the number of programs left is unknown once programs are merged or pruned by bounds,
+        # the queues of a finite grammar are then emptied
+        counted = not self._has_merged and not self._is_bounded_()
+        while self._infinite or not counted or self._remaining > 0:
             non_terminals, cost = self._next_cheapest_()
             if cost is None:
                 break
             if len(non_terminals) == 0:
                 break
-            failed += 1
-            succ = False
-            for program in self._produce_programs_from_cost_(non_terminals, cost):
-                progs -= 1
-                if not succ:
-                    failed -= 1
-                succ = True
-                yield program
+            pairs = list(self._produce_entries_from_cost_(non_terminals, cost))
+            self._pending = array("q", [entry for entry, _ in pairs])
+            self._pending_programs = [program for _, program in pairs]
+            self._position = 0
+            if len(self._pending) > 0:
+                self._remaining -= len(self._pending)
+                return True
+        return False
+
+    def generator(self) -> Generator[Program, None, None]:
+        # The state is kept in attributes so that the enumeration can be saved and resumed
+        while self._position < len(self._pending) or self._next_bucket_():
+            program = self._pending_program_(self._position)
+            self._position += 1
+            yield program
+
+    def buckets(self) -> Generator[List[Program], None, None]:
+        """
+        Generator of the programs grouped by cost, by increasing cost.
+        """
+        while self._position < len(self._pending) or self._next_bucket_():
+            start = self._position
+            self._position = len(self._pending)
+            yield [self._pending_program_(i) for i in range(start, self._position)]
+
+    def _pending_program_(self, position: int) -> Program:
+        program = self._pending_programs[position]
+        if program is None:
+            return self._bank.program(self._pending[position])
+        return program
+
+    def batches(self, size: int = 100) -> Generator[List[Program], None, None]:
+        """
+        Same as ProgramEnumerator.batches() but batches are made of whole cost buckets, unless a bucket has more than size programs.
+        """
+        return self._batches_from_buckets_(self.buckets(), size)
 
     def _next_cheapest_(self) -> Tuple[List[Tuple[Type, U]], Optional[float]]:
         """
@@ -192,9 +260,9 @@ class BeeSearch(
                 non_terminals_container.append(S)
         return non_terminals_container, cheapest
 
-    def _produce_programs_from_cost_(
+    def _produce_entries_from_cost_(
         self, non_terminals: List[Tuple[Type, U]], cost: float
-    ) -> Generator[Program, None, None]:
+    ) -> Generator[Tuple[int, Optional[Program]], None, None]:
         for S in non_terminals:
             queue = self._prog_queued[S]
             maxi = self._max_index[S]
@@ -210,51 +278,82 @@ class BeeSearch(
                 for i in range(nargs):
                     index_cost = element.combination.copy()
                     index_cost[i] += 1
-                    self._add_combination_(S, element.P, index_cost, i)
-                    if index_cost[i] > maxi:
-                        maxi = index_cost[i]
+                    if not self._is_dead_(S, Sargs, index_cost):
+                        self._add_combination_(S, element.P, index_cost, i)
+                        if index_cost[i] > maxi:
+                            maxi = index_cost[i]
                     # Avoid duplication with this condition
                     if index_cost[i] > 1:
                         break
                 # Generate programs
                 args_possibles = []
                 for i in range(nargs):
-                    local_bank = self._bank[Sargs[i]]
-                    ci = element.combination[i]
-                    if ci not in local_bank or len(local_bank[ci]) == 0:
+                    bucket = self._bank.bucket(Sargs[i], element.combination[i])
+                    if bucket is None or len(bucket) == 0:
                         break
-                    args_possibles.append(local_bank[ci])
+                    args_possibles.append(bucket)
                 if len(args_possibles) != nargs:
                     # print("failed")
                     continue
                 for new_args in product(*args_possibles):
-                    if len(args_possibles) == 0:
-                        new_program: Program = element.P
-                    else:
-                        new_program = Function(element.P, list(new_args))
-                    if (
-                        self._add_program_(S, new_program, cost_index)
-                        and S == self.G.start
-                    ):
-                        yield new_program
+                    added = self._add_program_(S, element.P, new_args, cost_index)
+                    if added is not None and S == self.G.start:
+                        yield added
             self._max_index[S] = maxi
 
+    def _is_dead_(
+        self, S: Tuple[Type, U], Sargs: List[Tuple[Type, U]], combination: List[int]
+    ) -> bool:
+        """
+        Returns True if the given combination of S and all its successors cannot produce any program,
+        because an argument has no program left at its cost index or they are out of bounds.
+        """
+        bounded = self._is_bounded_()
+        size, depth = 1, 0
+        for Sarg, index in zip(Sargs, combination):
+            # The queue of S is being emptied but the successors of its combinations are not all queued yet
+            finished = None if Sarg == S else self._finished_bounds_(Sarg)
+            if finished is None:
+                size += 1
+                continue
+            sizes, depths = finished
+            if index >= len(sizes):
+                return True
+            size += sizes[index]
+            if depths[index] > depth:
+                depth = depths[index]
+        return bounded and not self._within_bounds_(size, depth + 1)
+
+    def _finished_bounds_(
+        self, S: Tuple[Type, U]
+    ) -> Optional[Tuple[List[int], List[int]]]:
+        """
+        Returns None if S still has combinations queued or delayed, since new programs of S can be generated.
+        Otherwise returns for each cost index the smallest size and depth of the programs of S with this cost index or a larger one.
+        """
+        finished = self._finished.get(S, None)
+        if finished is None and not self._prog_queued[S] and not self._delayed.get(S):
+            if self._is_bounded_():
+                finished = self._bank.min_bounds(S)
+            else:
+                last_index = self._bank.last_cost_index(S)
+                finished = ([0] * (last_index + 1), [0] * (last_index + 1))
+            self._finished[S] = finished
+        return finished
+
     def merge_program(self, representative: Program, other: Program) -> None:
         self._has_merged = True
         self._deleted.add(other)
-        for S in self.G.rules:
-            if S[0] != other.type:
-                continue
-            local_bank = self._bank[S]
-            for programs in local_bank.values():
-                if other in programs:
-                    programs.remove(other)
+        self._bank.remove(other)
 
     def probability(self, program: Program) -> float:
         return self.G.probability(program)
 
     def programs_in_banks(self) -> int:
-        return sum(sum(len(x) for x in val.values()) for val in self._bank.values())
+        return len(self._bank)
+
+    def bytes_in_banks(self) -> int:
+        return self._bank.nbytes()
 
     def programs_in_queues(self) -> int:
         return sum(len(val) for val in self._delayed.values()) + sum(
@@ -267,14 +366,30 @@ class BeeSearch(
 
     def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "BeeSearch[U, V, W]":
         assert isinstance(G, ProbDetGrammar)
-        enum = self.__class__(G)
+        enum = self.__class__(
+            G,
+            max_cost=self.max_cost,
+            max_size=self.max_size,
+            max_depth=self.max_depth,
+            compact_bank=self._bank.compact,
+        )
         return enum
 
 
 def enumerate_prob_grammar(
-    G: ProbDetGrammar[U, V, W], threshold: int = 2
+    G: ProbDetGrammar[U, V, W],
+    threshold: float = 0,
+    precision: int = 2,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    compact_bank: bool = False,
 ) -> BeeSearch[U, V, W]:
-    mult = 10**threshold
+    """
+    Enumerate the programs of G by decreasing probability, costs are rounded to precision decimal digits.
+    If threshold > 0 only programs with a probability strictly higher than threshold, up to rounding, are enumerated and the enumeration terminates.
+    If compact_bank is True programs are not kept in memory but rebuilt when needed, which uses less memory but is slower.
+    """
+    mult = 10**precision
     Gp: ProbDetGrammar = ProbDetGrammar(
         G.grammar,
         {
@@ -282,4 +397,11 @@ def enumerate_prob_grammar(
             for S, val in G.probabilities.items()
         },
     )
-    return BeeSearch(Gp)
+    max_cost = -np.log(threshold) * mult if threshold > 0 else None
+    return BeeSearch(
+        Gp,
+        max_cost=max_cost,
+        max_size=max_size,
+        max_depth=max_depth,
+        compact_bank=compact_bank,
+    )
@@ -44,16 +44,26 @@ class CDSearch(
     ProgramEnumerator[None],
     Generic[U, V, W],
 ):
+    """
+    Constant delay enumeration by increasing cost where the probabilities of G are non negative costs.
+    If max_cost is set only programs with a cost strictly lower than max_cost are enumerated and derivations with a larger cost are never queued,
+    thus the enumeration always terminates.
+    """
+
     def __init__(
         self,
         G: ProbDetGrammar[U, V, W],
         filter: Optional[Filter[Program]] = None,
         k: int = 5,
+        max_cost: Optional[float] = None,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
     ) -> None:
-        super().__init__(filter)
+        super().__init__(filter, max_size, max_depth)
         assert isinstance(G.grammar, CFG)
         self.G = G
         self.cfg: CFG = G.grammar
+        self.max_cost = max_cost
         self._deleted: Set[Program] = set()
 
         # compute larger M
@@ -91,6 +101,13 @@ class CDSearch(
         ] = {}
         self._empties_nt: Dict[Tuple[Type, U], Set[int]] = {}
         self._empties_derivation: Dict[Tuple[Tuple[Type, U]], Set[int]] = {}
+        # Enumeration of the start non-terminal:
+        # programs of the current cost index, position of the next one to yield
+        self._pending: List[Program] = []
+        self._position = 0
+        # next cost index, no program left
+        self._start_cost_index = 0
+        self._done = False
 
         for S in self.G.grammar.rules:
             self._queue_nt[S] = []
@@ -231,22 +248,47 @@ class CDSearch(
                 self._queue_derivation[arg].push(elems.pop(0))
             assert len(self._queue_derivation[arg]) == 1
 
-    def generator(self) -> Generator[Program, None, None]:
-        self._init_non_terminal_(self.G.start)
-        self._reevaluate_()
-        # Update M
-        self.__compute_bounds__()
-
-        n = 0
-        failed = False
-        while not failed:
+    def _next_bucket_(self) -> bool:
+        """
+        Generate the programs of the next non empty cost index of the start non-terminal in self._pending.
+        Returns False iff there is no program left.
+        """
+        if self._start_cost_index == 0:
+            self._init_non_terminal_(self.G.start)
+            self._reevaluate_()
+            # Update M
+            self.__compute_bounds__()
+        while not self._done:
             self._failed_by_empties = False
-            failed = True
-            for prog in self.query(self.G.start, n):
-                failed = False
-                yield prog
-            failed = failed and not self._failed_by_empties
-            n += 1
+            self._pending = list(self.query(self.G.start, self._start_cost_index))
+            self._position = 0
+            self._start_cost_index += 1
+            self._done = len(self._pending) == 0 and not self._failed_by_empties
+            if len(self._pending) > 0:
+                return True
+        return False
+
+    def generator(self) -> Generator[Program, None, None]:
+        # The state is kept in attributes so that the enumeration can be saved and resumed
+        while self._position < len(self._pending) or self._next_bucket_():
+            program = self._pending[self._position]
+            self._position += 1
+            yield program
+
+    def buckets(self) -> Generator[List[Program], None, None]:
+        """
+        Generator of the programs grouped by cost, by increasing cost.
+        """
+        while self._position < len(self._pending) or self._next_bucket_():
+            bucket = self._pending[self._position :]
+            self._position = len(self._pending)
+            yield bucket
+
+    def batches(self, size: int = 100) -> Generator[List[Program], None, None]:
+        """
+        Same as ProgramEnumerator.batches() but batches are made of whole cost buckets, unless a bucket has more than size programs.
+        """
+        return self._batches_from_buckets_(self.buckets(), size)
 
     def programs_in_banks(self) -> int:
         return sum(sum(len(x) for x in val.values()) for val in self._bank_nt.values())
@@ -309,7 +351,9 @@ class CDSearch(
                     index_cost[i] += 1
                     new_cost = ct.cost - cl[index_cost[i] - 1] + cl[index_cost[i]]
                     # print("\t\tpushing:", new_cost, ">", ct.cost, "cost tuple:", index_cost)
-                    queue.push(CostTuple(new_cost, [index_cost]))
+                    # Rule costs are non negative so programs cost at least new_cost
+                    if self.max_cost is None or new_cost < self.max_cost:
+                        queue.push(CostTuple(new_cost, [index_cost]))
                     # print("\t\tAFTER PUSH:", queue)
                     # Avoid duplication with this condition
                     if index_cost[i] > 1:
@@ -327,7 +371,9 @@ class CDSearch(
             if not queue.is_empty():
                 queue.update()
                 # print("BEFORE PEEK:", queue)
-                self._cost_lists_derivation[args].append(queue.peek().cost)
+                next_cost = queue.peek().cost
+                if self.max_cost is None or next_cost < self.max_cost:
+                    self._cost_lists_derivation[args].append(next_cost)
         return bank[cost_index]
 
     def query(
@@ -338,7 +384,11 @@ class CDSearch(
             return
         cost = self._cost_lists_nt[S][cost_index]
         bank = self._bank_nt[S]
+        if self.max_cost is not None and cost >= self.max_cost:
+            bank[cost_index] = []
+            return
         queue = self._queue_nt[S]
+        bounded = self._is_bounded_()
         has_generated_program = False
         no_successor = True
         while len(queue) > 0 and queue[0].cost == cost:
@@ -358,10 +408,12 @@ class CDSearch(
                         self.G.probabilities[S][element.P]
                         + self._cost_lists_derivation[args][element.combination + 1]
                     )
-                    heappush(
-                        queue, Derivation(next_cost, element.combination + 1, element.P)
-                    )
-                    no_successor = False
+                    if self.max_cost is None or next_cost < self.max_cost:
+                        heappush(
+                            queue,
+                            Derivation(next_cost, element.combination + 1, element.P),
+                        )
+                        no_successor = False
                 if is_empty:
                     continue
                 # Generate programs
@@ -369,6 +421,10 @@ class CDSearch(
                     # print("S", S, "P", element.P, "index:", element.combination, "args:", possibles)
                     for new_args in product(*possibles):
                         new_program: Program = Function(element.P, list(new_args))
+                        if bounded and not self._within_bounds_(
+                            new_program.size(), new_program.depth()
+                        ):
+                            continue
                         if new_program in self._deleted:
                             continue
                         elif not self._should_keep_subprogram(new_program):
@@ -388,12 +444,14 @@ class CDSearch(
                 has_generated_program = True
                 yield new_program
         if not has_generated_program:
-            if not no_successor:
+            # All programs may have been pruned while larger cost indices are left
+            if not no_successor or len(queue) > 0:
                 self._failed_by_empties = True
                 self._empties_nt[S].add(cost_index)
         if len(queue) > 0:
             next_cost = queue[0].cost
-            self._cost_lists_nt[S].append(next_cost)
+            if self.max_cost is None or next_cost < self.max_cost:
+                self._cost_lists_nt[S].append(next_cost)
 
     def _query_list_(
         self, S: Tuple[Type, U], cost_index: int
@@ -434,14 +492,28 @@ class CDSearch(
 
     def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "CDSearch[U, V, W]":
         assert isinstance(G, ProbDetGrammar)
-        enum = self.__class__(G)
+        enum = self.__class__(
+            G,
+            max_cost=self.max_cost,
+            max_size=self.max_size,
+            max_depth=self.max_depth,
+        )
         enum._deleted = self._deleted.copy()
         return enum
 
 
 def enumerate_prob_grammar(
-    G: ProbDetGrammar[U, V, W], k: int = 10, precision: float = 1e-5
+    G: ProbDetGrammar[U, V, W],
+    k: int = 10,
+    precision: float = 1e-5,
+    threshold: float = 0,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
 ) -> CDSearch[U, V, W]:
+    """
+    Enumerate the programs of G by decreasing probability, costs are rounded to the given precision.
+    If threshold > 0 only programs with a probability strictly higher than threshold, up to rounding, are enumerated and the enumeration terminates.
+    """
     Gp: ProbDetGrammar = ProbDetGrammar(
         G.grammar,
         {
@@ -449,4 +521,5 @@ def enumerate_prob_grammar(
             for S, val in G.probabilities.items()
         },
     )
-    return CDSearch(Gp, k=k)
+    max_cost = -np.log(threshold) / precision if threshold > 0 else None
+    return CDSearch(Gp, k=k, max_cost=max_cost, max_size=max_size, max_depth=max_depth)
@@ -1,5 +1,6 @@
+from array import array
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Union, Any
+from typing import List, Optional
 
 
 @dataclass(order=True, frozen=True)
@@ -21,20 +22,32 @@ class CDQueue:
         push*
         update
 
+    The queue is a ring of k + 1 cells, each cell covers an interval of costs of width maxi / (k + 1).
+    Elements pushed must cost at most maxi more than the cheapest element and no less than the last popped element.
+    A cell holds one element, elements whose costs differ by at most 1 are merged into one CostTuple,
+    otherwise the cell is split into k + 1 cells covering its interval and so on.
+    Cells are stored by blocks of k + 1 slots in flat arrays, block 0 is the ring,
+    so push, pop and peek only walk down the split cells and size() is O(1).
     """
 
     def __init__(self, maxi: int, k: int) -> None:
         # multiply otherwise when you get exactly maxi then it is equal to 0
-        self.maxi = maxi * (k + 1) / k
+        # maxi is 0 when all costs are equal but it must be positive to split costs into cells
+        self.maxi = max(maxi, 1) * (k + 1) / k
         self.k = k + 1
         self.mini: Optional[float] = None
-        self.cells: List[Tuple[int, Optional[Union[CostTuple, Any]]]] = [
-            (0, None) for _ in range(self.k)
-        ]
         self.translation = 0
         self.nelements = 0
         self.start: Optional[float] = None
         self.n = 0
+        # slot -> number of elements in the cell
+        self._counts = array("q")
+        # slot -> block of the cell if it is split, -1 otherwise
+        self._blocks = array("q")
+        # slot -> element if the cell holds exactly one element
+        self._values: List[Optional[CostTuple]] = []
+        # blocks that can be reused
+        self._free: List[int] = []
         self.clear()
 
     def update(self) -> None:
@@ -42,11 +55,12 @@ class CDQueue:
         Update its internal representation, should be done after all elements have been pushed.
         """
         if self.nelements > 0:
-            while self.cells[self.translation][0] == 0:
+            counts = self._counts
+            while counts[self.translation] == 0:
                 self.translation = (self.translation + 1) % self.k
                 self.n += 1
             if self.nelements == 1:
-                self.mini = self.cells[self.translation][1].cost  # type: ignore
+                self.mini = self._values[self.translation].cost  # type: ignore
                 self.start = self.mini
                 self.n = 0
             else:
@@ -57,176 +71,123 @@ class CDQueue:
         Clear this queue of all of its elements.
         """
         self.mini = None
-        self.cells = [(0, None) for _ in range(self.k)]
         self.translation = 0
         self.nelements = 0
         self.start = None
         self.n = 0
+        self._counts = array("q", [0] * self.k)
+        self._blocks = array("q", [-1] * self.k)
+        self._values = [None] * self.k
+        self._free = []
+
+    def __new_block__(self) -> int:
+        if self._free:
+            return self._free.pop()
+        block = len(self._counts) // self.k
+        self._counts.extend([0] * self.k)
+        self._blocks.extend([-1] * self.k)
+        self._values.extend([None] * self.k)
+        return block
 
     def push(self, element: CostTuple) -> None:
-        # print("PUSH")
         if self.mini is None:
             self.mini = element.cost
             self.start = self.mini
             self.n = 0
         assert element.cost - self.mini <= self.maxi
-        # a = f"[PUSH] {F.LIGHTYELLOW_EX}BEFORE{F.RESET}:{self}"
-        # print(f"[PUSH] {F.LIGHTYELLOW_EX}BEFORE{F.RESET}:", self)
-        # b = f"\t\t\t{element}"
-        # print("\t\t\t", element)
-        self.__push__(
-            element, element.cost - self.mini, self.maxi, self.cells, self.translation
-        )
-        # if x or abs(element.cost - 11.040864126152853) <= 1e-3:
-        #     print("n=", self.n, "unit:", self.maxi / self.k)
-        #     print(a)
-        #     print(b)
-        #     print(f"[PUSH] {F.GREEN}AFTER{F.RESET}:", self)
-
-    def __push__(
-        self,
-        element: CostTuple,
-        cost: float,
-        maxi: float,
-        cells: List,
-        translation: int,
-        add: bool = True,
-    ) -> None:
-        stack: List[Tuple[List[List[int]], int]] = []
+        k = self.k
+        counts, blocks, values = self._counts, self._blocks, self._values
+        cost = element.cost - self.mini
+        maxi = self.maxi
+        base, translation = 0, self.translation
+        # split cells to which the element is added
+        path: List[int] = []
         while True:
-            unit = maxi / self.k
-            lbi = int(cost / maxi * self.k)
-            index = (lbi + translation) % self.k
-            # assert cost >= 0, f"cost:{cost} element:{element} queue:{self}"
-            nelem, val = cells[index]
-            # print("\tfound:", nelem, "val=", val)
-            if nelem == 0:
-                # print("\t\tfilling...")
-                cells[index] = (1, element)
-                if add:
+            unit = maxi / k
+            lbi = int(cost / maxi * k)
+            slot = base + (lbi + translation) % k
+            block = blocks[slot]
+            if block < 0:
+                if counts[slot] == 0:
+                    counts[slot] = 1
+                    values[slot] = element
                     self.nelements += 1
-                    for c, i in stack:
-                        c[i][0] += 1
-                return
-
-            elif nelem == 1:
-                if abs(val.cost - element.cost) > 1:
-                    # print(f"\t\tsplitting with {val}... diff={abs(val.cost - element.cost)} ")
-
-                    cells[index] = [2, [(0, None) for _ in range(self.k)]]
-                    self.__push__(
-                        val,
-                        cost + val.cost - element.cost - lbi * unit,
-                        unit,
-                        cells[index][1],
-                        0,
-                        add=False,
-                    )
-                    self.__push__(
-                        element,
-                        cost - lbi * unit,
-                        unit,
-                        cells[index][1],
-                        0,
-                        add=False,
-                    )
-                    if add:
-                        self.nelements += 1
-                        for c, i in stack:
-                            c[i][0] += 1
+                    for split in path:
+                        counts[split] += 1
                     return
-                else:
+                val: CostTuple = values[slot]  # type: ignore
+                if abs(val.cost - element.cost) <= 1:
                     val.combinations.extend(element.combinations)
-                    # print("\t\tmerging...")
                     return
-            else:
-                # print("\t\trecursive...")
-                stack.append((cells, index))
-                cost = cost - lbi * unit
-                maxi = unit
-                cells = val
-                translation = 0
-        return
-
-    def __cleanup__(self, cells: List[Tuple[int, Any]], index: int) -> None:
-        # print(f"[CLEANUP] {F.LIGHTBLUE_EX}BEFORE{F.RESET}:", cells[index])
-        n, _ = cells[index]
-        if n > 1:
-            if n == 2:
-                cells[index] = (1, self.__pop__(cells[index]))
-                # print("AFTER:", self)
-            else:
-                cells[index][0] -= 1  # type: ignore
-        else:
-            cells[index] = (0, None)
-        # print("[CLEANUP] AFTER:", cells[index])
+                # split the cell and move its element down, the element pushed goes down next
+                block = self.__new_block__()
+                # the arrays may have been reallocated
+                counts, blocks, values = self._counts, self._blocks, self._values
+                val_cost = cost + val.cost - element.cost - lbi * unit
+                val_slot = block * k + int(val_cost / unit * k) % k
+                counts[val_slot] = 1
+                values[val_slot] = val
+                values[slot] = None
+                blocks[slot] = block
+            path.append(slot)
+            cost = cost - lbi * unit
+            maxi = unit
+            base, translation = block * k, 0
 
     def pop(self) -> CostTuple:
-        popped = self.__pop__(self.cells[self.translation])
-        self.__cleanup__(self.cells, self.translation)
+        counts, blocks, values = self._counts, self._blocks, self._values
+        slot = self.translation
+        path: List[int] = []
+        while blocks[slot] >= 0:
+            path.append(slot)
+            slot = blocks[slot] * self.k
+            while counts[slot] == 0:
+                slot += 1
+        popped = values[slot]
+        counts[slot] = 0
+        values[slot] = None
+        for split in reversed(path):
+            if counts[split] == 2:
+                self.__collapse__(split)
+            else:
+                counts[split] -= 1
         self.nelements -= 1
         self.last_pop = popped
         return popped  # type: ignore
 
-    def __pop__(self, cells: Tuple[int, Any]) -> Optional[CostTuple]:
-        nelems, val = cells
-        if nelems <= 1:
-            return val  # type: ignore
-        for i, elem in enumerate(val):
-            n, v = elem
-            if n > 0:
-                if n == 1:
-                    val[i] = (0, None)
-                    return v  # type: ignore
-                else:
-                    popped = self.__pop__(elem)
-                    if popped is not None:
-                        self.__cleanup__(val, i)
-                        return popped
-                    else:
-                        val[i] = (0, None)
-        return None
+    def __collapse__(self, split: int) -> None:
+        """
+        Replace the split cell which has only one element left by this element.
+        """
+        counts, values = self._counts, self._values
+        block = self._blocks[split]
+        slot = block * self.k
+        while counts[slot] == 0:
+            slot += 1
+        values[split] = values[slot]
+        counts[split] = 1
+        self._blocks[split] = -1
+        values[slot] = None
+        counts[slot] = 0
+        self._free.append(block)
 
     def peek(self) -> CostTuple:
-        # term, content = self.cells[self.translation]
-        # assert content is not None
-        popped = self.__peek__(self.cells[self.translation])
-        # assert popped is not None
-        return popped  # type: ignore
-
-    def __peek__(self, cells: Tuple) -> Optional[CostTuple]:
-        nelems, val = cells
-        if nelems <= 1:
-            return val  # type: ignore
-        for elem in val:
-            n, v = elem
-            if v is not None:
-                if n == 1:
-                    return v  # type: ignore
-                else:
-                    popped = self.__peek__(elem)
-                    if popped is not None:
-                        return popped
-        return None
+        counts, blocks = self._counts, self._blocks
+        slot = self.translation
+        while blocks[slot] >= 0:
+            slot = blocks[slot] * self.k
+            while counts[slot] == 0:
+                slot += 1
+        return self._values[slot]  # type: ignore
 
     def size(self) -> int:
-        return sum(self.__size__(el) for el in self.cells)
-
-    def __size__(self, cell: Tuple) -> int:
-        terminal, val = cell
-        if val is None:
-            return 0
-        elif terminal == 1:
-            return 1
-        else:
-            return sum(max(1, self.__size__(elem)) for elem in val)
+        return self.nelements
 
     def is_empty(self) -> bool:
         return self.nelements == 0
 
     def __repr__(self) -> str:
-        ordered = self.cells[self.translation :] + self.cells[: self.translation]
-        out = f"CDQueue[size={self.nelements}/{self.size()}, mini={self.mini}, maxi={self.mini + self.maxi * (self.k / (self.k + 1))}/{self.mini + self.maxi}, k={self.k}]\n\t{ordered}"  # type: ignore
+        out = f"CDQueue[size={self.nelements}, mini={self.mini}, maxi={self.mini + self.maxi * (self.k / (self.k + 1))}/{self.mini + self.maxi}, k={self.k}]"  # type: ignore
         return out
 
     def __len__(self) -> int:
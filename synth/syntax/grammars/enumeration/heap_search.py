@@ -1,10 +1,14 @@
+from array import array
 from collections import defaultdict
-from heapq import heappush, heappop
+from heapq import heapify, heappush, heappop
+from itertools import count
+import math
 from typing import (
     Any,
     Dict,
     Generator,
     Generic,
+    Iterable,
     List,
     Optional,
     Set,
@@ -19,6 +23,8 @@ from synth.filter.filter import Filter
 from synth.syntax.grammars.enumeration.program_enumerator import ProgramEnumerator
 from synth.syntax.grammars.tagged_u_grammar import ProbUGrammar
 from synth.syntax.program import Program, Function
+from synth.syntax.grammars.grammar import DerivableProgram
+from synth.syntax.grammars.cfg import CFG
 from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
 from synth.syntax.type_system import Type
 from synth.utils.ordered import Ordered
@@ -47,36 +53,45 @@ class HSEnumerator(
         G: ProbDetGrammar[U, V, W],
         threshold: Optional[Ordered] = None,
         filter: Optional[Filter[Program]] = None,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
     ) -> None:
-        super().__init__(filter)
+        super().__init__(filter, max_size, max_depth)
         self.current: Optional[Program] = None
         self.threshold = threshold
 
-        self.deleted: Set[Program] = set()
-
         self.G = G
         self.start = G.start
         self.rules = G.rules
         symbols = [S for S in self.rules]
 
-        # self.heaps[S] is a heap containing programs generated from the non-terminal S
-        self.heaps: Dict[Tuple[Type, U], List[HeapElement]] = {S: [] for S in symbols}
+        # programs are identified by an integer id, self._programs[id] is the program with this id
+        self._ids: Dict[Program, int] = {}
+        self._programs: List[Program] = []
+        # self._deleted[id] is 1 iff the program with this id is deleted
+        self._deleted = bytearray()
+
+        # self.heaps[S] is a heap containing the ids of programs generated from the non-terminal S
+        # elements are (priority, insertion number, id), tuples are compared much faster than HeapElement
+        # and the insertion number breaks ties so that programs are never compared
+        self.heaps: Dict[Tuple[Type, U], List[Tuple[Ordered, int, int]]] = {
+            S: [] for S in symbols
+        }
+        self._insertions = count()
 
         # the same program can be pushed in different heaps, with different probabilities
         # however, the same program cannot be pushed twice in the same heap
 
-        # self.succ[S][P] is the successor of P from S
-        self.succ: Dict[Tuple[Type, U], Dict[int, Program]] = {S: {} for S in symbols}
-        # self.pred[S][P] is the hash of the predecessor of P from S
-        self.pred: Dict[Tuple[Type, U], Dict[int, int]] = {S: {} for S in symbols}
-
-        # self.hash_table_program[S] is the set of hashes of programs
-        # ever added to the heap for S
-        self.hash_table_program: Dict[Tuple[Type, U], Set[int]] = {
-            S: set() for S in symbols
-        }
+        # self._order[S] contains the ids of the programs generated from S in order,
+        # the successor of a program from S is the next one in self._order[S] that is not deleted
+        self._order: Dict[Tuple[Type, U], array] = {S: array("q") for S in symbols}
+        # self._positions[S][id] is the index in self._order[S] of a program ever added to the heap for S
+        # or -1 if it has not been generated from S yet
+        self._positions: Dict[Tuple[Type, U], Dict[int, int]] = {S: {} for S in symbols}
 
         self._init: Set[Tuple[Type, U]] = set()
+        # In a CFG the non-terminal of an argument does not depend on the other arguments
+        self._is_cfg = isinstance(G.grammar, CFG)
 
         self.max_priority: Dict[
             Union[Tuple[Type, U], Tuple[Tuple[Type, U], Program]], Program
@@ -85,6 +100,38 @@ class HSEnumerator(
     def probability(self, program: Program) -> float:
         return self.G.probability(program)
 
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        # itertools.count can not be pickled in recent versions of Python
+        state["_insertions"] = next(self._insertions)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state["_insertions"] = count(state["_insertions"])
+        self.__dict__.update(state)
+
+    def _program_id(self, program: Program) -> int:
+        pid = self._ids.get(program)
+        if pid is None:
+            pid = len(self._programs)
+            self._ids[program] = pid
+            self._programs.append(program)
+            self._deleted.append(0)
+        return pid
+
+    @property
+    def deleted(self) -> Set[Program]:
+        """
+        The set of deleted programs, they are never generated.
+        """
+        return {self._programs[pid] for pid, flag in enumerate(self._deleted) if flag}
+
+    @deleted.setter
+    def deleted(self, programs: Iterable[Program]) -> None:
+        self._deleted = bytearray(len(self._programs))
+        for program in programs:
+            self._deleted[self._program_id(program)] = 1
+
     @classmethod
     def name(cls) -> str:
         return "heap-search"
@@ -93,25 +140,88 @@ class HSEnumerator(
         """
         A generator which outputs the next most probable program
         """
-        self.__init_non_terminal__(self.G.start)
-        self._reevaluate_()
-        # Now we can init the heaps
-        for S in self.G.rules:
-            self.__init_heap__(S)
-        # And now that ALL heaps have been init
-        # Query(S, None) for all
-        for S in self.G.rules:
-            self.query(S, None)
+        # Otherwise the enumeration was already started and we continue after self.current
+        if self.current is None:
+            self.__init_non_terminal__(self.G.start)
+            self._reevaluate_()
+            # Now we can init the heaps
+            for S in self.G.rules:
+                self.__init_heap__(S)
+            # And now that ALL heaps have been init
+            # Query(S, None) for all
+            for S in self.G.rules:
+                self.query(S, None)
         while True:
             program = self.query(self.start, self.current)
             if program is None:
                 return
             self.current = program
             if not self._should_keep_subprogram(program):
-                self.deleted.add(program)
+                self._deleted[self._ids[program]] = 1
                 continue
             yield program
 
+    def update_probabilities(
+        self, grammar: Union[ProbDetGrammar, ProbUGrammar]
+    ) -> bool:
+        """
+        The banks self._order are kept and the programs in the heaps are pushed again with their new priorities,
+        so the enumeration continues after self.current and programs already generated are not generated again.
+        The priorities of the programs in the banks are computed again too since their successors are built from them.
+        The programs already in the banks keep their previous order, so the remaining programs are enumerated
+        in the order of the new probabilities only up to the successors of these programs.
+        Programs dropped by the threshold with the previous probabilities are not considered again.
+        """
+        assert isinstance(grammar, ProbDetGrammar)
+        assert grammar.grammar is self.G.grammar, "the rules must not change"
+        self.G = grammar
+        self._reset_priorities_()
+        rescored: Set[Tuple[Tuple[Type, U], int]] = set()
+        for S, order in self._order.items():
+            for pid in order:
+                self.__rescore__(S, self._programs[pid], rescored)
+        for S, heap in self.heaps.items():
+            elements = []
+            for _, insertion, pid in heap:
+                priority = self.__rescore__(S, self._programs[pid], rescored)
+                if not self.threshold or priority < self.threshold:
+                    elements.append((priority, insertion, pid))
+            heapify(elements)
+            self.heaps[S] = elements
+        return True
+
+    def __rescore__(
+        self,
+        S: Tuple[Type, U],
+        program: Program,
+        rescored: Set[Tuple[Tuple[Type, U], int]],
+    ) -> Ordered:
+        """
+        Compute the priority of program from S with the current probabilities, computing first the priorities of its arguments.
+        rescored contains the (S, id) pairs whose priority has already been computed.
+        """
+        key = (S, self._program_id(program))
+        if isinstance(program, Function) and key not in rescored:
+            F = program.function
+            information, lst = self.G.derive_all(self.G.start_information(), S, F)
+            S2 = lst[-1]
+            args_len = self.G.arguments_length_for(S, F)  # type: ignore
+            for i in range(args_len):
+                self.__rescore__(S2, program.arguments[i], rescored)
+                if i + 1 < args_len:
+                    information, lst = self.G.derive_all(
+                        information, S2, program.arguments[i]
+                    )
+                    S2 = lst[-1]
+        rescored.add(key)
+        return self.compute_priority(S, program)
+
+    def _reset_priorities_(self) -> None:
+        """
+        Forget the priorities computed with the previous probabilities.
+        """
+        pass
+
     def __compute_max_prio__(
         self,
         S: Tuple[Type, U],
@@ -176,33 +286,24 @@ class HSEnumerator(
         # 2) add P(max(S1),max(S2), ...) to self.heaps[S]
         for P in self.rules[S]:
             program = self.max_priority[(S, P)]
-            hash_program = hash(program)
+            pid = self._program_id(program)
             # Remark: the program cannot already be in self.heaps[S]
-            assert hash_program not in self.hash_table_program[S]
+            assert pid not in self._positions[S]
             # Init heap all others so that query will work
-            self.hash_table_program[S].add(hash_program)
+            self._positions[S][pid] = -1
             # we assume that the programs from max_probability
             # are represented by the same object
             priority = self.compute_priority(S, program)
             if not self.threshold or priority < self.threshold:
-                heappush(
-                    self.heaps[S],
-                    HeapElement(priority, program),
-                )
+                heappush(self.heaps[S], (priority, next(self._insertions), pid))
 
     def merge_program(self, representative: Program, other: Program) -> None:
         """
         Merge other into representative.
         In other words, other will no longer be generated through heap search
         """
-        our_hash = hash(other)
-        self.deleted.add(other)
-        for S in self.G.rules:
-            if our_hash in self.pred[S] and our_hash in self.succ[S]:
-                pred_hash = self.pred[S][our_hash]
-                nxt = self.succ[S][our_hash]
-                self.succ[S][pred_hash] = nxt
-                self.pred[S][hash(nxt)] = pred_hash
+        # query skips deleted programs so there is nothing else to update
+        self._deleted[self._program_id(other)] = 1
 
     def __add_successors__(self, succ: Program, S: Tuple[Type, U]) -> None:
         if isinstance(succ, Function):
@@ -217,81 +318,115 @@ class HSEnumerator(
                     new_arguments = succ.arguments[:]
                     new_arguments[i] = succ_sub_program
                     new_program = Function(F, new_arguments)
-                    hash_new_program = hash(new_program)
-                    if (
-                        hash_new_program not in self.hash_table_program[S]
-                        and new_program not in self.deleted
-                    ):
-                        self.hash_table_program[S].add(hash_new_program)
-                        try:
+                    pid = self._program_id(new_program)
+                    positions = self._positions[S]
+                    if pid not in positions and not self._deleted[pid]:
+                        positions[pid] = -1
+                        if self._is_cfg or self.__arguments_queued__(S, new_program):
                             priority: Ordered = self.compute_priority(S, new_program)
                             if not self.threshold or priority < self.threshold:
                                 heappush(
-                                    self.heaps[S], HeapElement(priority, new_program)
+                                    self.heaps[S],
+                                    (priority, next(self._insertions), pid),
                                 )
-                        except KeyError:
-                            pass
                 if i + 1 < args_len:
                     information, lst = self.G.derive_all(
                         information, S2, succ.arguments[i]
                     )
                     S2 = lst[-1]
 
+    def __arguments_queued__(self, S: Tuple[Type, U], program: Function) -> bool:
+        """
+        Returns True iff every argument of program has been queued from the non-terminal it is derived from, so that its priority is known.
+        In grammars such as size constrained ones the non-terminal of an argument depends on the previous arguments,
+        replacing an argument by its successor can then make the next arguments not derivable.
+        """
+        F = program.function
+        information, lst = self.G.derive_all(self.G.start_information(), S, F)
+        S2 = lst[-1]
+        args_len = self.G.arguments_length_for(S, F)  # type: ignore
+        for i in range(args_len):
+            arg = program.arguments[i]
+            pid = self._ids.get(arg)
+            if pid is None or pid not in self._positions.get(S2, {}):
+                return False
+            if i + 1 < args_len:
+                information, lst = self.G.derive_all(information, S2, arg)
+                S2 = lst[-1]
+        return True
+
     def query(self, S: Tuple[Type, U], program: Optional[Program]) -> Optional[Program]:
         """
         computing the successor of program from S
         """
-        if program:
-            hash_program = hash(program)
+        order = self._order[S]
+        if program is None:
+            index = 0
         else:
-            hash_program = 123891
+            # the first program of S must be generated first otherwise it would be taken as the successor of program
+            if not order:
+                self.query(S, None)
+            program_id = self._ids.get(program)
+            position = (
+                -1 if program_id is None else self._positions[S].get(program_id, -1)
+            )
+            index = position + 1 if position >= 0 else len(order)
 
-        # if we have already computed the successor of program from S, we return its stored value
-        if hash_program in self.succ[S]:
-            return self.succ[S][hash_program]
+        # if we have already computed the successor of program from S, we return it
+        deleted = self._deleted
+        while index < len(order):
+            pid: int = order[index]
+            if not deleted[pid]:
+                return self._programs[pid]
+            index += 1
 
         # otherwise the successor is the next element in the heap
-        try:
-            element = heappop(self.heaps[S])
-            succ = element.program
-            while succ in self.deleted:
+        heap = self.heaps[S]
+        bounded = self._is_bounded_()
+        while heap:
+            pid = heappop(heap)[2]
+            succ = self._programs[pid]
+            # programs out of bounds are skipped like deleted ones so they are never used as arguments
+            if deleted[pid] or (
+                bounded and not self._within_bounds_(succ.size(), succ.depth())
+            ):
                 self.__add_successors__(succ, S)
-                element = heappop(self.heaps[S])
-                succ = element.program
-        except:
-            return None  # the heap is empty: there are no successors from S
-
-        self.succ[S][hash_program] = succ  # we store the successor
-        self.pred[S][hash(succ)] = hash_program  # we store the predecessor
-
-        # now we need to add all potential successors of succ in heaps[S]
-        self.__add_successors__(succ, S)
-        return succ
+                continue
+            self._positions[S][pid] = len(order)
+            order.append(pid)
+            # now we need to add all potential successors of succ in heaps[S]
+            self.__add_successors__(succ, S)
+            return succ
+        return None  # the heap is empty: there are no successors from S
 
     @abstractmethod
     def compute_priority(self, S: Tuple[Type, U], new_program: Program) -> Ordered:
         pass
 
     def programs_in_banks(self) -> int:
-        return sum(len(val) for val in self.succ.values())
+        return sum(len(order) for order in self._order.values())
 
     def programs_in_queues(self) -> int:
         return sum(len(val) for val in self.heaps.values())
 
-    def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "HSEnumerator[U, V, W]":
-        assert isinstance(G, ProbDetGrammar)
-        enum = self.__class__(G, self.threshold)
-        enum.deleted = self.deleted.copy()
-        return enum
-
 
 class HeapSearch(HSEnumerator[U, V, W]):
-    def __init__(self, G: ProbDetGrammar[U, V, W], threshold: float = 0) -> None:
-        super().__init__(G, -threshold)
+    def __init__(
+        self,
+        G: ProbDetGrammar[U, V, W],
+        threshold: float = 0,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> None:
+        super().__init__(G, -threshold, max_size=max_size, max_depth=max_depth)
+        self.threshold_probability = threshold
         self.probabilities: Dict[Program, Dict[Tuple[Type, U], float]] = defaultdict(
-            lambda: {}
+            dict
         )
 
+    def _reset_priorities_(self) -> None:
+        self.probabilities.clear()
+
     def compute_priority(self, S: Tuple[Type, U], new_program: Program) -> float:
         if new_program in self.probabilities and S in self.probabilities[new_program]:
             return -self.probabilities[new_program][S]
@@ -314,11 +449,155 @@ class HeapSearch(HSEnumerator[U, V, W]):
         self.probabilities[new_program][S] = probability
         return -probability
 
+    def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "HeapSearch[U, V, W]":
+        assert isinstance(G, ProbDetGrammar)
+        enum = self.__class__(
+            G, self.threshold_probability, self.max_size, self.max_depth
+        )
+        enum.deleted = self.deleted
+        return enum
+
 
 def enumerate_prob_grammar(
-    G: ProbDetGrammar[U, V, W], threshold: float = 0
+    G: ProbDetGrammar[U, V, W],
+    threshold: float = 0,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
 ) -> HeapSearch[U, V, W]:
-    return HeapSearch(G, threshold)
+    return HeapSearch(G, threshold, max_size, max_depth)
+
+
+# Cost of rules with probability 0, larger than the cost of any program with a non zero probability
+_ZERO_PROBABILITY_COST = 1 << 62
+
+
+def __cost__(probability: float, precision: float) -> int:
+    if probability <= 0:
+        return _ZERO_PROBABILITY_COST
+    return round(-math.log(probability) * precision)
+
+
+class CostHeapSearch(HSEnumerator[U, V, W]):
+    """
+    Heap search where the priority of a program is its cost: the sum of the costs of the rules used to derive it.
+    The cost of a rule is its negative log probability scaled by precision and rounded to an integer.
+    Priorities are then integers, which do not underflow on deep programs and are cheap to add and compare.
+    Programs whose log probabilities differ by less than about 1 / precision may be enumerated in any order.
+
+    Parameters:
+    -----------
+    - threshold: only programs with a probability greater than threshold are enumerated, 0 means no threshold
+    - precision: scaling factor of the log probabilities before rounding them
+    - max_size, max_depth: programs larger than max_size or deeper than max_depth are pruned, None means no bound
+    """
+
+    def __init__(
+        self,
+        G: ProbDetGrammar[U, V, W],
+        threshold: float = 0,
+        precision: float = 2**20,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> None:
+        super().__init__(
+            G,
+            __cost__(threshold, precision) if threshold > 0 else None,
+            max_size=max_size,
+            max_depth=max_depth,
+        )
+        self.precision = precision
+        self.threshold_probability = threshold
+        self.rule_costs: Dict[Tuple[Type, U], Dict[DerivableProgram, int]] = {}
+        # self._costs[id][S] is the cost from S of the program with this id
+        self._costs: List[Dict[Tuple[Type, U], int]] = []
+        self._reset_priorities_()
+        # In a CFG the non-terminals of the arguments of P from S do not depend on the arguments
+        # so they are computed once instead of deriving the arguments each time
+        self._arguments: Optional[
+            Dict[Tuple[Type, U], Dict[DerivableProgram, List[Tuple[Type, U]]]]
+        ] = None
+        if isinstance(G.grammar, CFG):
+            cfg: CFG = G.grammar
+            self._arguments = {
+                S: {  # type: ignore
+                    P: [(t, (state, None)) for t, state in cfg.rules[S][P][0]]  # type: ignore
+                    for P in cfg.rules[S]
+                }
+                for S in cfg.rules
+            }
+
+    @classmethod
+    def name(cls) -> str:
+        return "cost-heap-search"
+
+    def _reset_priorities_(self) -> None:
+        self.rule_costs = {
+            S: {
+                P: __cost__(p, self.precision)
+                for P, p in self.G.probabilities[S].items()
+            }
+            for S in self.G.rules
+        }
+        self._costs = []
+
+    def cost(self, S: Tuple[Type, U], program: Program) -> Optional[int]:
+        """
+        Returns the cost of the program from S if it has already been computed, None otherwise.
+        """
+        pid = self._ids.get(program)
+        if pid is None or pid >= len(self._costs):
+            return None
+        return self._costs[pid].get(S)
+
+    def compute_priority(self, S: Tuple[Type, U], new_program: Program) -> int:
+        pid = self._program_id(new_program)
+        if pid >= len(self._costs):
+            self._costs.extend({} for _ in range(pid + 1 - len(self._costs)))
+        else:
+            cost = self._costs[pid].get(S)
+            if cost is not None:
+                return cost
+        if isinstance(new_program, Function):
+            F = new_program.function
+            new_arguments = new_program.arguments
+            cost = self.rule_costs[S][F]  # type: ignore
+            if self._arguments is not None:
+                for arg, S2 in zip(new_arguments, self._arguments[S][F]):  # type: ignore
+                    cost += self._costs[self._ids[arg]][S2]
+            else:
+                information, lst = self.G.derive_all(self.G.start_information(), S, F)
+                S2 = lst[-1]
+                args_len = self.G.arguments_length_for(S, F)  # type: ignore
+                for i in range(args_len):
+                    arg = new_arguments[i]
+                    cost += self._costs[self._ids[arg]][S2]
+                    if i + 1 < args_len:
+                        information, lst = self.G.derive_all(information, S2, arg)
+                        S2 = lst[-1]
+        else:
+            cost = self.rule_costs[S][new_program]  # type: ignore
+        self._costs[pid][S] = cost
+        return cost
+
+    def clone(
+        self, G: Union[ProbDetGrammar, ProbUGrammar]
+    ) -> "CostHeapSearch[U, V, W]":
+        assert isinstance(G, ProbDetGrammar)
+        enum = self.__class__(
+            G, self.threshold_probability, self.precision, self.max_size, self.max_depth
+        )
+        enum.deleted = self.deleted
+        return enum
+
+
+def enumerate_cost_prob_grammar(
+    G: ProbDetGrammar[U, V, W],
+    threshold: float = 0,
+    precision: float = 2**20,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
+) -> CostHeapSearch[U, V, W]:
+    return CostHeapSearch(G, threshold, precision, max_size, max_depth)
 
 
 class Bucket(Ordered):
@@ -395,13 +674,22 @@ class Bucket(Ordered):
 
 
 class BucketSearch(HSEnumerator[U, V, W]):
-    def __init__(self, G: ProbDetGrammar[U, V, W], bucket_size: int) -> None:
-        super().__init__(G)
+    def __init__(
+        self,
+        G: ProbDetGrammar[U, V, W],
+        bucket_size: int,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> None:
+        super().__init__(G, max_size=max_size, max_depth=max_depth)
         self.bucket_tuples: Dict[Program, Dict[Tuple[Type, U], Bucket]] = defaultdict(
-            lambda: {}
+            dict
         )
         self.bucket_size = bucket_size
 
+    def _reset_priorities_(self) -> None:
+        self.bucket_tuples.clear()
+
     def compute_priority(self, S: Tuple[Type, U], new_program: Program) -> Bucket:
         new_bucket = Bucket(self.bucket_size)
         if isinstance(new_program, Function):
@@ -422,8 +710,17 @@ class BucketSearch(HSEnumerator[U, V, W]):
         self.bucket_tuples[new_program][S] = new_bucket
         return new_bucket
 
+    def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "BucketSearch[U, V, W]":
+        assert isinstance(G, ProbDetGrammar)
+        enum = self.__class__(G, self.bucket_size, self.max_size, self.max_depth)
+        enum.deleted = self.deleted
+        return enum
+
 
 def enumerate_bucket_prob_grammar(
-    G: ProbDetGrammar[U, V, W], bucket_size: int
+    G: ProbDetGrammar[U, V, W],
+    bucket_size: int,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
 ) -> BucketSearch[U, V, W]:
-    return BucketSearch(G, bucket_size)
+    return BucketSearch(G, bucket_size, max_size, max_depth)
@@ -0,0 +1,279 @@
+from array import array
+from itertools import product
+import sys
+from typing import Dict, Generic, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from synth.syntax.grammars.grammar import DerivableProgram
+from synth.syntax.program import Function, Program
+from synth.syntax.type_system import Type
+
+U = TypeVar("U")
+
+
+class ProgramBank(Generic[U]):
+    """
+    Bank of programs for bottom-up enumerators.
+
+    Each program is stored as an entry id, entries are grouped by non-terminal and cost index in buckets which are arrays of entry ids.
+    By default the program of each entry is built once when it is added and kept, so program() costs a lookup.
+    If compact is True programs are not kept, instead each entry is stored as the id of its derivation rule and the entry ids of its arguments in flat arrays
+    and its program is built each time it is asked for with program(),
+    then the memory used scales with the number of entries and not with the size of programs at the price of a slower enumeration.
+    If track_bounds is True the size and depth of the program of each entry are also stored, see bounds().
+    """
+
+    def __init__(self, track_bounds: bool = False, compact: bool = False) -> None:
+        self._rules: List[DerivableProgram] = []
+        self._rule_ids: Dict[DerivableProgram, int] = {}
+        # entry -> program, only if not compact
+        self._programs: Optional[List[Program]] = None if compact else []
+        # entry -> rule id, only if compact
+        self._entry_rule: Optional["array[int]"] = array("i") if compact else None
+        # entry -> start of its arguments in _args, the end is the start of the next entry, only if compact
+        self._args_start: Optional["array[int]"] = array("q", [0]) if compact else None
+        self._args: Optional["array[int]"] = array("q") if compact else None
+        # entry -> size and depth of its program, only if track_bounds
+        self._entry_size: Optional[array] = array("i") if track_bounds else None
+        self._entry_depth: Optional[array] = array("i") if track_bounds else None
+        # entry -> position in its bucket
+        self._entry_position = array("q")
+        # S -> cost_index -> entry ids
+        self._buckets: Dict[Tuple[Type, U], Dict[int, array]] = {}
+        # program or (rule id, argument entries) if compact -> entries with their bucket, built by the first call to remove()
+        self._index: Optional[Dict[object, List[Tuple[int, array]]]] = None
+        self._removed: Set[int] = set()
+
+    def __len__(self) -> int:
+        """
+        Number of programs currently in the buckets.
+        """
+        return sum(
+            sum(len(bucket) for bucket in buckets.values())
+            for buckets in self._buckets.values()
+        )
+
+    @property
+    def compact(self) -> bool:
+        return self._programs is None
+
+    def nbytes(self) -> int:
+        """
+        Number of bytes used by the arrays of this bank, programs kept when the bank is not compact are not counted.
+        """
+        arrays: List[array] = [self._entry_position]
+        for arr in [
+            self._entry_rule,
+            self._args_start,
+            self._args,
+            self._entry_size,
+            self._entry_depth,
+        ]:
+            if arr is not None:
+                arrays.append(arr)
+        total = sum(arr.itemsize * len(arr) for arr in arrays)
+        for buckets in self._buckets.values():
+            total += sum(bucket.itemsize * len(bucket) for bucket in buckets.values())
+        return total
+
+    def bucket(self, S: Tuple[Type, U], cost_index: int) -> Optional[array]:
+        """
+        Returns the entry ids of S with the given cost index or None if there is no such bucket.
+        """
+        return self._buckets.get(S, {}).get(cost_index, None)
+
+    def last_cost_index(self, S: Tuple[Type, U]) -> int:
+        """
+        Returns the largest cost index of the buckets of S or -1 if S has no bucket.
+        """
+        buckets = self._buckets.get(S, None)
+        return max(buckets) if buckets else -1
+
+    def add_bucket(self, S: Tuple[Type, U], cost_index: int) -> array:
+        """
+        Returns the entry ids of S with the given cost index, creating an empty bucket if needed.
+        """
+        buckets = self._buckets.setdefault(S, {})
+        if cost_index not in buckets:
+            buckets[cost_index] = array("q")
+        return buckets[cost_index]
+
+    def add(
+        self,
+        S: Tuple[Type, U],
+        cost_index: int,
+        P: DerivableProgram,
+        args: Sequence[int],
+        program: Optional[Program] = None,
+    ) -> int:
+        """
+        Add the program P(*args) where args are entry ids to the bucket of S with the given cost index.
+        program is the program P(*args) if it was already built, it is then not built again.
+        Returns the id of the new entry.
+        """
+        entry = len(self._entry_position)
+        if self._entry_size is not None and self._entry_depth is not None:
+            size, depth = self.bounds(args)
+            self._entry_size.append(size)
+            self._entry_depth.append(depth)
+        if self._programs is not None:
+            if program is None:
+                program = self.build(P, args)
+            self._programs.append(program)
+        else:
+            self._add_compact_(P, args)
+        bucket = self.add_bucket(S, cost_index)
+        self._entry_position.append(len(bucket))
+        bucket.append(entry)
+        if self._index is not None:
+            self._index.setdefault(self._key_(entry), []).append((entry, bucket))
+        return entry
+
+    def _add_compact_(self, P: DerivableProgram, args: Sequence[int]) -> None:
+        assert (
+            self._entry_rule is not None
+            and self._args is not None
+            and self._args_start is not None
+        )
+        rule_id = self._rule_ids.get(P, None)
+        if rule_id is None:
+            rule_id = len(self._rules)
+            self._rules.append(P)
+            self._rule_ids[P] = rule_id
+        self._entry_rule.append(rule_id)
+        self._args.extend(args)
+        self._args_start.append(len(self._args))
+
+    def bounds(self, args: Sequence[int]) -> Tuple[int, int]:
+        """
+        Returns the size and depth of the program P(*args) where args are entry ids, without building it.
+        Only available if this bank was created with track_bounds.
+        """
+        assert self._entry_size is not None and self._entry_depth is not None
+        size, depth = 1, 0
+        for arg in args:
+            size += self._entry_size[arg]
+            if self._entry_depth[arg] > depth:
+                depth = self._entry_depth[arg]
+        return size, depth + 1
+
+    def min_bounds(self, S: Tuple[Type, U]) -> Tuple[List[int], List[int]]:
+        """
+        Returns for each cost index up to last_cost_index(S) the smallest size and depth of the programs of S with this cost index or a larger one.
+        Only available if this bank was created with track_bounds.
+        """
+        assert self._entry_size is not None and self._entry_depth is not None
+        last_index = self.last_cost_index(S)
+        sizes, depths = [0] * (last_index + 1), [0] * (last_index + 1)
+        size, depth = sys.maxsize, sys.maxsize
+        buckets = self._buckets.get(S, {})
+        for cost_index in range(last_index, -1, -1):
+            for entry in buckets.get(cost_index, []):
+                size = min(size, self._entry_size[entry])
+                depth = min(depth, self._entry_depth[entry])
+            sizes[cost_index], depths[cost_index] = size, depth
+        return sizes, depths
+
+    def build(self, P: DerivableProgram, args: Sequence[int]) -> Program:
+        """
+        Build the program P(*args) where args are entry ids without adding it to the bank.
+        """
+        if len(args) == 0:
+            return P
+        return Function(P, [self.program(arg) for arg in args])
+
+    def program(self, entry: int) -> Program:
+        """
+        Returns the program of the given entry, it is built if the bank is compact.
+        """
+        if self._programs is not None:
+            return self._programs[entry]
+        assert (
+            self._entry_rule is not None
+            and self._args is not None
+            and self._args_start is not None
+        )
+        P = self._rules[self._entry_rule[entry]]
+        start, end = self._args_start[entry], self._args_start[entry + 1]
+        if start == end:
+            return P
+        return Function(P, [self.program(self._args[i]) for i in range(start, end)])
+
+    def matches(self, entry: int, program: Program) -> bool:
+        """
+        Returns True iff the given entry represents program, without building the entry.
+        """
+        if self._programs is not None:
+            return self._programs[entry] == program
+        assert (
+            self._entry_rule is not None
+            and self._args is not None
+            and self._args_start is not None
+        )
+        start, end = self._args_start[entry], self._args_start[entry + 1]
+        P = self._rules[self._entry_rule[entry]]
+        if start == end:
+            return P == program
+        if not isinstance(program, Function) or len(program.arguments) != end - start:
+            return False
+        return P == program.function and all(
+            self.matches(self._args[start + i], arg)
+            for i, arg in enumerate(program.arguments)
+        )
+
+    def remove(self, program: Program) -> None:
+        """
+        Remove program from all buckets, each entry is replaced in its bucket by the last entry of the bucket.
+        Entries that have program as argument are kept.
+        """
+        if self._index is None:
+            self._index = {}
+            for buckets in self._buckets.values():
+                for bucket in buckets.values():
+                    for entry in bucket:
+                        self._index.setdefault(self._key_(entry), []).append(
+                            (entry, bucket)
+                        )
+        for entry, bucket in self.__entries_of__(program):
+            if entry not in self._removed:
+                self._removed.add(entry)
+                position = self._entry_position[entry]
+                last = bucket.pop()
+                if last != entry:
+                    bucket[position] = last
+                    self._entry_position[last] = position
+
+    def _key_(self, entry: int) -> object:
+        """
+        Returns the key of entry in the index used by remove().
+        """
+        if self._programs is not None:
+            return self._programs[entry]
+        assert (
+            self._entry_rule is not None
+            and self._args is not None
+            and self._args_start is not None
+        )
+        start, end = self._args_start[entry], self._args_start[entry + 1]
+        return (self._entry_rule[entry], tuple(self._args[start:end]))
+
+    def __entries_of__(self, program: Program) -> List[Tuple[int, array]]:
+        """
+        Returns the entries representing program with their bucket, including removed entries.
+        """
+        assert self._index is not None
+        if self._programs is not None:
+            return self._index.get(program, [])
+        if isinstance(program, Function):
+            P, arguments = program.function, program.arguments
+        else:
+            P, arguments = program, []
+        rule_id = self._rule_ids.get(P, None)  # type: ignore
+        if rule_id is None:
+            return []
+        args_entries = [
+            [entry for entry, _ in self.__entries_of__(arg)] for arg in arguments
+        ]
+        out = []
+        for args in product(*args_entries):
+            out += self._index.get((rule_id, args), [])
+        return out
@@ -1,6 +1,10 @@
+from itertools import islice
+import os
 from typing import (
     Generator,
     Generic,
+    Iterable,
+    List,
     Optional,
     TypeVar,
     Union,
@@ -11,6 +15,7 @@ from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
 from synth.syntax.grammars.tagged_u_grammar import ProbUGrammar
 from synth.syntax.program import Program
 from synth.filter import Filter
+from synth.utils.data_storage import load_object, save_object
 
 
 U = TypeVar("U")
@@ -21,11 +26,22 @@ class ProgramEnumerator(ABC, Generic[U]):
     Object that enumerates over programs.
     When a program is generated a feedback of type U is expected.
     If U is None then no feedback is expected.
+
+    Programs whose size is larger than max_size or whose depth is larger than max_depth are pruned:
+    they are neither generated nor used as subprograms.
+    This bounds the memory used, however on an infinite grammar enumeration only terminates if a cost or probability cutoff is also set.
     """
 
-    def __init__(self, filter: Optional[Filter[Program]] = None) -> None:
+    def __init__(
+        self,
+        filter: Optional[Filter[Program]] = None,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> None:
         super().__init__()
         self.filter = filter
+        self.max_size = max_size
+        self.max_depth = max_depth
 
     @classmethod
     @abstractmethod
@@ -39,10 +55,82 @@ class ProgramEnumerator(ABC, Generic[U]):
     def __iter__(self) -> Generator[Program, U, None]:
         return self.generator()
 
+    def save(self, path: str, codec: str = "none") -> None:
+        """
+        Save the state of this enumerator in the specified file, it can be restored with ProgramEnumerator.load().
+        The generator() of the restored enumerator continues from the first program that has not yet been generated,
+        thus this should be called between two programs and not while another generator of this enumerator is running.
+        The filter is not saved.
+
+        The state is saved in the binary format compressed with the given codec (see synth.utils.data_storage.available_codecs()).
+        The file is replaced atomically so that an interrupted save keeps the previous state.
+        """
+        tmp_path = path + ".tmp"
+        filter = self.filter
+        self.filter = None
+        try:
+            save_object(tmp_path, self, codec=codec)
+        finally:
+            self.filter = filter
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls, path: str, filter: Optional[Filter[Program]] = None
+    ) -> "ProgramEnumerator[U]":
+        """
+        Load an enumerator saved with ProgramEnumerator.save() and set its filter.
+        """
+        enumerator = load_object(path)
+        assert isinstance(
+            enumerator, cls
+        ), f"expected a {cls.__name__} but {path} contains a {type(enumerator).__name__}"
+        enumerator.filter = filter
+        return enumerator
+
+    def batches(self, size: int = 100) -> Generator[List[Program], None, None]:
+        """
+        Generator of the enumerated programs grouped in lists of at most size programs, in the order of generator().
+        This cuts the overhead per program for consumers that process programs in bulk, for example to check a timeout once per batch.
+        All programs of a batch are enumerated before it is returned, so no feedback can be sent and merge_program only affects the next batches.
+        """
+        gen = self.generator()
+        batch = list(islice(gen, size))
+        while batch:
+            yield batch
+            batch = list(islice(gen, size))
+
+    def _batches_from_buckets_(
+        self, buckets: Iterable[List[Program]], size: int
+    ) -> Generator[List[Program], None, None]:
+        """
+        Groups consecutive buckets of programs into batches of at most size programs.
+        Buckets are never split unless they contain more than size programs.
+        """
+        batch: List[Program] = []
+        for bucket in buckets:
+            if batch and len(batch) + len(bucket) > size:
+                yield batch
+                batch = []
+            if len(bucket) > size:
+                for start in range(0, len(bucket) - size, size):
+                    yield bucket[start : start + size]
+                batch = bucket[start + size :]
+            else:
+                batch += bucket
+        if batch:
+            yield batch
+
     @abstractmethod
     def programs_in_banks(self) -> int:
         pass
 
+    def bytes_in_banks(self) -> int:
+        """
+        Number of bytes used to store the programs in banks or -1 if this enumerator does not track it.
+        """
+        return -1
+
     @abstractmethod
     def programs_in_queues(self) -> int:
         pass
@@ -62,9 +150,28 @@ class ProgramEnumerator(ABC, Generic[U]):
         """
         pass
 
+    def update_probabilities(
+        self, grammar: Union[ProbDetGrammar, ProbUGrammar]
+    ) -> bool:
+        """
+        Replace in place the grammar of this enumerator with grammar which has the same rules but different probabilities.
+        The work done so far is reused and programs already generated are not generated again.
+        A generator() created afterwards enumerates the remaining programs according to the new probabilities.
+        Returns False if this enumerator does not support it, in that case it is left unchanged and clone() should be used instead.
+        """
+        return False
+
     def _should_keep_subprogram(self, program: Program) -> bool:
         return self.filter is None or self.filter.accept(program)
 
+    def _is_bounded_(self) -> bool:
+        return self.max_size is not None or self.max_depth is not None
+
+    def _within_bounds_(self, size: int, depth: int) -> bool:
+        return (self.max_size is None or size <= self.max_size) and (
+            self.max_depth is None or depth <= self.max_depth
+        )
+
     @abstractmethod
     def clone(
         self, grammar: Union[ProbDetGrammar, ProbUGrammar]
@@ -1,11 +1,14 @@
 from collections import defaultdict
 from dataclasses import dataclass, field
 from heapq import heappush, heappop
+from itertools import chain
 from typing import (
+    Any,
     Callable,
     Dict,
     Generator,
     Generic,
+    Iterable,
     List,
     Optional,
     Set,
@@ -29,6 +32,66 @@ V = TypeVar("V")
 W = TypeVar("W")
 
 
+# Hash used by query for the predecessor of the first program
+_NO_PROGRAM_HASH = 123891
+
+
+def __hash_tables_to_programs__(
+    state: Dict[str, Any], programs: Iterable[Program]
+) -> None:
+    """
+    Replace in the state of a heap search the tables indexed by hashes of programs by tables of programs,
+    since the hash of a program changes from one process to another.
+    programs must contain the programs in the heaps, the successors and deleted programs are added automatically.
+    Hashes of other programs are dropped, they are programs that were rejected by the threshold and would be rejected again.
+    """
+    by_hash: Dict[int, Optional[Program]] = {}
+    for succ in state["succ"].values():
+        for program in succ.values():
+            by_hash[hash(program)] = program
+    for program in chain(programs, state["deleted"]):
+        by_hash[hash(program)] = program
+    by_hash[_NO_PROGRAM_HASH] = None
+    state["succ"] = {
+        S: [(by_hash[h], program) for h, program in succ.items() if h in by_hash]
+        for S, succ in state["succ"].items()
+    }
+    state["pred"] = {
+        S: [
+            (by_hash[h], by_hash[p])
+            for h, p in pred.items()
+            if h in by_hash and p in by_hash
+        ]
+        for S, pred in state["pred"].items()
+    }
+    state["hash_table_program"] = {
+        S: [by_hash[h] for h in hashes if h in by_hash]
+        for S, hashes in state["hash_table_program"].items()
+    }
+
+
+def __programs_to_hash_tables__(state: Dict[str, Any]) -> None:
+    """
+    Inverse of __hash_tables_to_programs__.
+    """
+
+    def hash_or_none(program: Optional[Program]) -> int:
+        return _NO_PROGRAM_HASH if program is None else hash(program)
+
+    state["succ"] = {
+        S: {hash_or_none(program): succ for program, succ in items}
+        for S, items in state["succ"].items()
+    }
+    state["pred"] = {
+        S: {hash_or_none(program): hash_or_none(pred) for program, pred in items}
+        for S, items in state["pred"].items()
+    }
+    state["hash_table_program"] = {
+        S: {hash(program) for program in programs}
+        for S, programs in state["hash_table_program"].items()
+    }
+
+
 @dataclass(order=True, frozen=True)
 class StartHeapElement(Generic[U]):
     priority: Ordered
@@ -51,8 +114,10 @@ class UHSEnumerator(ProgramEnumerator[None], ABC, Generic[U, V, W]):
         G: ProbUGrammar[U, V, W],
         threshold: Optional[Ordered] = None,
         filter: Optional[Filter[Program]] = None,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
     ) -> None:
-        super().__init__(filter)
+        super().__init__(filter, max_size, max_depth)
         self.G = G
         symbols = [S for S in self.G.rules]
         self.threshold = threshold
@@ -89,6 +154,18 @@ class UHSEnumerator(ProgramEnumerator[None], ABC, Generic[U, V, W]):
     def name(cls) -> str:
         return "u-heap-search"
 
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        programs = [el.program for heap in self.heaps.values() for el in heap]
+        programs += [el.program for el in self._start_heap]
+        programs += list(self.max_priority.values())
+        __hash_tables_to_programs__(state, programs)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        __programs_to_hash_tables__(state)
+        self.__dict__.update(state)
+
     def programs_in_banks(self) -> int:
         return sum(len(val) for val in self.succ.values())
 
@@ -203,7 +280,9 @@ class UHSEnumerator(ProgramEnumerator[None], ABC, Generic[U, V, W]):
             return None
         elem = heappop(self._start_heap)
         self.query(elem.start, elem.program)
-        while elem.program in self.deleted:
+        while elem.program in self.deleted or not self._is_within_bounds_(elem.program):
+            if len(self._start_heap) == 0:
+                return None
             elem = heappop(self._start_heap)
             self.query(elem.start, elem.program)
         return elem.program
@@ -271,7 +350,7 @@ class UHSEnumerator(ProgramEnumerator[None], ABC, Generic[U, V, W]):
         if program:
             hash_program = hash(program)
         else:
-            hash_program = 123891
+            hash_program = _NO_PROGRAM_HASH
 
         # if we have already computed the successor of program from S, we return its stored value
         if hash_program in self.succ[S]:
@@ -281,7 +360,8 @@ class UHSEnumerator(ProgramEnumerator[None], ABC, Generic[U, V, W]):
         try:
             element = heappop(self.heaps[S])
             succ = element.program
-            while succ in self.deleted:
+            # programs out of bounds are skipped like deleted ones so they are never used as arguments
+            while succ in self.deleted or not self._is_within_bounds_(succ):
                 self.__add_successors__(succ, S)
                 element = heappop(self.heaps[S])
                 succ = element.program
@@ -309,6 +389,11 @@ class UHSEnumerator(ProgramEnumerator[None], ABC, Generic[U, V, W]):
                 self.succ[S][pred_hash] = nxt
                 self.pred[S][hash(nxt)] = pred_hash
 
+    def _is_within_bounds_(self, program: Program) -> bool:
+        return not self._is_bounded_() or self._within_bounds_(
+            program.size(), program.depth()
+        )
+
     @abstractmethod
     def compute_priority(self, S: Tuple[Type, U], new_program: Program) -> Ordered:
         pass
@@ -319,18 +404,19 @@ class UHSEnumerator(ProgramEnumerator[None], ABC, Generic[U, V, W]):
     ) -> Ordered:
         pass
 
-    def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "UHSEnumerator[U, V, W]":
-        assert isinstance(G, ProbUGrammar)
-        enum = self.__class__(G, self.threshold)
-        enum.deleted = self.deleted.copy()
-        return enum
-
 
 class UHeapSearch(UHSEnumerator[U, V, W]):
-    def __init__(self, G: ProbUGrammar[U, V, W], threshold: float = 0) -> None:
-        super().__init__(G, -threshold)
+    def __init__(
+        self,
+        G: ProbUGrammar[U, V, W],
+        threshold: float = 0,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> None:
+        super().__init__(G, -threshold, max_size=max_size, max_depth=max_depth)
+        self.threshold_probability = threshold
         self.probabilities: Dict[Program, Dict[Tuple[Type, U], float]] = defaultdict(
-            lambda: {}
+            dict
         )
 
     def adjust_priority_for_start(
@@ -377,18 +463,35 @@ class UHeapSearch(UHSEnumerator[U, V, W]):
         self.probabilities[new_program][S] = probability
         return -probability
 
+    def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "UHeapSearch[U, V, W]":
+        assert isinstance(G, ProbUGrammar)
+        enum = self.__class__(
+            G, self.threshold_probability, self.max_size, self.max_depth
+        )
+        enum.deleted = self.deleted.copy()
+        return enum
+
 
 def enumerate_prob_u_grammar(
-    G: ProbUGrammar[U, V, W], threshold: float = 0
+    G: ProbUGrammar[U, V, W],
+    threshold: float = 0,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
 ) -> UHeapSearch[U, V, W]:
-    return UHeapSearch(G, threshold)
+    return UHeapSearch(G, threshold, max_size, max_depth)
 
 
 class BucketSearch(UHSEnumerator[U, V, W]):
-    def __init__(self, G: ProbUGrammar[U, V, W], bucket_size: int) -> None:
-        super().__init__(G)
+    def __init__(
+        self,
+        G: ProbUGrammar[U, V, W],
+        bucket_size: int,
+        max_size: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ) -> None:
+        super().__init__(G, max_size=max_size, max_depth=max_depth)
         self.bucket_tuples: Dict[Program, Dict[Tuple[Type, U], Bucket]] = defaultdict(
-            lambda: {}
+            dict
         )
         self.bucket_size = bucket_size
 
@@ -438,8 +541,17 @@ class BucketSearch(UHSEnumerator[U, V, W]):
         self.bucket_tuples[new_program][S] = new_bucket
         return new_bucket
 
+    def clone(self, G: Union[ProbDetGrammar, ProbUGrammar]) -> "BucketSearch[U, V, W]":
+        assert isinstance(G, ProbUGrammar)
+        enum = self.__class__(G, self.bucket_size, self.max_size, self.max_depth)
+        enum.deleted = self.deleted.copy()
+        return enum
+
 
 def enumerate_bucket_prob_u_grammar(
-    G: ProbUGrammar[U, V, W], bucket_size: int
+    G: ProbUGrammar[U, V, W],
+    bucket_size: int,
+    max_size: Optional[int] = None,
+    max_depth: Optional[int] = None,
 ) -> BucketSearch[U, V, W]:
-    return BucketSearch(G, bucket_size)
+    return BucketSearch(G, bucket_size, max_size, max_depth)
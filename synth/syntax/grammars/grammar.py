@@ -12,9 +12,18 @@ DerivableProgram = Union[Primitive, Variable, Constant]
 class NGram:
     n: int
     predecessors: List[Tuple[DerivableProgram, int]] = field(default_factory=lambda: [])
+    # Non-terminals are hashed all the time during enumeration so the hash is computed once
+    _hash: int = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "_hash", hash((self.n, tuple(self.predecessors))))
 
     def __hash__(self) -> int:
-        return hash((self.n, tuple(self.predecessors)))
+        return self._hash
+
+    def __reduce__(self) -> Tuple:
+        # The hash depends on the process, it must not be pickled
+        return NGram, (self.n, self.predecessors)
 
     def __str__(self) -> str:
         return str(self.predecessors)
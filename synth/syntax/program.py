@@ -1,6 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Generator, List as TList, Any, Optional, Set, Tuple
+from typing import (
+    Dict,
+    Generator,
+    Iterator,
+    List as TList,
+    Any,
+    Optional,
+    Set,
+    Tuple,
+)
 import itertools
+from weakref import WeakValueDictionary
 
 from synth.syntax.type_system import (
     PrimitiveType,
@@ -15,6 +25,8 @@ class Program(ABC):
     Object that represents a program: a lambda term with basic primitives.
     """
 
+    __slots__ = ("type", "hash")
+
     def __init__(self, type: Type) -> None:
         self.type = type
         self.hash: int = 0
@@ -29,12 +41,21 @@ class Program(ABC):
         """
         Returns the set of used variables numbers in this program.
         """
+        mask = self.__used_variables_mask__()
         s: Set[int] = set()
-        self.__add_used_variables__(s)
+        variable = 0
+        while mask:
+            if mask & 1:
+                s.add(variable)
+            mask >>= 1
+            variable += 1
         return s
 
-    def __add_used_variables__(self, vars: Set[int]) -> None:
-        pass
+    def __used_variables_mask__(self) -> int:
+        """
+        Returns the bitmask of used variables numbers, bit i is set iff variable i is used.
+        """
+        return 0
 
     def is_constant(self) -> bool:
         """
@@ -82,14 +103,14 @@ class Program(ABC):
         """
         return 1
 
-    def depth_first_iter(self) -> Generator["Program", None, None]:
+    def depth_first_iter(self) -> Iterator["Program"]:
         """
         Depth first iteration over all objects that this program is built on.
 
         ``Function(P1, [P2, Function(P3, [P4])]).depth_first_iter()`` will yield
         P1, P2, P3, P4, Function(P3, [P4]), Function(P1, [P2, Function(P3, [P4])])
         """
-        yield self
+        return iter((self,))
 
     def pretty_print(self) -> TList[str]:
         """
@@ -130,6 +151,7 @@ class Variable(Program):
     """
 
     __hash__ = Program.__hash__
+    __slots__ = ("variable",)
 
     def __init__(self, variable: int, type: Type = UnknownType()):
         super().__init__(type)
@@ -142,8 +164,8 @@ class Variable(Program):
     def clone(self) -> "Program":
         return Variable(self.variable)
 
-    def __add_used_variables__(self, vars: Set[int]) -> None:
-        vars.add(self.variable)
+    def __used_variables_mask__(self) -> int:
+        return 1 << self.variable
 
     def __str__(self) -> str:
         return "var" + format(self.variable)
@@ -167,6 +189,7 @@ class Constant(Program):
     """
 
     __hash__ = Program.__hash__
+    __slots__ = ("value", "_has_value")
 
     def __init__(self, type: Type, value: Any = None, has_value: Optional[bool] = None):
         super().__init__(type)
@@ -231,6 +254,9 @@ class Function(Program):
     """
     Represents a function call, it supports partial application and the type is guessed automatically.
 
+    Function nodes are hash-consed: building a Function equal to one that is still alive returns the existing object,
+    thus equal Functions are usually the same object and they must not be modified.
+
     Parameters:
     -----------
     - function: the called function
@@ -238,17 +264,74 @@ class Function(Program):
     """
 
     __hash__ = Program.__hash__
+    __slots__ = (
+        "function",
+        "arguments",
+        "_type",
+        "_size",
+        "_depth",
+        "_variables",
+        "_constants",
+        "__weakref__",
+    )
+    function: Program
+    arguments: TList[Program]
+    _type: Optional[Type]
+    _size: int
+    _depth: int
+    _variables: int
+    _constants: int
+
+    # (*arguments, function) -> the only alive Function with this function and these arguments
+    __store__: "WeakValueDictionary[Tuple[Program, ...], Function]" = (
+        WeakValueDictionary()
+    )
+
+    def __new__(cls, function: Program, arguments: TList[Program]) -> "Function":
+        key = (*arguments, function)
+        self = cls.__store__.get(key)
+        if self is None:
+            self = super().__new__(cls)
+            self.function = function
+            self.arguments = list(arguments)
+            # The type is only built when needed
+            self._type = None
+            self.hash = hash(key)
+            # Children are already built so these are computed in O(number of arguments)
+            size = function.size()
+            depth = function.depth()
+            variables = function.__used_variables_mask__()
+            constants = function.count_constants()
+            for arg in arguments:
+                size += arg.size()
+                arg_depth = arg.depth()
+                if arg_depth > depth:
+                    depth = arg_depth
+                variables |= arg.__used_variables_mask__()
+                constants += arg.count_constants()
+            self._size = size
+            self._depth = depth + 1
+            self._variables = variables
+            self._constants = constants
+            cls.__store__[key] = self
+        return self
 
     def __init__(self, function: Program, arguments: TList[Program]):
-        # Build automatically the type of the function
-        type = function.type
-        args = type.arguments()[len(arguments) :]
-        my_type = FunctionType(*args, type.returns())
+        # Everything is done in __new__ since the object may already exist
+        pass
+
+    @property
+    def type(self) -> Type:
+        if self._type is None:
+            # Build automatically the type of the function
+            type = self.function.type
+            args = type.arguments()[len(self.arguments) :]
+            self._type = FunctionType(*args, type.returns())
+        return self._type
 
-        super().__init__(my_type)
-        self.function = function
-        self.arguments = arguments
-        self.hash = hash(tuple([arg for arg in self.arguments] + [self.function]))
+    @type.setter
+    def type(self, type: Type) -> None:
+        self._type = type
 
     def __pickle__(o: Program) -> Tuple:  # type: ignore[override]
         return Function, (o.function, o.arguments)  # type: ignore
@@ -285,8 +368,12 @@ class Function(Program):
         return Function(self.function.clone(), [x.clone() for x in self.arguments])
 
     def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        # Thanks to hash-consing the structural comparison is only needed on hash collisions
         return (
             isinstance(other, Function)
+            and self.hash == other.hash
             and self.function == other.function
             and len(self.arguments) == len(other.arguments)
             and self.arguments == other.arguments
@@ -298,12 +385,11 @@ class Function(Program):
         )
 
     def constants(self) -> Generator[Optional["Constant"], None, None]:
-        g = [self.function.constants()] + [arg.constants() for arg in self.arguments]
-        for gen in g:
-            c = next(gen, None)
-            while c is not None:
-                yield c
-                c = next(gen, None)
+        if self._constants == 0:
+            return
+        for sub in self.depth_first_iter():
+            if isinstance(sub, Constant):
+                yield sub
 
     def all_constants_instantiation(
         self, constants: Dict[Type, TList[Any]]
@@ -322,38 +408,29 @@ class Function(Program):
         )
 
     def count_constants(self) -> int:
-        return self.function.count_constants() + sum(
-            [arg.count_constants() for arg in self.arguments]
-        )
+        return self._constants
 
     def size(self) -> int:
-        return self.function.size() + sum([arg.size() for arg in self.arguments])
+        return self._size
 
     def depth(self) -> int:
-        return 1 + max(
-            self.function.depth(), max(arg.depth() for arg in self.arguments)
-        )
+        return self._depth
 
-    def __add_used_variables__(self, vars: Set[int]) -> None:
-        for el in [self.function] + self.arguments:
-            el.__add_used_variables__(vars)
+    def __used_variables_mask__(self) -> int:
+        return self._variables
 
-    def depth_first_iter(self) -> Generator["Program", None, None]:
-        for sub in self.function.depth_first_iter():
-            yield sub
-        for arg in self.arguments:
-            for sub in arg.depth_first_iter():
-                yield sub
-        yield self
+    def depth_first_iter(self) -> Iterator["Program"]:
+        return __depth_first_iter__(self)
 
     def __contains__(self, other: "Program") -> bool:
-        return self == other or any(
-            other in x for x in [self.function] + self.arguments
-        )
+        if other.size() > self._size:
+            return False
+        return any(sub == other for sub in self.depth_first_iter())
 
 
 class Lambda(Program):
     __hash__ = Program.__hash__
+    __slots__ = ("body",)
 
     def __init__(self, body: Program, type: Type = UnknownType()):
         super().__init__(type)
@@ -382,16 +459,14 @@ class Lambda(Program):
     def __eq__(self, other: Any) -> bool:
         return isinstance(other, Lambda) and self.body == other.body
 
-    def __add_used_variables__(self, vars: Set[int]) -> None:
-        return self.body.__add_used_variables__(vars)
+    def __used_variables_mask__(self) -> int:
+        return self.body.__used_variables_mask__()
 
     def depth(self) -> int:
         return 1 + self.body.depth()
 
-    def depth_first_iter(self) -> Generator["Program", None, None]:
-        for sub in self.body.depth_first_iter():
-            yield sub
-        yield self
+    def depth_first_iter(self) -> Iterator["Program"]:
+        return __depth_first_iter__(self)
 
     def __contains__(self, other: "Program") -> bool:
         return self == other or other in self.body
@@ -408,6 +483,7 @@ class Primitive(Program):
     """
 
     __hash__ = Program.__hash__
+    __slots__ = ("primitive",)
 
     def __init__(self, primitive: str, type: Type = UnknownType()):
         super().__init__(type)
@@ -437,6 +513,24 @@ class Primitive(Program):
         )
 
 
+def __depth_first_iter__(program: Program) -> Iterator[Program]:
+    """
+    Iterative implementation of Program.depth_first_iter() for programs with children.
+    """
+    # Visiting the last child first yields the reversed depth first order
+    out: TList[Program] = []
+    stack: TList[Program] = [program]
+    while stack:
+        node = stack.pop()
+        out.append(node)
+        if isinstance(node, Function):
+            stack.append(node.function)
+            stack.extend(node.arguments)
+        elif isinstance(node, Lambda):
+            stack.append(node.body)
+    return reversed(out)
+
+
 import copyreg
 
 for cls in [Primitive, Constant, Lambda, Function, Variable]:
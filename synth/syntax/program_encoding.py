@@ -0,0 +1,169 @@
+"""
+Compact encoding of programs as flat lists of integers.
+
+Types and primitives are stored once in tables and programs refer to them by index.
+Programs are encoded in postfix order, so decoding is a single loop with a stack.
+The tables grow as new programs are encoded: new_entries() returns the entries added since its last call
+so that they can be written along with the programs that use them and decoded in a streaming fashion.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from synth.syntax.program import (
+    Constant,
+    Function,
+    Lambda,
+    Primitive,
+    Program,
+    Variable,
+)
+from synth.syntax.type_system import Type
+
+# Opcodes, followed by their operands
+OP_PRIMITIVE = 0  # primitive index
+OP_VARIABLE = 1  # variable number, type index
+OP_CONSTANT = 2  # type index, value index or -1 if it has no value
+OP_FUNCTION = 3  # number of arguments, pops the function then its arguments
+OP_LAMBDA = 4  # type index, pops the body
+
+
+class ProgramEncoder:
+    """
+    Encodes programs into lists of integers, see ProgramDecoder for the reverse operation.
+    """
+
+    def __init__(self) -> None:
+        self._types: Dict[Type, int] = {}
+        self._primitives: Dict[Primitive, int] = {}
+        self._new_types: List[Type] = []
+        self._new_primitives: List[Tuple[str, int]] = []
+        self._new_values: List[Any] = []
+        self._values = 0
+
+    def __type_index__(self, type: Type) -> int:
+        index = self._types.get(type)
+        if index is None:
+            index = len(self._types)
+            self._types[type] = index
+            self._new_types.append(type)
+        return index
+
+    def __primitive_index__(self, primitive: Primitive) -> int:
+        index = self._primitives.get(primitive)
+        if index is None:
+            index = len(self._primitives)
+            self._primitives[primitive] = index
+            self._new_primitives.append(
+                (primitive.primitive, self.__type_index__(primitive.type))
+            )
+        return index
+
+    def encode_type(self, type: Type) -> int:
+        """
+        Returns the index of the given type in the table of types.
+        """
+        return self.__type_index__(type)
+
+    def encode(self, program: Program) -> List[int]:
+        """
+        Returns the postfix encoding of the given program.
+        """
+        out: List[int] = []
+        for node in program.depth_first_iter():
+            if isinstance(node, Function):
+                out += (OP_FUNCTION, len(node.arguments))
+            elif isinstance(node, Primitive):
+                out += (OP_PRIMITIVE, self.__primitive_index__(node))
+            elif isinstance(node, Variable):
+                out += (OP_VARIABLE, node.variable, self.__type_index__(node.type))
+            elif isinstance(node, Constant):
+                value = -1
+                if node.has_value():
+                    value = self._values
+                    self._values += 1
+                    self._new_values.append(node.value)
+                out += (OP_CONSTANT, self.__type_index__(node.type), value)
+            elif isinstance(node, Lambda):
+                out += (OP_LAMBDA, self.__type_index__(node.type))
+            else:
+                assert False, f"Not implemented: {type(node)}"
+        return out
+
+    def new_entries(self) -> Tuple[List[Type], List[Tuple[str, int]], List[Any]]:
+        """
+        Returns the types, primitives and constant values added since the last call.
+        """
+        out = (self._new_types, self._new_primitives, self._new_values)
+        self._new_types = []
+        self._new_primitives = []
+        self._new_values = []
+        return out
+
+
+class ProgramDecoder:
+    """
+    Decodes programs encoded by a ProgramEncoder.
+    The entries of the encoder must be given with add_entries() in the same order as they were produced.
+    """
+
+    def __init__(self) -> None:
+        self._types: List[Type] = []
+        self._primitives: List[Primitive] = []
+        self._values: List[Any] = []
+        # (variable number, type index) -> variable, building them is costly because of type hashing
+        self._variables: Dict[Tuple[int, int], Variable] = {}
+
+    def add_entries(
+        self,
+        entries: Tuple[List[Type], List[Tuple[str, int]], List[Any]],
+    ) -> None:
+        types, primitives, values = entries
+        self._types += types
+        self._primitives += [
+            Primitive(name, self._types[type_index]) for name, type_index in primitives
+        ]
+        self._values += values
+
+    def decode_type(self, index: int) -> Type:
+        return self._types[index]
+
+    def decode(self, code: List[int]) -> Optional[Program]:
+        """
+        Returns the program encoded by code or None if code is empty.
+        """
+        stack: List[Program] = []
+        i = 0
+        n = len(code)
+        while i < n:
+            op = code[i]
+            if op == OP_FUNCTION:
+                nargs = code[i + 1]
+                args = stack[len(stack) - nargs :]
+                del stack[len(stack) - nargs :]
+                stack[-1] = Function(stack[-1], args)
+                i += 2
+            elif op == OP_PRIMITIVE:
+                stack.append(self._primitives[code[i + 1]])
+                i += 2
+            elif op == OP_VARIABLE:
+                key = (code[i + 1], code[i + 2])
+                var = self._variables.get(key)
+                if var is None:
+                    var = Variable(key[0], self._types[key[1]])
+                    self._variables[key] = var
+                stack.append(var)
+                i += 3
+            elif op == OP_CONSTANT:
+                type = self._types[code[i + 1]]
+                value = code[i + 2]
+                if value < 0:
+                    stack.append(Constant(type))
+                else:
+                    stack.append(Constant(type, self._values[value], True))
+                i += 3
+            elif op == OP_LAMBDA:
+                stack[-1] = Lambda(stack[-1], self._types[code[i + 1]])
+                i += 2
+            else:
+                assert False, f"Unknown opcode: {op}"
+        return stack[-1] if stack else None
@@ -1,6 +1,7 @@
 from dataclasses import dataclass, field
 from typing import (
     Any,
+    BinaryIO,
     Callable,
     Dict,
     Generic,
@@ -8,18 +9,37 @@ from typing import (
     List,
     Optional,
     SupportsIndex,
+    Tuple,
     TypeVar,
     overload,
     Set,
 )
+from array import array
+import bisect
+from collections import OrderedDict
+import io
+import itertools
+import mmap
+import operator
 import pickle
 import bz2
+import struct
+import sys
 
-from synth.specification import TaskSpecification
+from synth.specification import PBE, Example, TaskSpecification
 from synth.syntax.program import Program
+from synth.syntax.program_encoding import ProgramDecoder, ProgramEncoder
 from synth.syntax.type_system import Type
-from synth.utils.data_storage import load_object, save_object
-
+from synth.utils.data_storage import (
+    KIND_DATASET,
+    FrameReader,
+    FrameWriter,
+    gc_paused,
+    is_binary_file,
+    load_object,
+    save_object,
+    unpickle,
+)
 
 T = TypeVar("T", bound=TaskSpecification)
 
@@ -69,21 +89,475 @@ class Dataset(Generic[T]):
     def type_requests(self) -> Set[Type]:
         return set([task.type_request for task in self.tasks])
 
-    def save(self, path: str) -> None:
+    def indices_of_type_requests(self, type_requests: Set[Type]) -> List[int]:
+        """
+        Returns the indices of the tasks whose type request is in type_requests.
+        """
+        return [
+            i for i, task in enumerate(self.tasks) if task.type_request in type_requests
+        ]
+
+    def save(
+        self, path: str, codec: Optional[str] = None, chunk_size: int = 1024
+    ) -> None:
         """
         Save this dataset in the specified file.
         The dataset file is compressed.
+
+        If codec is None, the dataset is pickled.
+        Otherwise it is saved in the binary format compressed with the given codec (see synth.utils.data_storage.available_codecs()),
+        which is much faster to load and can be read task by task with Dataset.stream().
+        Tasks are then compressed by chunks of chunk_size tasks.
         """
-        save_object(path, self)
+        if codec is None:
+            save_object(path, self)
+            return
+        with open(path, "wb") as fd:
+            writer = FrameWriter(fd, KIND_DATASET, codec)
+            writer.write(pickle.dumps(self.metadata, pickle.HIGHEST_PROTOCOL))
+            encoder = ProgramEncoder()
+            # Index of the file, see LazyDataset
+            offsets = array("Q")
+            starts = array("Q")
+            type_indices = array("I")
+            entries: Tuple[List, List, List] = ([], [], [])
+            for start in range(0, len(self.tasks), chunk_size):
+                offsets.append(fd.tell())
+                starts.append(start)
+                chunk = __encode_chunk__(
+                    self.tasks[start : start + chunk_size], encoder
+                )
+                for all_entries, new_entries in zip(entries, chunk[0]):
+                    all_entries += new_entries
+                type_indices.extend(record[0] for record in chunk[1])
+                writer.write(pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL))
+            offsets.append(fd.tell())
+            starts.append(len(self.tasks))
+            __write_index__(writer, [offsets, starts, type_indices], entries)
 
     @classmethod
     def load(
         cls,
         path: str,
         unpickler: Optional[Callable[[bz2.BZ2File], pickle.Unpickler]] = None,
+        lazy: bool = False,
     ) -> "Dataset[T]":
         """
         Load the dataset object stored in this file.
+        If lazy is True and the file is in the binary format, returns a LazyDataset which only decodes tasks when they are accessed.
         """
+        if is_binary_file(path):
+            if lazy:
+                return LazyDataset(path, unpickler)
+            with open(path, "rb") as fd:
+                reader = FrameReader(fd, KIND_DATASET)
+                footer = __read_footer__(fd)
+                metadata = unpickle(reader.read(), unpickler)  # type: ignore
+                return cls(
+                    list(__read_tasks__(reader, unpickler, footer and footer[0])),
+                    metadata,
+                )
         d: Dataset = load_object(path, unpickler)
         return d
+
+    @classmethod
+    def stream(
+        cls,
+        path: str,
+        unpickler: Optional[Callable[[bz2.BZ2File], pickle.Unpickler]] = None,
+    ) -> Iterator[Task[T]]:
+        """
+        Iterate over the tasks of the dataset stored in this file without loading all of them in memory.
+        The dataset must have been saved in the binary format.
+        """
+        with open(path, "rb") as fd:
+            reader = FrameReader(fd, KIND_DATASET)
+            footer = __read_footer__(fd)
+            # Skip metadata
+            reader.read()
+            for task in __read_tasks__(reader, unpickler, footer and footer[0]):
+                yield task
+
+
+class LazyDataset(Dataset[T]):
+    """
+    Dataset stored in a file in the binary format (see Dataset.save()) whose tasks are only decoded when they are accessed.
+    The file is memory-mapped and its index gives the offset of each chunk of tasks as well as the type requests of all tasks,
+    so opening it only costs reading the metadata and the tables of types and primitives.
+    Tasks are decoded a chunk at a time and the last cache_size decoded chunks are kept in memory.
+
+    It can be pickled, for example to be sent to other processes, in which case only its path is pickled and the file is opened again.
+
+    Parameters:
+    -----------
+    - path: the file of the dataset
+    - unpickler: the unpickler to use if not the default one
+    - cache_size: the number of decoded chunks kept in memory
+    """
+
+    def __init__(
+        self,
+        path: str,
+        unpickler: Optional[Callable[[bz2.BZ2File], pickle.Unpickler]] = None,
+        cache_size: int = 2,
+    ) -> None:
+        self.path = path
+        self.unpickler = unpickler
+        self.cache_size = cache_size
+        self._cache: OrderedDict[int, List[Task[T]]] = OrderedDict()
+        with open(path, "rb") as fd:
+            self._buffer = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._reader = FrameReader(self._buffer, KIND_DATASET)  # type: ignore
+        metadata_offset = self._buffer.tell()
+        footer = __read_footer__(self._buffer)  # type: ignore
+        if footer is None:
+            self.close()
+            raise ValueError(
+                f"{path} has no index, load it with Dataset.load() and save it again"
+            )
+        n_chunks, n_tasks, index_offset = footer
+        self._views: List[Any] = [memoryview(self._buffer)]
+        self._offsets, self._starts, self._type_indices = __read_arrays__(
+            self._views, index_offset, [n_chunks + 1, n_chunks + 1, n_tasks]
+        )
+        self._buffer.seek(
+            index_offset
+            + (n_chunks + 1) * 2 * _INDEX_TYPECODES["Q"]
+            + n_tasks * _INDEX_TYPECODES["I"]
+        )
+        entries, type_indices = unpickle(self._reader.read(), unpickler)  # type: ignore
+        self._decoder = ProgramDecoder()
+        self._decoder.add_entries(entries)
+        # index of a type request -> type request
+        self._type_ids: Dict[int, Type] = {
+            i: self._decoder.decode_type(i) for i in type_indices
+        }
+        self._buffer.seek(metadata_offset)
+        self.metadata = unpickle(self._reader.read(), unpickler)  # type: ignore
+
+    @property
+    def tasks(self) -> "LazyDataset[T]":  # type: ignore
+        return self
+
+    def __chunk__(self, chunk: int) -> List[Task[T]]:
+        tasks = self._cache.get(chunk)
+        if tasks is not None:
+            self._cache.move_to_end(chunk)
+            return tasks
+        self._buffer.seek(self._offsets[chunk])
+        tasks = __decode_chunk__(
+            self._reader.read(), self._decoder, self.unpickler, False  # type: ignore
+        )
+        self._cache[chunk] = tasks
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tasks
+
+    def __len__(self) -> int:
+        return len(self._type_indices)
+
+    def __iter__(self) -> Iterator[Task[T]]:
+        for chunk in range(len(self._offsets) - 1):
+            for task in self.__chunk__(chunk):
+                yield task
+
+    @overload
+    def __getitem__(self, key: SupportsIndex) -> Task[T]:
+        pass
+
+    @overload
+    def __getitem__(self, key: slice) -> List[Task[T]]:
+        pass
+
+    def __getitem__(self, key: Any) -> Any:
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        index = operator.index(key)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("dataset index out of range")
+        chunk = bisect.bisect_right(self._starts, index) - 1
+        return self.__chunk__(chunk)[index - self._starts[chunk]]
+
+    def type_requests(self) -> Set[Type]:
+        return set(self._type_ids.values())
+
+    def indices_of_type_requests(self, type_requests: Set[Type]) -> List[int]:
+        """
+        Returns the indices of the tasks whose type request is in type_requests, without decoding any task.
+        """
+        wanted = {i for i, t in self._type_ids.items() if t in type_requests}
+        return [
+            i for i, type_index in enumerate(self._type_indices) if type_index in wanted
+        ]
+
+    def save(
+        self, path: str, codec: Optional[str] = None, chunk_size: int = 1024
+    ) -> None:
+        Dataset(list(self), self.metadata).save(path, codec, chunk_size)
+
+    def close(self) -> None:
+        """
+        Close the underlying file, the dataset can no longer be used afterwards.
+        """
+        self._cache.clear()
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._buffer.close()
+
+    def __enter__(self) -> "LazyDataset[T]":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __eq__(self, other: Any) -> bool:
+        return (
+            isinstance(other, Dataset)
+            and self.metadata == other.metadata
+            and len(self) == len(other)
+            and all(a == b for a, b in zip(self, other))
+        )
+
+    def __repr__(self) -> str:
+        return f"LazyDataset({self.path!r}, {len(self)} tasks)"
+
+    def __getstate__(self) -> Tuple:
+        return (self.path, self.unpickler, self.cache_size)
+
+    def __setstate__(self, state: Tuple) -> None:
+        self.__init__(*state)  # type: ignore
+
+
+# Index at the end of files of datasets:
+# padding to align arrays | offsets of chunks (n_chunks + 1 u64) | index of the first task of each chunk (n_chunks + 1 u64)
+# | index of the type request of each task (n_tasks u32) | frame with the tables of types and primitives and the set of type requests
+# | footer
+_FOOTER = struct.Struct("<QQQ8s")  # n_chunks, n_tasks, offset of the arrays, magic
+_INDEX_MAGIC = b"SYNTHIDX"
+# typecode -> size in bytes
+_INDEX_TYPECODES = {"Q": 8, "I": 4}
+
+
+def __write_index__(writer: FrameWriter, arrays: List[array], entries: Tuple) -> None:
+    fd = writer.fd
+    fd.write(bytes(-fd.tell() % 8))
+    index_offset = fd.tell()
+    for x in arrays:
+        assert x.itemsize == _INDEX_TYPECODES[x.typecode]
+        if sys.byteorder == "big":
+            x.byteswap()
+        fd.write(x.tobytes())
+    type_indices = arrays[-1]
+    writer.write(
+        pickle.dumps(
+            (entries, sorted(set(type_indices))),
+            pickle.HIGHEST_PROTOCOL,
+        )
+    )
+    fd.write(
+        _FOOTER.pack(len(arrays[0]) - 1, len(type_indices), index_offset, _INDEX_MAGIC)
+    )
+
+
+def __read_footer__(fd: BinaryIO) -> Optional[Tuple[int, int, int]]:
+    """
+    Returns (number of chunks, number of tasks, offset of the index) or None if the file has no index.
+    The position in fd is left unchanged.
+    """
+    position = fd.tell()
+    fd.seek(0, io.SEEK_END)
+    size = fd.tell()
+    footer = None
+    if size - position >= _FOOTER.size:
+        fd.seek(size - _FOOTER.size)
+        n_chunks, n_tasks, index_offset, magic = _FOOTER.unpack(fd.read(_FOOTER.size))
+        if magic == _INDEX_MAGIC:
+            footer = (n_chunks, n_tasks, index_offset)
+    fd.seek(position)
+    return footer
+
+
+def __read_arrays__(views: List[Any], offset: int, lengths: List[int]) -> List[Any]:
+    """
+    Returns the arrays of the index of the given lengths that start at offset.
+    They are views of the file if possible, views are appended to views so that they can be released.
+    """
+    out = []
+    for length, typecode in zip(lengths, ["Q", "Q", "I"]):
+        end = offset + length * _INDEX_TYPECODES[typecode]
+        if sys.byteorder == "little":
+            view = views[0][offset:end].cast(typecode)
+            views.append(view)
+            out.append(view)
+        else:
+            x = array(typecode)
+            x.frombytes(views[0][offset:end])
+            x.byteswap()
+            out.append(x)
+        offset = end
+    return out
+
+
+# Values of PBE examples are stored in columns shared by a whole chunk:
+# one tag per value telling the column where the value is,
+# 64-bit integers, lists of 64-bit integers stored as their lengths and their concatenation,
+# and any other value which is pickled as is.
+_TAG_INT = 0
+_TAG_INT_LIST = 1
+_TAG_OBJECT = 2
+
+
+class _ValueColumns:
+    def __init__(self) -> None:
+        self.tags = bytearray()
+        self.ints = array("q")
+        self.lengths = array("q")
+        self.elements = array("q")
+        self.objects: List[Any] = []
+
+    def add(self, value: Any) -> None:
+        if type(value) == int and -(2**63) <= value < 2**63:
+            self.tags.append(_TAG_INT)
+            self.ints.append(value)
+            return
+        if type(value) == list and all(type(x) == int for x in value):
+            try:
+                elements = array("q", value)
+            except OverflowError:
+                pass
+            else:
+                self.tags.append(_TAG_INT_LIST)
+                self.lengths.append(len(elements))
+                self.elements += elements
+                return
+        self.tags.append(_TAG_OBJECT)
+        self.objects.append(value)
+
+    def dump(self) -> Tuple:
+        arrays = [self.ints, self.lengths, self.elements]
+        if sys.byteorder == "big":
+            for x in arrays:
+                x.byteswap()
+        return (bytes(self.tags), *[x.tobytes() for x in arrays], self.objects)
+
+    @staticmethod
+    def load(columns: Tuple) -> List[Any]:
+        """
+        Returns the list of all values in the order they were added.
+        """
+        tags, *raw_arrays, objects = columns
+        arrays = []
+        for raw in raw_arrays:
+            x = array("q")
+            x.frombytes(raw)
+            if sys.byteorder == "big":
+                x.byteswap()
+            arrays.append(x.tolist())
+        ints, lengths, elements = arrays
+        bounds = list(itertools.accumulate(lengths, initial=0))
+        lists = [elements[start:end] for start, end in zip(bounds, bounds[1:])]
+        columns_iter = [
+            iter(ints).__next__,
+            iter(lists).__next__,
+            iter(objects).__next__,
+        ]
+        return [columns_iter[tag]() for tag in tags]
+
+
+def __compact_shape__(spec: TaskSpecification) -> Optional[Tuple[int, int]]:
+    """
+    Returns (number of examples, number of inputs) if spec can be stored in columns, None otherwise.
+    """
+    # Subclasses of PBE carry more information, they are pickled
+    if type(spec) != PBE:
+        return None
+    examples = spec.examples
+    if len(examples) == 0 or any(type(example) != Example for example in examples):
+        return None
+    n_inputs = len(examples[0].inputs)
+    if any(len(example.inputs) != n_inputs for example in examples):
+        return None
+    return len(examples), n_inputs
+
+
+def __encode_chunk__(tasks: List[Task], encoder: ProgramEncoder) -> Tuple:
+    columns = _ValueColumns()
+    records = []
+    for task in tasks:
+        spec = task.specification
+        shape = __compact_shape__(spec)
+        if shape is not None:
+            for example in spec.examples:
+                for value in example.inputs:
+                    columns.add(value)
+                columns.add(example.output)
+        records.append(
+            (
+                encoder.encode_type(task.type_request),
+                spec if shape is None else None,
+                shape,
+                None if task.solution is None else encoder.encode(task.solution),
+                task.metadata,
+            )
+        )
+    return encoder.new_entries(), records, columns.dump()
+
+
+def __decode_chunk__(
+    payload: bytes,
+    decoder: ProgramDecoder,
+    unpickler: Optional[Callable[[bz2.BZ2File], pickle.Unpickler]] = None,
+    add_entries: bool = True,
+) -> List[Task]:
+    """
+    Decodes the tasks of a chunk, the entries of the chunk are added to the decoder iff add_entries is True.
+    """
+    with gc_paused():
+        return __decode_records__(unpickle(payload, unpickler), decoder, add_entries)
+
+
+def __decode_records__(
+    chunk: Tuple, decoder: ProgramDecoder, add_entries: bool
+) -> List[Task]:
+    entries, records, columns = chunk
+    if add_entries:
+        decoder.add_entries(entries)
+    values = _ValueColumns.load(columns)
+    start = 0
+    tasks = []
+    for type_index, spec, shape, code, metadata in records:
+        if shape is not None:
+            n_examples, n_inputs = shape
+            end = start + n_examples * (n_inputs + 1)
+            spec = PBE(
+                [
+                    Example(values[i : i + n_inputs], values[i + n_inputs])
+                    for i in range(start, end, n_inputs + 1)
+                ]
+            )
+            start = end
+        tasks.append(
+            Task(
+                decoder.decode_type(type_index),
+                spec,
+                None if code is None else decoder.decode(code),
+                metadata,
+            )
+        )
+    return tasks
+
+
+def __read_tasks__(
+    reader: FrameReader,
+    unpickler: Optional[Callable[[bz2.BZ2File], pickle.Unpickler]] = None,
+    n_chunks: Optional[int] = None,
+) -> Iterator[Task]:
+    """
+    Reads the next n_chunks chunks of tasks or all the remaining frames if n_chunks is None.
+    """
+    decoder = ProgramDecoder()
+    for payload in itertools.islice(reader, n_chunks):
+        for task in __decode_chunk__(payload, decoder, unpickler):
+            yield task
@@ -1,8 +1,189 @@
 import bz2
+from contextlib import contextmanager
+import gc
+import io
 import pickle
-from typing import Any, Callable, Optional
+import struct
+import zlib
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 import pickletools
 
+# Binary format:
+# MAGIC | version (u8) | codec id (u8) | kind (u8) | frames
+# where each frame is: length of the compressed payload (u64) | compressed payload
+MAGIC = b"SYNTHBIN"
+VERSION = 1
+_HEADER = struct.Struct("<BBB")
+_FRAME = struct.Struct("<Q")
+
+KIND_OBJECT = 0
+KIND_DATASET = 1
+
+# name -> (id, compress, decompress)
+_CODECS: Dict[str, Tuple[int, Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "none": (0, bytes, bytes),
+    "zlib": (1, lambda b: zlib.compress(b, 6), zlib.decompress),
+    "bz2": (2, lambda b: bz2.compress(b, 9), bz2.decompress),
+}
+# name of codecs whose ids are reserved but whose library is missing
+_MISSING_CODECS: Dict[str, int] = {}
+
+try:
+    import zstandard
+
+    _CODECS["zstd"] = (
+        3,
+        zstandard.ZstdCompressor(level=3).compress,
+        lambda b: zstandard.ZstdDecompressor().decompress(b),
+    )
+except ImportError:
+    _MISSING_CODECS["zstd"] = 3
+
+try:
+    import lz4.frame
+
+    _CODECS["lz4"] = (4, lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    _MISSING_CODECS["lz4"] = 4
+
+
+def available_codecs() -> List[str]:
+    """
+    Returns the names of the codecs that can be used to save data.
+    """
+    return list(_CODECS.keys())
+
+
+def __get_codec__(name: str) -> Tuple[int, Callable, Callable]:
+    if name in _MISSING_CODECS:
+        raise ValueError(f"codec '{name}' requires a library that is not installed")
+    if name not in _CODECS:
+        raise ValueError(
+            f"unknown codec '{name}', available codecs: {available_codecs()}"
+        )
+    return _CODECS[name]
+
+
+def __get_codec_by_id__(codec_id: int) -> Tuple[str, Callable, Callable]:
+    for name, (i, compress, decompress) in _CODECS.items():
+        if i == codec_id:
+            return name, compress, decompress
+    for name, i in _MISSING_CODECS.items():
+        if i == codec_id:
+            raise ValueError(
+                f"data was saved with codec '{name}' which requires a library that is not installed"
+            )
+    raise ValueError(f"unknown codec id: {codec_id}")
+
+
+class FrameWriter:
+    """
+    Writes a binary file made of independently compressed frames.
+
+    Parameters:
+    -----------
+    - fd: the file opened in binary write mode
+    - kind: the kind of content, used by readers to check they read the right thing
+    - codec: the name of the codec used to compress frames
+    """
+
+    def __init__(self, fd: BinaryIO, kind: int, codec: str = "zlib") -> None:
+        self.fd = fd
+        codec_id, self._compress, _ = __get_codec__(codec)
+        fd.write(MAGIC)
+        fd.write(_HEADER.pack(VERSION, codec_id, kind))
+
+    def write(self, payload: bytes) -> None:
+        """
+        Compress and write the given payload as a new frame.
+        """
+        data = self._compress(payload)
+        self.fd.write(_FRAME.pack(len(data)))
+        self.fd.write(data)
+
+
+class FrameReader:
+    """
+    Reads a binary file written by a FrameWriter.
+
+    Parameters:
+    -----------
+    - fd: the file opened in binary read mode
+    - kind: the kind of content expected
+    """
+
+    def __init__(self, fd: BinaryIO, kind: int) -> None:
+        self.fd = fd
+        if fd.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a binary file written by ProgSynth")
+        version, codec_id, file_kind = _HEADER.unpack(fd.read(_HEADER.size))
+        if version > VERSION:
+            raise ValueError(f"unsupported binary format version: {version}")
+        if file_kind != kind:
+            raise ValueError(f"expected content of kind {kind} but got {file_kind}")
+        self.codec, _, self._decompress = __get_codec_by_id__(codec_id)
+
+    def read(self) -> Optional[bytes]:
+        """
+        Returns the payload of the next frame or None if there is none.
+        """
+        header = self.fd.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            return None
+        (length,) = _FRAME.unpack(header)
+        return self._decompress(self.fd.read(length))  # type: ignore
+
+    def __iter__(self) -> Generator[bytes, None, None]:
+        payload = self.read()
+        while payload is not None:
+            yield payload
+            payload = self.read()
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """
+    Disable the garbage collector in this context.
+    Loading creates many objects and no cycle, but each allocation can trigger a collection which then goes through all loaded objects.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def is_binary_file(path: str) -> bool:
+    """
+    Returns true iff the file at the given path is in the binary format.
+    """
+    with open(path, "rb") as fd:
+        return fd.read(len(MAGIC)) == MAGIC
+
+
+def unpickle(
+    payload: bytes,
+    unpickler: Optional[Callable[[bz2.BZ2File], pickle.Unpickler]] = None,
+) -> Any:
+    """
+    Unpickle an object from the given bytes, with the given unpickler if not None.
+    """
+    if unpickler is None:
+        return pickle.loads(payload)
+    return unpickler(io.BytesIO(payload)).load()  # type: ignore
+
 
 def load_object(
     path: str, unpickler: Optional[Callable[[bz2.BZ2File], pickle.Unpickler]] = None
@@ -10,7 +191,13 @@ def load_object(
     """
     Load an arbitrary object from the specified file.
     """
-    with bz2.BZ2File(path, "rb") as fd:
+    if is_binary_file(path):
+        with open(path, "rb") as fd:
+            payload = FrameReader(fd, KIND_OBJECT).read()
+        assert payload is not None, f"no object found in {path}"
+        with gc_paused():
+            return unpickle(payload, unpickler)
+    with bz2.BZ2File(path, "rb") as fd, gc_paused():
         if unpickler is None:
             return pickle.load(fd)
         else:
@@ -18,12 +205,25 @@ def load_object(
 
 
 def save_object(
-    path: str, obj: Any, optimize: bool = True, compress_level: int = 9
+    path: str,
+    obj: Any,
+    optimize: bool = True,
+    compress_level: int = 9,
+    codec: Optional[str] = None,
 ) -> None:
     """
     Save an arbitrary object to the specified path.
     Compression level must be in 1-9 where 9 is the highest level.
+
+    If codec is not None, the object is saved in the binary format compressed with this codec (see available_codecs()) which is much faster to load,
+    in that case optimize and compress_level are ignored.
     """
+    if codec is not None:
+        with open(path, "wb") as bfd:
+            FrameWriter(bfd, KIND_OBJECT, codec).write(
+                pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+            )
+        return
     with bz2.BZ2File(path, "w", compresslevel=compress_level) as fd:
         content = pickle.dumps(obj)
         if optimize:
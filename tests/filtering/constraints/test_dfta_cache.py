@@ -0,0 +1,70 @@
+import os
+import pathlib
+
+from synth.syntax.grammars.cfg import CFG
+from synth.syntax.dsl import DSL
+from synth.syntax.type_system import INT
+from synth.syntax.type_helper import FunctionType
+from synth.filter.constraints.dfta_cache import DFTACache
+from synth.filter.constraints.dfta_constraints import add_dfta_constraints
+
+
+syntax = {
+    "+": FunctionType(INT, INT, INT),
+    "-": FunctionType(INT, INT, INT),
+    "1": INT,
+    "0": INT,
+}
+dsl = DSL(syntax)
+type_request = FunctionType(INT, INT)
+constraints = ["(+ 1 ^0)", "(- _ ^0)"]
+
+
+def test_key() -> None:
+    key = DFTACache.key(dsl, type_request, constraints)
+    assert key == DFTACache.key(dsl, type_request, constraints[::-1])
+    assert key != DFTACache.key(dsl, type_request, constraints[:1])
+    assert key != DFTACache.key(dsl, FunctionType(INT, INT, INT), constraints)
+    assert key != DFTACache.key(dsl, type_request, constraints, {INT})
+    assert key != DFTACache.key(dsl, type_request, constraints, sketch="(+ _ _)")
+    other = DSL({**syntax, "2": INT})
+    assert key != DFTACache.key(other, type_request, constraints)
+
+
+def test_get(tmp_path: pathlib.Path) -> None:
+    expected = add_dfta_constraints(
+        CFG.infinite(dsl, type_request), constraints, progress=False
+    )
+    cache = DFTACache(str(tmp_path))
+    dfta = cache.get(dsl, type_request, constraints)
+    assert dfta.rules == expected.rules
+    assert dfta.finals == expected.finals
+    assert cache.get(dsl, type_request, constraints[::-1]) is dfta
+    assert len(os.listdir(tmp_path)) == 1
+    # Another cache with the same directory loads the saved DFTA
+    loaded = DFTACache(str(tmp_path)).get(dsl, type_request, constraints)
+    assert loaded is not dfta
+    assert loaded.rules == expected.rules
+    assert loaded.finals == expected.finals
+
+
+def test_get_compiled() -> None:
+    cache = DFTACache()
+    compiled = cache.get_compiled(dsl, type_request, constraints)
+    assert compiled.size() == cache.get(dsl, type_request, constraints).size()
+    assert cache.get_compiled(dsl, type_request, constraints[::-1]) is compiled
+    cache.clear()
+    assert cache.get_compiled(dsl, type_request, constraints) is not compiled
+
+
+def test_corrupted_file(tmp_path: pathlib.Path) -> None:
+    cache = DFTACache(str(tmp_path))
+    dfta = cache.get(dsl, type_request, constraints)
+    (path,) = os.listdir(tmp_path)
+    with open(tmp_path / path, "wb") as fd:
+        fd.write(b"not a dfta")
+    loaded = DFTACache(str(tmp_path)).get(dsl, type_request, constraints)
+    assert loaded.rules == dfta.rules
+    assert (
+        DFTACache(str(tmp_path)).get(dsl, type_request, constraints).rules == dfta.rules
+    )
@@ -0,0 +1,61 @@
+from typing import Any
+
+from synth.filter.dfta_filter import DFTAFilter
+from synth.filter.constraints.dfta_constraints import add_dfta_constraints
+from synth.syntax.automata.tree_automaton import DFTA
+from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
+from synth.syntax.grammars.enumeration.heap_search import enumerate_prob_grammar
+from synth.syntax.dsl import DSL
+from synth.syntax.program import Function, Program
+from synth.syntax.type_system import INT
+from synth.syntax.type_helper import FunctionType
+
+import pytest
+
+
+syntax = {
+    "+": FunctionType(INT, INT, INT),
+    "-": FunctionType(INT, INT, INT),
+    "1": INT,
+    "0": INT,
+}
+dsl = DSL(syntax)
+cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+dfta = add_dfta_constraints(cfg, ["(+ 1 ^0)", "(- _ ^0)"], progress=False)
+programs = list(enumerate_prob_grammar(ProbDetGrammar.uniform(cfg)))
+
+
+def __read__(dfta: DFTA, program: Program) -> Any:
+    if isinstance(program, Function):
+        args = tuple(__read__(dfta, arg) for arg in program.arguments)
+        return dfta.read(program.function, args)  # type: ignore
+    return dfta.read(program, ())  # type: ignore
+
+
+@pytest.mark.parametrize("accepting", [True, False])
+def test_accept(accepting: bool) -> None:
+    filter = DFTAFilter(dfta, accepting)
+    accepted = 0
+    for program in programs:
+        state = __read__(dfta, program)
+        assert filter._get_prog_state(program) == state
+        assert filter.accept(program) == ((state is not None) == accepting)
+        accepted += filter.accept(program)
+    assert 0 < accepted < len(programs)
+
+
+def test_compiled() -> None:
+    filter = DFTAFilter(dfta.compile())
+    reference = DFTAFilter(dfta)
+    for program in programs:
+        assert filter.accept(program) == reference.accept(program)
+
+
+def test_cache_size() -> None:
+    filter = DFTAFilter(dfta, cache_size=10)
+    reference = DFTAFilter(dfta, cache_size=None)
+    for program in programs:
+        assert filter.accept(program) == reference.accept(program)
+        assert len(filter._cache) <= 10
+    assert len(reference._cache) >= len(programs)
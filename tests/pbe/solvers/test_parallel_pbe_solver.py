@@ -0,0 +1,87 @@
+import os
+
+from synth.semantic.evaluator import DSLEvaluator
+from synth.specification import PBE, Example
+from synth.syntax.grammars.enumeration.heap_search import enumerate_prob_grammar
+from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
+from synth.syntax.dsl import DSL
+from synth.syntax.type_system import INT
+from synth.syntax.type_helper import FunctionType
+from synth.pbe.solvers import CutoffPBESolver, NaivePBESolver, ParallelPBESolver
+from synth.syntax.program import Program
+
+import pytest
+
+from synth.task import Task
+
+syntax = {
+    "+": FunctionType(INT, INT, INT),
+    "-": FunctionType(INT, INT, INT),
+    "1": INT,
+}
+
+semantics = {"+": lambda x: lambda y: x + y, "-": lambda x: lambda y: x - y, "1": 1}
+
+dsl = DSL(syntax)
+evaluator = DSLEvaluator(dsl.instantiate_semantics(semantics))
+cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), 4)
+pcfg = ProbDetGrammar.uniform(cfg)
+
+tasks = [
+    Task(cfg.type_request, PBE([Example([x], x + 2) for x in [3, 4, 9, 12]])),
+    Task(cfg.type_request, PBE([Example([x], x - 2) for x in [3, 4, 9, 12]])),
+]
+
+
+@pytest.mark.parametrize("splits", [1, 2, 4])
+def test_solving(splits: int) -> None:
+    solver = ParallelPBESolver(evaluator, CutoffPBESolver, splits=splits)
+    for task in tasks:
+        generator = solver.solve(task, enumerate_prob_grammar(pcfg), 10)
+        program = next(generator)
+        for example in task.specification.examples:
+            assert evaluator.eval(program, example.inputs) == example.output
+        # Accepting the solution stops all processes and merges their stats
+        with pytest.raises(StopIteration):
+            generator.send(True)
+        assert solver.get_stats("programs") > 0
+        assert solver.get_stats("time") > 0
+        solver.reset_stats()
+
+
+def test_unsolvable() -> None:
+    solver = ParallelPBESolver(evaluator, splits=3)
+    small_pcfg = ProbDetGrammar.uniform(
+        CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+    )
+    task = Task(cfg.type_request, PBE([Example([x], x * x) for x in [3, 4, 9, 12]]))
+    assert list(solver.solve(task, enumerate_prob_grammar(small_pcfg), 10)) == []
+    # Every program is enumerated in exactly one fragment
+    assert solver.get_stats("programs") == len(list(enumerate_prob_grammar(small_pcfg)))
+
+
+def test_recursive_grammar() -> None:
+    solver = ParallelPBESolver(evaluator, CutoffPBESolver, splits=4)
+    infinite_pcfg = ProbDetGrammar.uniform(CFG.infinite(dsl, FunctionType(INT, INT)))
+    for task in tasks:
+        generator = solver.solve(task, enumerate_prob_grammar(infinite_pcfg), 10)
+        program = next(generator)
+        for example in task.specification.examples:
+            assert evaluator.eval(program, example.inputs) == example.output
+        with pytest.raises(StopIteration):
+            generator.send(True)
+        assert solver.get_stats("programs") > 0
+        solver.reset_stats()
+
+
+class _DyingSolver(NaivePBESolver):
+    # Kills its process as if it was killed by the OS
+    def _test_(self, task: Task[PBE], program: Program) -> bool:
+        os._exit(1)
+
+
+def test_dead_process() -> None:
+    solver = ParallelPBESolver(evaluator, _DyingSolver, splits=2)
+    with pytest.raises(RuntimeError):
+        list(solver.solve(tasks[0], enumerate_prob_grammar(pcfg), 10))
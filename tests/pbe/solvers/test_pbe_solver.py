@@ -1,4 +1,4 @@
-from synth.semantic.evaluator import DSLEvaluator
+from synth.semantic.evaluator import DSLEvaluator, Evaluator
 from synth.specification import PBE, Example
 from synth.syntax.grammars.enumeration.heap_search import enumerate_prob_grammar
 from synth.syntax.grammars.cfg import CFG
@@ -12,11 +12,14 @@ from synth.syntax.type_system import (
     PrimitiveType,
 )
 from synth.syntax.type_helper import FunctionType
+from synth.syntax.program import Program
 from synth.pbe.solvers import NaivePBESolver, CutoffPBESolver, PBESolver
 
 import pytest
 
 from synth.task import Task
+from typing import Any
+import time
 
 
 syntax = {
@@ -62,3 +65,84 @@ def test_solving(solver: PBESolver) -> None:
             assert solver._score > 0
             break
         assert not failed
+
+
+class _WrappedEvaluator(Evaluator):
+    # An evaluator that does not support registering inputs
+    def eval(self, program: Program, input: Any) -> Any:
+        return evaluator.eval(program, input)
+
+    def clear_cache(self) -> None:
+        pass
+
+
+@pytest.mark.parametrize(
+    "solver_evaluator",
+    [_WrappedEvaluator(), DSLEvaluator(dsl.instantiate_semantics(semantics))],
+)
+def test_registered_inputs(solver_evaluator: Evaluator) -> None:
+    solver = NaivePBESolver(solver_evaluator)  # type: ignore
+    for task in tasks:
+        gen = solver.solve(task, enumerate_prob_grammar(pcfg), 10)
+        next(gen)
+        with pytest.raises(StopIteration):
+            gen.send(True)
+    if isinstance(solver_evaluator, DSLEvaluator):
+        # The inputs of the tasks are no longer kept alive by the evaluator
+        assert len(solver_evaluator._registered) == 0
+
+
+class _SlowSolver(NaivePBESolver):
+    # Records tested programs and takes some time to test each of them
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.tested: list = []
+
+    def _test_(self, task: Task[PBE], program: Program) -> bool:
+        self.tested.append(program)
+        time.sleep(0.01)
+        return super()._test_(task, program)
+
+
+def test_timeout_inside_batch() -> None:
+    solver = _SlowSolver(evaluator, batch_size=1000)
+    task = Task(cfg.type_request, PBE([Example([x], x * x) for x in [3, 4, 9, 12]]))
+    enumerator = enumerate_prob_grammar(pcfg)
+    assert list(solver.solve(task, enumerator, 0.1)) == []
+    # The timeout is not only checked before each batch
+    assert 0 < len(solver.tested) < 100
+    assert solver.get_stats("programs") == len(solver.tested)
+    assert solver.get_stats("program_probability") == enumerator.probability(
+        solver.tested[-1]
+    )
+
+
+@pytest.mark.parametrize("solver_class", [NaivePBESolver, CutoffPBESolver])
+def test_all_programs_enumerated(solver_class: type) -> None:
+    solver_evaluator = DSLEvaluator(dsl.instantiate_semantics(semantics))
+    solver = solver_class(solver_evaluator)
+    small_pcfg = ProbDetGrammar.uniform(
+        CFG.depth_constraint(dsl, FunctionType(INT, INT), 2)
+    )
+    task = Task(cfg.type_request, PBE([Example([x], x * x) for x in [3, 4, 9, 12]]))
+    enumerator = enumerate_prob_grammar(small_pcfg)
+    programs = list(enumerate_prob_grammar(small_pcfg))
+    assert list(solver.solve(task, enumerator, 10)) == []
+    assert solver.get_stats("programs") == len(programs)
+    assert solver.get_stats("program_probability") == enumerator.probability(
+        programs[-1]
+    )
+    # Inputs are also released when all programs were enumerated
+    assert len(solver_evaluator._registered) == 0
+
+
+def test_cutoff_score() -> None:
+    solver = CutoffPBESolver(evaluator)
+    program = dsl.parse_program("(+ var0 1)", type_req)
+    examples = [Example([x], x + 1) for x in [3, 4]] + [Example([9], 0)]
+    assert not solver._test_(Task(type_req, PBE(examples)), program)
+    assert solver._score == 2 / 3
+    assert not solver._test_(Task(type_req, PBE(examples[::-1])), program)
+    assert solver._score == 0
+    assert solver._test_(Task(type_req, PBE(examples[:2])), program)
+    assert solver._score == 1
@@ -1,6 +1,7 @@
 from synth.syntax.grammars.cfg import CFG
 from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
 from synth.semantic.evaluator import DSLEvaluator, __tuplify__
+from synth.semantic.vectorized import as_array
 from synth.syntax.dsl import DSL
 from synth.syntax.type_system import (
     INT,
@@ -11,7 +12,6 @@ from synth.syntax.type_system import (
 )
 from synth.syntax.type_helper import FunctionType
 
-
 syntax = {
     "+1": FunctionType(INT, INT),
     "head": FunctionType(List(PolymorphicType("a")), PolymorphicType("a")),
@@ -65,3 +65,147 @@ def test_use_cache() -> None:
                 assert eval._cache[__tuplify__([i])][program] == program.size() + i - 1
         except Exception as e:
             assert False, e
+
+
+def test_compilation() -> None:
+    eval = DSLEvaluator(dsl.instantiate_semantics(semantics), use_compilation=True)
+    walk_eval = DSLEvaluator(dsl.instantiate_semantics(semantics))
+    pcfg = ProbDetGrammar.uniform(cfg)
+    pcfg.init_sampling(0)
+    for _ in range(100):
+        program = pcfg.sample_program()
+        for i in range(-25, 25):
+            assert eval.eval(program, [i]) == walk_eval.eval(program, [i])
+            assert eval.compile(program)([i]) == program.size() + i - 1
+        assert eval.compile(program) is eval.compile(program)
+
+
+def test_eval_batch() -> None:
+    eval = DSLEvaluator(dsl.instantiate_semantics(semantics))
+    pcfg = ProbDetGrammar.uniform(cfg)
+    pcfg.init_sampling(0)
+    inputs = [[i] for i in range(-25, 25)]
+    for _ in range(100):
+        program = pcfg.sample_program()
+        outputs = eval.eval_batch(program, inputs)
+        assert outputs == [program.size() + i - 1 for i in range(-25, 25)]
+        assert outputs == [eval.eval(program, input) for input in inputs]
+
+
+def test_eval_batch_skip_exceptions() -> None:
+    eval = DSLEvaluator(
+        dsl.instantiate_semantics({"+1": lambda x: x + 1 if x != 0 else 1 // x})
+    )
+    eval.skip_exceptions.add(ZeroDivisionError)
+    program = dsl.parse_program("(+1 var0)", FunctionType(INT, INT))
+    assert eval.eval_batch(program, [[-1], [0], [1]]) == [0, None, 2]
+    assert eval.eval(program, [0]) is None
+
+
+def test_bounded_cache() -> None:
+    eval = DSLEvaluator(dsl.instantiate_semantics(semantics), cache_size=50)
+    pcfg = ProbDetGrammar.uniform(cfg)
+    pcfg.init_sampling(0)
+    for _ in range(100):
+        program = pcfg.sample_program()
+        for i in range(-25, 25):
+            assert eval.eval(program, [i]) == program.size() + i - 1
+        assert eval.eval_batch(program, [[i] for i in range(5)]) == [
+            program.size() + i - 1 for i in range(5)
+        ]
+        assert sum(len(x) for x in eval._cache.values()) <= 50
+        assert len(eval._lru) == sum(len(x) for x in eval._cache.values())
+    assert eval.cache_evictions > 0
+
+
+def test_bounded_cache_lru() -> None:
+    eval = DSLEvaluator(dsl.instantiate_semantics(semantics), cache_size=4)
+    program = dsl.parse_program("(+1 var0)", FunctionType(INT, INT))
+    # Each evaluation caches var0, +1 and (+1 var0)
+    assert eval.eval(program, [0]) == 1
+    assert eval.eval(program, [1]) == 2
+    # The evaluation on [0] is used again so it is kept instead of the older ones of [0]
+    requests, hits = eval._total_requests, eval._cache_hits
+    assert eval.eval(program, [0]) == 1
+    assert eval.eval_batch(program, [[0]]) == [1]
+    assert (eval._total_requests, eval._cache_hits) == (requests + 2, hits + 2)
+    assert eval.eval(program, [2]) == 3
+    assert program in eval._cache[__tuplify__([0])]
+    assert __tuplify__([1]) not in eval._cache
+    assert len(eval._lru) == 4
+
+
+def test_bounded_cache_exception() -> None:
+    eval = DSLEvaluator(
+        dsl.instantiate_semantics({"+1": lambda x: x + 1 if x != 0 else 1 // x}),
+        cache_size=2,
+    )
+    program = dsl.parse_program("(+1 var0)", FunctionType(INT, INT))
+    for _ in range(2):
+        try:
+            eval.eval(program, [0])
+            assert False
+        except ZeroDivisionError:
+            pass
+        assert len(eval._lru) == sum(len(x) for x in eval._cache.values()) <= 2
+
+
+def test_compiled_cache_lru() -> None:
+    eval = DSLEvaluator(
+        dsl.instantiate_semantics(semantics),
+        use_compilation=True,
+        compiled_cache_size=2,
+    )
+    first = dsl.parse_program("var0", FunctionType(INT, INT))
+    second = dsl.parse_program("+1", FunctionType(INT, INT))
+    compiled = eval.compile(first)
+    eval.compile(second)
+    assert eval.compile(first) is compiled
+    eval.compile(dsl.parse_program("(+1 var0)", FunctionType(INT, INT)))
+    assert first in eval._compiled and second not in eval._compiled
+    assert len(eval._compiled) == 2
+    assert eval.compiled_hit_rate > 0
+
+
+def test_register_inputs() -> None:
+    eval = DSLEvaluator(dsl.instantiate_semantics(semantics))
+    inputs = [[i, [i]] for i in range(-25, 25)]
+    ids = eval.register_inputs(inputs)
+    assert ids == list(range(len(inputs)))
+    assert eval.register_inputs([[3, [3]]]) == [ids[28]]
+    pcfg = ProbDetGrammar.uniform(cfg)
+    pcfg.init_sampling(0)
+    for _ in range(100):
+        program = pcfg.sample_program()
+        for example_id, input in zip(ids, inputs):
+            assert eval.eval(program, input) == program.size() + input[0] - 1
+            assert eval._cache[example_id][program] == program.size() + input[0] - 1
+    eval.clear_cache()
+    assert len(eval._registered) == 0
+
+
+def test_vectorized_semantics() -> None:
+    calls = []
+
+    def vectorized_plus_one(column):  # type: ignore
+        calls.append(column)
+        array = as_array(column)
+        # Fall back to the scalar semantic when there is a negative input
+        if array is None or (array < 0).any():
+            return None
+        return array + 1
+
+    eval = DSLEvaluator(
+        dsl.instantiate_semantics(semantics),
+        vectorized_semantics=dsl.instantiate_semantics({"+1": vectorized_plus_one}),
+    )
+    pcfg = ProbDetGrammar.uniform(cfg)
+    pcfg.init_sampling(0)
+    for inputs in [[[i] for i in range(25)], [[i] for i in range(-25, 25)]]:
+        for _ in range(100):
+            program = pcfg.sample_program()
+            outputs = eval.eval_batch(program, inputs)
+            assert outputs == [program.size() + input[0] - 1 for input in inputs]
+            assert all(isinstance(out, int) for out in outputs)
+            assert outputs == [eval.eval(program, input) for input in inputs]
+    assert len(calls) > 0
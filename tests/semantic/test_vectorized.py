@@ -0,0 +1,75 @@
+import random
+
+from synth.semantic.vectorized import (
+    INT_BOUND,
+    PaddedLists,
+    vcount,
+    vfilter,
+    vmap,
+    vreduce,
+    vreverse,
+    vscanl,
+    vsort,
+    vzipwith,
+)
+
+import numpy as np
+
+random.seed(0)
+lists = [
+    [random.randint(-20, 20) for _ in range(random.randint(0, 10))] for _ in range(30)
+]
+others = [
+    [random.randint(-20, 20) for _ in range(random.randint(0, 10))] for _ in range(30)
+]
+
+
+def test_padded_lists() -> None:
+    padded = PaddedLists.from_lists(lists)
+    assert padded is not None
+    assert padded.tolist() == lists
+    assert len(padded) == len(lists)
+    assert padded.max_abs() == max(abs(x) for l in lists for x in l)
+    assert PaddedLists.from_lists([[1], None]) is None  # type: ignore
+    assert PaddedLists.from_lists([[1], [INT_BOUND + 1]]) is None
+    assert PaddedLists.from_lists([[1], [2**70]]) is None
+    assert PaddedLists.from_lists([[], []]).tolist() == [[], []]  # type: ignore
+
+
+def test_lists_to_lists() -> None:
+    assert vmap(lambda v: v * 2, lambda m: 2 * m)(lists).tolist() == [  # type: ignore
+        [x * 2 for x in l] for l in lists
+    ]
+    assert vfilter(lambda v: v % 2 == 1)(lists).tolist() == [  # type: ignore
+        [x for x in l if x % 2 == 1] for l in lists
+    ]
+    assert vreverse(lists).tolist() == [l[::-1] for l in lists]  # type: ignore
+    assert vsort(lists).tolist() == [sorted(l) for l in lists]  # type: ignore
+    assert vzipwith(np.add)(lists, others).tolist() == [  # type: ignore
+        [x + y for x, y in zip(l1, l2)] for l1, l2 in zip(lists, others)
+    ]
+    scanned = vscanl(lambda v: np.maximum.accumulate(v, axis=1))(lists)
+    assert scanned.tolist() == [  # type: ignore
+        [max(l[: i + 1]) for i in range(len(l))] for l in lists
+    ]
+
+
+def test_lists_to_ints() -> None:
+    count = vcount(lambda v: v < 0)
+    assert count(lists).tolist() == [len([x for x in l if x < 0]) for l in lists]  # type: ignore
+    total = vreduce(lambda v, mask: v.sum(axis=1), lambda m, n: m * n)
+    assert total(lists).tolist() == [sum(l) for l in lists]  # type: ignore
+    head = vreduce(lambda v, mask: v[:, 0], allow_empty=False)
+    assert head(lists) is None
+    non_empty = [l for l in lists if l]
+    assert head(non_empty).tolist() == [l[0] for l in non_empty]  # type: ignore
+
+
+def test_overflow() -> None:
+    big = [[INT_BOUND // 2 + 1, 1], [3]]
+    assert vmap(lambda v: v * 2, lambda m: 2 * m)(big) is None
+    assert vmap(lambda v: v - 1, lambda m: m + 1)(big).tolist() == [  # type: ignore
+        [INT_BOUND // 2, 0],
+        [2],
+    ]
+    assert vzipwith(np.multiply, lambda m1, m2: m1 * m2)(big, big) is None
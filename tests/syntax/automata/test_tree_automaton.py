@@ -1,5 +1,5 @@
 from itertools import product
-from typing import Dict, Set, Tuple
+from typing import Any, Dict, Set, Tuple
 
 from synth.syntax.dsl import DSL
 from synth.syntax.type_system import (
@@ -14,6 +14,9 @@ from synth.syntax.type_helper import FunctionType
 from synth.syntax.grammars.grammar import DerivableProgram, NGram
 from synth.syntax.automata.tree_automaton import DFTA
 from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
+from synth.syntax.grammars.enumeration.heap_search import enumerate_prob_grammar
+from synth.syntax.program import Function, Program
 
 
 def cfg2dfta(
@@ -22,9 +25,9 @@ def cfg2dfta(
     StateT = Tuple[Type, int]
     dfta_rules: Dict[Tuple[DerivableProgram, Tuple[StateT, ...]], StateT] = {}
     max_depth = grammar.max_program_depth()
-    all_cases: Dict[
-        Tuple[int, Tuple[Type, ...]], Set[Tuple[Tuple[Type, int], ...]]
-    ] = {}
+    all_cases: Dict[Tuple[int, Tuple[Type, ...]], Set[Tuple[Tuple[Type, int], ...]]] = (
+        {}
+    )
     for S in grammar.rules:
         for P in grammar.rules[S]:
             args = grammar.rules[S][P][0]
@@ -100,3 +103,85 @@ def test_minimise(max_depth: int) -> None:
     ndfta = dfta.minimise()
     for P, args in ndfta.rules:
         assert not (all(x == (0,) for x in args) and len(args) > 0)
+
+
+@pytest.mark.parametrize("max_depth", max_depths)
+def test_minimise_duplicates(max_depth: int) -> None:
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), max_depth)
+    dfta = cfg2dfta(cfg)
+    dfta.reduce()
+    # two copies of each state that behave the same
+    rules = {}
+    for (P, args), dst in dfta.rules.items():
+        for copies in product([0, 1], repeat=len(args)):
+            new_args = tuple((arg, c) for arg, c in zip(args, copies))
+            rules[(P, new_args)] = (dst, sum(copies) % 2)
+    doubled = DFTA(rules, {(q, c) for q in dfta.finals for c in [0, 1]})
+    doubled.reduce()
+    minimal = dfta.minimise()
+    ndfta = doubled.minimise()
+    assert len(ndfta.states) == len(minimal.states)
+    assert ndfta.size() == minimal.size()
+    assert len(ndfta.finals) == len(minimal.finals)
+
+
+def __accepts__(dfta: DFTA, program: Program) -> bool:
+    def run(p: Program) -> Any:
+        if isinstance(p, Function):
+            args = tuple(run(arg) for arg in p.arguments)
+            return dfta.read(p.function, args)  # type: ignore
+        return dfta.read(p, ())  # type: ignore
+
+    return run(program) in dfta.finals
+
+
+@pytest.mark.parametrize("max_depth", [3, 4])
+def test_read_product(max_depth: int) -> None:
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), max_depth)
+    small = CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+    a, b = cfg2dfta(cfg), cfg2dfta(small)
+    a.reduce()
+    b.reduce()
+    out = a.read_product(b)
+    # only reachable pairs of states are built
+    assert out.states == {dst for dst in out.rules.values()}
+    for program in enumerate_prob_grammar(ProbDetGrammar.uniform(cfg)):
+        assert __accepts__(out, program) == __accepts__(b, program)
+
+
+@pytest.mark.parametrize("max_depth", [3, 4])
+def test_read_union(max_depth: int) -> None:
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), max_depth)
+    small = CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+    a, b = cfg2dfta(small), cfg2dfta(cfg)
+    a.reduce()
+    b.reduce()
+    # a accepts no program of depth 2
+    a.finals = {q for q in a.finals if q[1] != 1}
+    out = a.read_union(b)
+    for program in enumerate_prob_grammar(ProbDetGrammar.uniform(cfg)):
+        assert __accepts__(out, program) == (
+            __accepts__(a, program) or __accepts__(b, program)
+        )
+
+
+@pytest.mark.parametrize("max_depth", max_depths)
+def test_compile(max_depth: int) -> None:
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), max_depth)
+    dfta = cfg2dfta(cfg)
+    dfta.reduce()
+    compiled = dfta.compile()
+    assert compiled.size() == dfta.size()
+    ids = {q: i for i, q in enumerate(compiled.states)}
+    for (P, args), dst in dfta.rules.items():
+        state = compiled.read(compiled.letter(P), tuple(ids[q] for q in args))
+        assert compiled.state(state) == dst
+        assert compiled.finals[state] == (dst in dfta.finals)
+        if len(args) > 0:
+            missing = (args[0],) + args
+            assert compiled.read(compiled.letter(P), (-1,) + args[1:]) == -1
+            assert compiled.read(
+                compiled.letter(P), tuple(ids[q] for q in missing)
+            ) == ids.get(dfta.read(P, missing), -1)
+    assert compiled.letter("not a letter") == -1
+    assert compiled.read(-1, ()) == -1
@@ -87,3 +87,16 @@ def test_merge(cfg: TTCFG) -> None:
     diff = seen.difference(new_seen)
     for x in diff:
         assert removed in x
+
+
+@pytest.mark.parametrize("cfg", testdata)
+def test_batches(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.uniform(cfg)
+    programs = list(enumerate_prob_grammar(pcfg))
+    for size in [1, 7, 100]:
+        batches = list(enumerate_prob_grammar(pcfg).batches(size))
+        assert all(0 < len(batch) <= size for batch in batches)
+        assert [program for batch in batches for program in batch] == programs
+    for bucket in enumerate_prob_grammar(pcfg).buckets():
+        p = pcfg.probability(bucket[0])
+        assert all(abs(pcfg.probability(program) - p) <= 1e-6 * p for program in bucket)
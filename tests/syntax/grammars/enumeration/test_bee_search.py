@@ -87,3 +87,16 @@ def test_infinite() -> None:
         if count < 0:
             break
     assert count == -1
+
+
+@pytest.mark.parametrize("cfg", testdata)
+def test_batches(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.uniform(cfg)
+    programs = list(enumerate_prob_grammar(pcfg))
+    for size in [1, 7, 100]:
+        batches = list(enumerate_prob_grammar(pcfg).batches(size))
+        assert all(0 < len(batch) <= size for batch in batches)
+        assert [program for batch in batches for program in batch] == programs
+    buckets = list(enumerate_prob_grammar(pcfg).buckets())
+    assert all(len(bucket) > 0 for bucket in buckets)
+    assert [program for bucket in buckets for program in bucket] == programs
@@ -5,6 +5,7 @@ from synth.syntax.grammars.enumeration.beap_search import (
     enumerate_prob_grammar as enumerate,
 )
 
+from synth.syntax.grammars.enumeration.constant_delay_queue import CDQueue, CostTuple
 from synth.syntax.grammars.cfg import CFG
 from synth.syntax.grammars.ttcfg import TTCFG
 from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
@@ -85,3 +86,44 @@ def test_infinite(k: int, precis: float) -> None:
         if count < 0:
             break
     assert count == -1
+
+
+def test_infinite_uniform() -> None:
+    pcfg = ProbDetGrammar.uniform(CFG.infinite(dsl, testdata[0].type_request, n_gram=1))
+    gen = enumerate_prob_grammar(pcfg).generator()
+    programs = [next(gen) for _ in range(1000)]
+    assert len(set(programs)) == len(programs)
+
+
+@pytest.mark.parametrize("cfg", testdata)
+def test_batches(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.uniform(cfg)
+    programs = list(enumerate_prob_grammar(pcfg))
+    for size in [1, 7, 100]:
+        batches = list(enumerate_prob_grammar(pcfg).batches(size))
+        assert all(0 < len(batch) <= size for batch in batches)
+        assert [program for batch in batches for program in batch] == programs
+    buckets = list(enumerate_prob_grammar(pcfg).buckets())
+    assert all(len(bucket) > 0 for bucket in buckets)
+    assert [program for bucket in buckets for program in bucket] == programs
+
+
+@pytest.mark.parametrize("k", kvals)
+def test_queue(k: int) -> None:
+    rng = np.random.default_rng(1)
+    maxi = 10**6
+    queue = CDQueue(maxi, k)
+    queue.push(CostTuple(0, [[0]]))
+    queue.update()
+    popped = []
+    for i in range(1, 2000):
+        element = queue.pop()
+        popped.append(element.cost)
+        for cost in rng.integers(element.cost, element.cost + maxi, size=2):
+            queue.push(CostTuple(int(cost), [[i]]))
+        queue.update()
+        assert queue.size() == len(queue) > 0
+        assert queue.peek().cost >= element.cost
+    assert popped == sorted(popped)
+    # freed blocks are reused so memory follows the number of elements
+    assert len(queue._counts) <= 4 * (k + 1) * len(queue)
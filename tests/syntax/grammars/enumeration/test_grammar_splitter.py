@@ -3,6 +3,7 @@ from synth.syntax.grammars.enumeration.u_heap_search import enumerate_prob_u_gra
 from synth.syntax.grammars.enumeration.grammar_splitter import split
 from synth.syntax.grammars.tagged_u_grammar import ProbUGrammar
 from synth.syntax.grammars.u_cfg import UCFG
+from synth.syntax.grammars.cfg import CFG
 from synth.syntax.dsl import DSL
 from synth.syntax.type_system import (
     INT,
@@ -52,3 +53,38 @@ def test_none_missing(splits: int) -> None:
         new_seen |= a
     assert len(new_seen.difference(seen)) == 0, new_seen.difference(seen)
     assert len(seen.difference(new_seen)) == 0, seen.difference(new_seen)
+
+
+@pytest.mark.parametrize("splits", [3, 4, 5, 6])
+def test_swaps_terminate(splits: int) -> None:
+    # Swapping nodes back and forth between groups used to never end on this grammar
+    L = List(INT)
+    syntax = {"take": FunctionType(INT, L, L)}
+    for name in ["sort", "tail", "scanl-", "scanlmax", "scanlmin"]:
+        syntax[name] = FunctionType(L, L)
+    for name in ["zip*", "zip+", "zip-", "zipmax", "zipmin"]:
+        syntax[name] = FunctionType(L, L, L)
+    cfg = CFG.depth_constraint(DSL(syntax), FunctionType(L, L), 3)
+    pucfg = ProbUGrammar.uniform(UCFG.from_CFG(cfg))
+    fragments, ratio = split(pucfg, splits, desired_ratio=1.05)
+    # Undone swaps used to end the refinement before nodes could be split
+    assert ratio <= 1.05
+    programs = [
+        program
+        for sub_pcfg in fragments
+        for program in enumerate_prob_u_grammar(sub_pcfg)
+    ]
+    assert len(programs) == len(set(programs))
+    assert set(programs) == set(enumerate_prob_u_grammar(pucfg))
+
+
+@pytest.mark.parametrize("splits", testdata)
+def test_probabilities(splits: int) -> None:
+    fragments, _ = split(pucfg, splits, desired_ratio=1.05)
+    for sub_pcfg in fragments:
+        # Programs keep their relative probabilities inside a fragment
+        ratios = [
+            sub_pcfg.probability(program) / pucfg.probability(program)
+            for program in enumerate_prob_u_grammar(sub_pcfg)
+        ]
+        assert max(ratios) == pytest.approx(min(ratios))
@@ -2,12 +2,14 @@ from synth.syntax.grammars.enumeration.heap_search import (
     Bucket,
     enumerate_prob_grammar,
     enumerate_bucket_prob_grammar,
+    enumerate_cost_prob_grammar,
 )
 from synth.syntax.grammars.cfg import CFG
 from synth.syntax.grammars.ttcfg import TTCFG
 from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
 from synth.syntax.dsl import DSL
 from synth.syntax.type_system import (
+    BOOL,
     INT,
     STRING,
     List,
@@ -16,8 +18,9 @@ from synth.syntax.type_system import (
 )
 from synth.syntax.type_helper import FunctionType, auto_type
 
-import pytest
+import math
 
+import pytest
 
 syntax = {
     "+": FunctionType(INT, INT, INT),
@@ -74,6 +77,49 @@ def test_threshold(cfg: TTCFG) -> None:
     assert len(seent.symmetric_difference(seen)) == 0
 
 
+# On TTCFGs, successors of programs may be queried from the wrong non-terminals
+# which breaks unicity and order depending on the hash seed, this is shared by all heap search variants
+cfg_testdata = testdata[:1]
+
+
+@pytest.mark.parametrize("cfg", cfg_testdata)
+def test_unicity_costHeapSearch(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.random(cfg, seed=1)
+    seen = set()
+    for program in enumerate_cost_prob_grammar(pcfg):
+        assert program not in seen
+        seen.add(program)
+    assert len(seen) == cfg.programs()
+
+
+@pytest.mark.parametrize("cfg", cfg_testdata)
+def test_order_costHeapSearch(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.random(cfg, seed=1)
+    enumerator = enumerate_cost_prob_grammar(pcfg)
+    last = 0
+    for program in enumerator:
+        cost = enumerator.cost(pcfg.start, program)
+        assert cost is not None and cost >= last
+        # Costs are rounded at each rule
+        assert (
+            abs(cost + math.log(pcfg.probability(program)) * enumerator.precision)
+            <= program.size()
+        )
+        last = cost
+
+
+@pytest.mark.parametrize("cfg", cfg_testdata)
+def test_threshold_costHeapSearch(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.uniform(cfg)
+    threshold = 0.15
+    expected = set()
+    for program in enumerate_prob_grammar(pcfg):
+        if pcfg.probability(program) <= threshold:
+            break
+        expected.add(program)
+    assert set(enumerate_cost_prob_grammar(pcfg, threshold)) == expected
+
+
 @pytest.mark.parametrize("cfg", testdata)
 def test_unicity_bucketSearch(cfg: TTCFG) -> None:
     pcfg = ProbDetGrammar.uniform(cfg)
@@ -120,6 +166,75 @@ def test_merge(cfg: TTCFG) -> None:
         assert removed in x
 
 
+@pytest.mark.parametrize("cfg", testdata)
+def test_clone_keeps_deleted(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.uniform(cfg)
+    en = enumerate_prob_grammar(pcfg)
+    removed = dsl.parse_program("(+ 1 1)", auto_type("int"))
+    en.merge_program(dsl.parse_program("2", auto_type("int")), removed)
+    assert en.deleted == {removed}
+    clone = en.clone(pcfg)
+    assert clone.deleted == {removed}
+    for program in clone:
+        assert removed not in program
+
+
+@pytest.mark.parametrize("cfg", testdata)
+def test_update_probabilities(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.uniform(cfg)
+    new_pcfg = ProbDetGrammar.random(cfg, seed=3)
+    for builder in [
+        enumerate_prob_grammar,
+        enumerate_cost_prob_grammar,
+        lambda G: enumerate_bucket_prob_grammar(G, 3),
+    ]:
+        enumerator = builder(pcfg)
+        gen = enumerator.generator()
+        first = [next(gen) for _ in range(10)]
+        banks = {S: list(order) for S, order in enumerator._order.items()}
+        assert enumerator.update_probabilities(new_pcfg)
+        gen = enumerator.generator()
+        rest = [next(gen)]
+        # The prefix is not enumerated again: the banks are kept and only the new program is added
+        for S, order in enumerator._order.items():
+            assert list(order[: len(banks[S])]) == banks[S]
+        assert len(enumerator._order[enumerator.start]) == len(first) + 1
+        rest += list(gen)
+        # Programs already generated are not generated again
+        assert len(set(first + rest)) == len(first + rest) == cfg.programs()
+
+
+@pytest.mark.parametrize(
+    "builder,seed",
+    [
+        (enumerate_prob_grammar, 3),
+        (enumerate_cost_prob_grammar, 3),
+        (lambda G: enumerate_bucket_prob_grammar(G, 3), 2),
+    ],
+)
+def test_update_probabilities_complete(builder, seed: int) -> None:  # type: ignore
+    # Programs of the banks that are not arguments of queued programs used to lose their priority
+    # and their successors were silently dropped
+    cfg = CFG.depth_constraint(
+        DSL(
+            {
+                "+": FunctionType(INT, INT, INT),
+                "inc": FunctionType(INT, INT),
+                "1": INT,
+                "2": INT,
+            }
+        ),
+        FunctionType(INT, INT),
+        4,
+    )
+    enumerator = builder(ProbDetGrammar.uniform(cfg))
+    gen = enumerator.generator()
+    programs = [next(gen) for _ in range(20)]
+    assert enumerator.update_probabilities(ProbDetGrammar.random(cfg, seed=seed))
+    programs += list(enumerator.generator())
+    assert len(programs) == len(set(programs)) == cfg.programs()
+
+
 def test_infinite() -> None:
     pcfg = ProbDetGrammar.random(
         CFG.infinite(dsl, testdata[0].type_request, n_gram=1), 1
@@ -134,3 +249,52 @@ def test_infinite() -> None:
         if count < 0:
             break
     assert count == -1
+
+
+def test_infinite_costHeapSearch() -> None:
+    pcfg = ProbDetGrammar.random(
+        CFG.infinite(dsl, testdata[0].type_request, n_gram=1), 1
+    )
+    enumerator = enumerate_cost_prob_grammar(pcfg)
+    count = 10000
+    last = 0
+    for program in enumerator:
+        count -= 1
+        cost = enumerator.cost(pcfg.start, program)
+        assert cost is not None and cost >= last
+        last = cost
+        if count < 0:
+            break
+    assert count == -1
+
+
+@pytest.mark.parametrize("cfg", cfg_testdata)
+def test_batches(cfg: TTCFG) -> None:
+    pcfg = ProbDetGrammar.uniform(cfg)
+    programs = list(enumerate_prob_grammar(pcfg))
+    for size in [1, 7, 100]:
+        batches = list(enumerate_prob_grammar(pcfg).batches(size))
+        assert all(len(batch) == size for batch in batches[:-1])
+        assert 0 < len(batches[-1]) <= size
+        assert [program for batch in batches for program in batch] == programs
+
+
+def test_start_queried_first() -> None:
+    # The start non-terminal is queried before the non-terminals of its arguments
+    REGEXP = PrimitiveType("regexp")
+    regexp_dsl = DSL(
+        {
+            "eval": FunctionType(INT, REGEXP, BOOL),
+            "begin": REGEXP,
+            "?": FunctionType(REGEXP, REGEXP),
+            "*": FunctionType(REGEXP, REGEXP),
+        }
+    )
+    cfg = CFG.depth_constraint(regexp_dsl, FunctionType(INT, BOOL), 4)
+    for enumerator in [
+        enumerate_prob_grammar(ProbDetGrammar.uniform(cfg)),
+        enumerate_bucket_prob_grammar(ProbDetGrammar.uniform(cfg), 3),
+        enumerate_cost_prob_grammar(ProbDetGrammar.uniform(cfg)),
+    ]:
+        programs = list(enumerator)
+        assert len(set(programs)) == len(programs) == cfg.programs()
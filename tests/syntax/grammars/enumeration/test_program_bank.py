@@ -0,0 +1,183 @@
+from synth.filter.filter import Filter
+from synth.syntax.grammars.enumeration.program_bank import ProgramBank
+from synth.syntax.grammars.enumeration.beap_search import (
+    enumerate_prob_grammar as bps_enumerate_prob_grammar,
+)
+from synth.syntax.grammars.enumeration.bee_search import (
+    enumerate_prob_grammar as bs_enumerate_prob_grammar,
+)
+from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
+from synth.syntax.dsl import DSL
+from synth.syntax.program import Function, Program
+from synth.syntax.type_system import INT
+from synth.syntax.type_helper import FunctionType, auto_type
+
+import pytest
+
+
+syntax = {
+    "+": FunctionType(INT, INT, INT),
+    "1": INT,
+    "2": INT,
+}
+dsl = DSL(syntax)
+S = (INT, (None, None))
+
+
+class _AcceptAll(Filter[Program]):
+    def __init__(self) -> None:
+        self.seen: list = []
+
+    def accept(self, obj: Program) -> bool:
+        self.seen.append(obj)
+        return True
+
+
+def test_add_and_build() -> None:
+    bank: ProgramBank = ProgramBank()
+    one = dsl.get_primitive("1")
+    plus = dsl.get_primitive("+")
+    e1 = bank.add(S, 0, one, [])
+    e2 = bank.add(S, 1, plus, [e1, e1])
+    assert bank.program(e1) == one
+    assert bank.program(e2) == Function(plus, [one, one])
+    assert bank.build(plus, [e2, e1]) == Function(plus, [bank.program(e2), one])
+    assert list(bank.bucket(S, 1)) == [e2]  # type: ignore
+    assert bank.bucket(S, 2) is None
+    assert len(bank) == 2
+    assert bank.nbytes() > 0
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_remove(compact: bool) -> None:
+    bank: ProgramBank = ProgramBank(compact=compact)
+    one = dsl.get_primitive("1")
+    two = dsl.get_primitive("2")
+    plus = dsl.get_primitive("+")
+    e1 = bank.add(S, 0, one, [])
+    e2 = bank.add(S, 0, two, [])
+    e3 = bank.add(S, 1, plus, [e1, e2])
+    assert bank.matches(e3, dsl.parse_program("(+ 1 2)", auto_type("int")))
+    assert not bank.matches(e3, dsl.parse_program("(+ 2 1)", auto_type("int")))
+    bank.remove(one)
+    assert list(bank.bucket(S, 0)) == [e2]  # type: ignore
+    # Entries using the removed program are kept
+    assert bank.program(e3) == Function(plus, [one, two])
+
+
+def test_bounds() -> None:
+    bank: ProgramBank = ProgramBank(track_bounds=True)
+    one = dsl.get_primitive("1")
+    plus = dsl.get_primitive("+")
+    e1 = bank.add(S, 0, one, [])
+    e2 = bank.add(S, 1, plus, [e1, e1])
+    e3 = bank.add(S, 2, plus, [e2, e1])
+    for entry in [e1, e2, e3]:
+        program = bank.program(entry)
+        assert bank.bounds([entry]) == (program.size() + 1, program.depth() + 1)
+    program = bank.build(plus, [e3, e2])
+    assert bank.bounds([e3, e2]) == (program.size(), program.depth())
+    # smallest size and depth of the programs with a cost index at least i
+    assert bank.last_cost_index(S) == 2
+    assert bank.min_bounds(S) == ([1, 3, 5], [1, 2, 3])
+    assert bank.last_cost_index((INT, (None, 1))) == -1
+
+
+@pytest.mark.parametrize(
+    "enumerate_prob_grammar", [bps_enumerate_prob_grammar, bs_enumerate_prob_grammar]
+)
+def test_enumerators_bank(enumerate_prob_grammar) -> None:  # type: ignore
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+    enumerator = enumerate_prob_grammar(ProbDetGrammar.uniform(cfg))
+    programs = list(enumerator)
+    assert len(programs) == cfg.programs()
+    assert enumerator.programs_in_banks() >= len(programs)
+    assert enumerator.bytes_in_banks() > 0
+
+
+def test_compact() -> None:
+    one = dsl.get_primitive("1")
+    plus = dsl.get_primitive("+")
+    banks = [ProgramBank(), ProgramBank(compact=True)]
+    for bank in banks:
+        e1 = bank.add(S, 0, one, [])
+        e2 = bank.add(S, 1, plus, [e1, e1])
+        bank.add(S, 2, plus, [e2, e1])
+    assert not banks[0].compact and banks[1].compact
+    # Rules and arguments of entries are only stored by compact banks
+    assert banks[0].nbytes() < banks[1].nbytes()
+    assert [banks[0].program(i) for i in range(3)] == [
+        banks[1].program(i) for i in range(3)
+    ]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_remove_nested(compact: bool) -> None:
+    bank: ProgramBank = ProgramBank(compact=compact)
+    one = dsl.get_primitive("1")
+    two = dsl.get_primitive("2")
+    plus = dsl.get_primitive("+")
+    e1 = bank.add(S, 0, one, [])
+    e2 = bank.add(S, 0, two, [])
+    e3 = bank.add(S, 1, plus, [e1, e2])
+    bank.remove(one)
+    # Entries added after the index was built are found too
+    e4 = bank.add(S, 2, plus, [e3, e2])
+    e5 = bank.add(S, 2, plus, [e2, e3])
+    bank.remove(bank.program(e4))
+    assert list(bank.bucket(S, 2)) == [e5]  # type: ignore
+    bank.remove(bank.program(e3))
+    assert len(bank.bucket(S, 1)) == 0  # type: ignore
+    bank.remove(bank.program(e4))
+    assert len(bank) == 2
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_remove_keeps_others(compact: bool) -> None:
+    bank: ProgramBank = ProgramBank(compact=compact)
+    plus = dsl.get_primitive("+")
+    leaves = [bank.add(S, 0, dsl.get_primitive(name), []) for name in ["1", "2"]]
+    entries = [bank.add(S, 1, plus, [a, b]) for a in leaves for b in leaves]
+    # The last entry of the bucket takes the place of the removed one
+    bank.remove(bank.program(entries[1]))
+    assert list(bank.bucket(S, 1)) == [entries[0], entries[3], entries[2]]  # type: ignore
+    bank.remove(bank.program(entries[0]))
+    bank.remove(bank.program(entries[2]))
+    assert list(bank.bucket(S, 1)) == [entries[3]]  # type: ignore
+    # Removing twice does nothing
+    bank.remove(bank.program(entries[2]))
+    assert list(bank.bucket(S, 1)) == [entries[3]]  # type: ignore
+
+
+@pytest.mark.parametrize(
+    "enumerate_prob_grammar", [bps_enumerate_prob_grammar, bs_enumerate_prob_grammar]
+)
+def test_enumerators_build_once(enumerate_prob_grammar) -> None:  # type: ignore
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+    enumerator = enumerate_prob_grammar(ProbDetGrammar.uniform(cfg))
+    enumerator.filter = _AcceptAll()
+    built = []
+    build = enumerator._bank.build
+
+    def counting_build(P, args):  # type: ignore
+        built.append((P, tuple(args)))
+        return build(P, args)
+
+    enumerator._bank.build = counting_build
+    programs = list(enumerator)
+    assert len(programs) == cfg.programs()
+    assert len(built) == enumerator.programs_in_banks()
+    assert len(enumerator.filter.seen) == len(built)
+
+
+@pytest.mark.parametrize(
+    "enumerate_prob_grammar", [bps_enumerate_prob_grammar, bs_enumerate_prob_grammar]
+)
+def test_enumerators_compact_bank(enumerate_prob_grammar) -> None:  # type: ignore
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+    programs = list(enumerate_prob_grammar(ProbDetGrammar.uniform(cfg)))
+    compact = list(
+        enumerate_prob_grammar(ProbDetGrammar.uniform(cfg), compact_bank=True)
+    )
+    assert programs == compact
@@ -0,0 +1,141 @@
+import pathlib
+from typing import Callable
+
+from synth.syntax.grammars.enumeration.program_enumerator import ProgramEnumerator
+from synth.syntax.grammars.enumeration.heap_search import (
+    enumerate_prob_grammar as hs_enumerate_prob_grammar,
+    enumerate_bucket_prob_grammar,
+    enumerate_cost_prob_grammar,
+)
+from synth.syntax.grammars.enumeration.u_heap_search import enumerate_prob_u_grammar
+from synth.syntax.grammars.enumeration.beap_search import (
+    enumerate_prob_grammar as bps_enumerate_prob_grammar,
+)
+from synth.syntax.grammars.enumeration.bee_search import (
+    enumerate_prob_grammar as bs_enumerate_prob_grammar,
+)
+from synth.syntax.grammars.enumeration.constant_delay import (
+    enumerate_prob_grammar as cd_enumerate_prob_grammar,
+)
+from synth.syntax.grammars.cfg import CFG
+from synth.syntax.grammars.u_cfg import UCFG
+from synth.syntax.grammars.tagged_det_grammar import ProbDetGrammar
+from synth.syntax.grammars.tagged_u_grammar import ProbUGrammar
+from synth.syntax.dsl import DSL
+from synth.syntax.type_system import INT
+from synth.syntax.type_helper import FunctionType
+
+import pytest
+
+
+syntax = {
+    "+": FunctionType(INT, INT, INT),
+    "1": INT,
+    "2": INT,
+}
+dsl = DSL(syntax)
+cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), 3)
+pcfg = ProbDetGrammar.uniform(cfg)
+builders = [
+    lambda: hs_enumerate_prob_grammar(pcfg),
+    lambda: enumerate_bucket_prob_grammar(pcfg, 3),
+    lambda: enumerate_cost_prob_grammar(pcfg),
+    lambda: enumerate_prob_u_grammar(ProbUGrammar.uniform(UCFG.from_CFG(cfg))),
+    lambda: bps_enumerate_prob_grammar(pcfg),
+    lambda: bs_enumerate_prob_grammar(pcfg),
+    lambda: cd_enumerate_prob_grammar(pcfg),
+]
+
+
+@pytest.mark.parametrize("builder", builders)
+def test_save_load(
+    builder: Callable[[], ProgramEnumerator], tmp_path: pathlib.Path
+) -> None:
+    programs = list(builder())
+    enumerator = builder()
+    gen = enumerator.generator()
+    first = [next(gen) for _ in range(50)]
+    path = str(tmp_path / "enumerator.bin")
+    enumerator.save(path)
+    # The saved enumerator can still be used
+    assert first + list(gen) == programs
+    restored = ProgramEnumerator.load(path)
+    assert type(restored) == type(enumerator)
+    assert first + list(restored) == programs
+
+
+bounded_builders = [
+    lambda G, **kwargs: hs_enumerate_prob_grammar(G, **kwargs),
+    lambda G, **kwargs: enumerate_bucket_prob_grammar(G, 3, **kwargs),
+    lambda G, **kwargs: enumerate_cost_prob_grammar(G, **kwargs),
+    lambda G, **kwargs: enumerate_prob_u_grammar(
+        ProbUGrammar.uniform(UCFG.from_CFG(G.grammar)), **kwargs
+    ),
+    lambda G, **kwargs: bps_enumerate_prob_grammar(G, **kwargs),
+    lambda G, **kwargs: bs_enumerate_prob_grammar(G, **kwargs),
+    lambda G, **kwargs: cd_enumerate_prob_grammar(G, **kwargs),
+]
+
+
+@pytest.mark.parametrize("builder", bounded_builders)
+@pytest.mark.parametrize(
+    "bounds", [{"max_size": 3}, {"max_depth": 2}, {"max_size": 5, "max_depth": 2}]
+)
+def test_bounds(builder: Callable[..., ProgramEnumerator], bounds: dict) -> None:
+    max_size = bounds.get("max_size", 100)
+    max_depth = bounds.get("max_depth", 100)
+    expected = {
+        program
+        for program in builder(pcfg)
+        if program.size() <= max_size and program.depth() <= max_depth
+    }
+    enumerator = builder(pcfg, **bounds)
+    programs = list(enumerator)
+    assert len(programs) == len(expected)
+    assert set(programs) == expected
+
+
+@pytest.mark.parametrize("builder", bounded_builders)
+@pytest.mark.parametrize(
+    "seed,bounds", [(1, {"max_size": 3}), (1, {"max_depth": 2}), (3, {"max_size": 5})]
+)
+def test_bounds_random(
+    builder: Callable[..., ProgramEnumerator], seed: int, bounds: dict
+) -> None:
+    # Bee search used to stop after too many costs without programs
+    # and cd search when all the programs of a cost were out of bounds
+    G = ProbDetGrammar.random(
+        CFG.depth_constraint(
+            DSL({**syntax, "inc": FunctionType(INT, INT)}), FunctionType(INT, INT), 3
+        ),
+        seed=seed,
+    )
+    max_size = bounds.get("max_size", 100)
+    max_depth = bounds.get("max_depth", 100)
+    expected = {
+        program
+        for program in hs_enumerate_prob_grammar(G)
+        if program.size() <= max_size and program.depth() <= max_depth
+    }
+    programs = list(builder(G, **bounds))
+    assert len(programs) == len(set(programs)) == len(expected)
+    assert set(programs) == expected
+
+
+# buckets are not probabilities and u-heap search is tested with its own threshold
+@pytest.mark.parametrize("builder", [bounded_builders[i] for i in [0, 2, 4, 5, 6]])
+def test_threshold_terminates(builder: Callable[..., ProgramEnumerator]) -> None:
+    infinite = ProbDetGrammar.random(
+        CFG.infinite(dsl, FunctionType(INT, INT), n_gram=1), seed=1
+    )
+    threshold = 1e-4
+    # the first programs to enumerate, enough to reach the threshold
+    gen = hs_enumerate_prob_grammar(infinite).generator()
+    expected = set()
+    program = next(gen)
+    while infinite.probability(program) > threshold:
+        expected.add(program)
+        program = next(gen)
+    programs = list(builder(infinite, threshold=threshold))
+    assert len(programs) == len(expected)
+    assert set(programs) == expected
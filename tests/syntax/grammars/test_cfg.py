@@ -67,3 +67,24 @@ def test_infinite() -> None:
             res in cfg
         ), f"Program depth:{res.depth()} should be in the infinite TTCFG"
         res = dsl.parse_program(f"(+ {res} var0)", FunctionType(INT, INT))
+
+
+@pytest.mark.parametrize("max_depth", [-1, 4])
+def test_partial_application(max_depth: int) -> None:
+    dsl = DSL(
+        {
+            "+": FunctionType(INT, INT, INT),
+            "apply": FunctionType(Arrow(INT, INT), INT, INT),
+            "1": INT,
+        }
+    )
+    cfg = CFG.depth_constraint(dsl, FunctionType(INT, INT), max_depth)
+    derivations = {
+        str(P): [arg[0] for arg in rule[P][0]]
+        for S, rule in cfg.rules.items()
+        if S[0] == Arrow(INT, INT)
+        for P in rule
+    }
+    assert derivations == {"+": [INT], "apply": [Arrow(INT, INT)]}
+    res = dsl.parse_program("(apply (+ 1) var0)", FunctionType(INT, INT))
+    assert res in cfg
@@ -65,3 +65,36 @@ def test_is_using_all_variables() -> None:
             Primitive("f", FunctionType(*[INT for _ in range(c + 1)])), sub_vars
         )
         assert len(f.used_variables()) == c - 1
+
+
+def test_hash_consing() -> None:
+    f = Primitive("f", FunctionType(INT, BOOL, INT))
+    args: List[Program] = [Primitive("a", INT), Variable(0, BOOL)]
+    fun = Function(f, args)
+    # Equal programs built separately are the same object
+    assert Function(Primitive("f", FunctionType(INT, BOOL, INT)), list(args)) is fun
+    assert Function(f, [fun.arguments[0]]) is not fun
+    assert Function(f, [fun.arguments[0]]) != fun
+    # Modifying the list given to the constructor does not change the program
+    args.pop()
+    assert len(fun.arguments) == 2
+    assert Function(
+        f, [Function(f, [Primitive("a", INT), Variable(0, BOOL)]), Variable(1, BOOL)]
+    ) is Function(f, [fun, Variable(1, BOOL)])
+
+
+def test_deep_programs() -> None:
+    f = Primitive("f", FunctionType(INT, INT, INT))
+    program: Program = Variable(0, INT)
+    # Deeper than the default recursion limit
+    for i in range(5000):
+        program = Function(f, [program, Variable(i % 3, INT)])
+    assert program.size() == 2 * 5000 + 1
+    assert program.depth() == 5001
+    assert program.used_variables() == {0, 1, 2}
+    assert list(program.constants()) == []
+    assert Variable(2, INT) in program
+    assert Variable(3, INT) not in program
+    nodes = list(program.depth_first_iter())
+    assert len(nodes) == 3 * 5000 + 1
+    assert nodes[-1] is program
@@ -1,11 +1,13 @@
+import pickle
 import random
 import pathlib
 
-from synth.syntax.type_system import INT
+from synth.syntax.type_system import INT, List
 from synth.syntax.type_helper import FunctionType
-from synth.syntax.program import Variable
-from synth.task import Task, Dataset
-from synth.specification import PBE, Example
+from synth.syntax.program import Constant, Function, Lambda, Primitive, Variable
+from synth.task import Task, Dataset, LazyDataset
+from synth.specification import PBE, Example, PBEWithConstants
+from synth.utils.data_storage import available_codecs
 
 
 def test_dataset_save_and_load(tmp_path: pathlib.Path) -> None:
@@ -62,3 +64,85 @@ def test_dataset_behaviour() -> None:
     assert dataset[-5:-1] == dataset.tasks[-5:-1]
     assert dataset.tasks == [x for x in dataset]
     assert len(dataset) == len(dataset.tasks)
+
+
+def test_dataset_binary_save_and_load(tmp_path: pathlib.Path) -> None:
+    file_path = tmp_path / "dataset.bin"
+    random.seed(0)
+    type_request = FunctionType(List(INT), INT, List(INT))
+    x = Variable(0, List(INT))
+    tasks = [
+        Task(
+            type_request,
+            PBE(
+                [
+                    Example(
+                        [
+                            [random.randint(-100, 100) for _ in range(j)],
+                            random.randint(0, 100),
+                        ],
+                        [random.randint(0, 100)],
+                    )
+                    for j in range(5)
+                ]
+            ),
+            Function(Primitive("head", FunctionType(List(INT), INT)), [x])
+            if i % 2 == 0
+            else Lambda(Constant(INT, i, True), List(INT)),
+            metadata={"index": i},
+        )
+        for i in range(50)
+    ]
+    # Values and specifications that are not stored in columns
+    tasks[3].specification.examples[0].inputs[1] = 2**70
+    tasks[4].specification.examples[1].output = None
+    tasks[5].specification.examples[2].inputs[0] = [True, "a"]
+    tasks[6].specification = PBEWithConstants(
+        tasks[6].specification.examples, {INT: [1, 2]}
+    )
+    tasks[7].specification = PBE([])
+    dataset = Dataset(tasks, metadata={"something": False})
+    for codec in available_codecs():
+        dataset.save(file_path.as_posix(), codec, chunk_size=16)
+        loaded = Dataset[PBE].load(file_path.as_posix())
+        assert dataset == loaded
+        assert [t.solution for t in dataset] == [t.solution for t in loaded]
+        assert type(loaded[5].specification.examples[2].inputs[0][0]) == bool
+        assert list(Dataset[PBE].stream(file_path.as_posix())) == dataset.tasks
+
+
+def test_lazy_dataset(tmp_path: pathlib.Path) -> None:
+    file_path = (tmp_path / "dataset.bin").as_posix()
+    random.seed(0)
+    dataset = Dataset(
+        [
+            Task(
+                FunctionType(INT, INT) if i % 3 == 0 else FunctionType(INT, INT, INT),
+                PBE([Example([random.randint(0, 100)], random.randint(0, 100))]),
+                Variable(0, INT),
+                metadata={"index": i},
+            )
+            for i in range(100)
+        ],
+        metadata={"something": False},
+    )
+    dataset.save(file_path, "zlib", chunk_size=8)
+    with Dataset[PBE].load(file_path, lazy=True) as lazy:
+        assert isinstance(lazy, LazyDataset)
+        assert len(lazy) == len(dataset)
+        assert lazy.metadata == dataset.metadata
+        assert lazy.type_requests() == dataset.type_requests()
+        wanted = {FunctionType(INT, INT)}
+        indices = lazy.indices_of_type_requests(wanted)
+        # Tasks are not decoded to find their type request
+        assert len(lazy._cache) == 0
+        assert indices == dataset.indices_of_type_requests(wanted)
+        assert indices == list(range(0, 100, 3))
+        assert lazy[-1] == dataset[-1]
+        assert lazy[3:50:7] == dataset[3:50:7]
+        assert list(lazy) == dataset.tasks
+        assert lazy == dataset
+        assert pickle.loads(pickle.dumps(lazy))[42] == dataset[42]
+    # Legacy files are loaded entirely
+    dataset.save(file_path)
+    assert not isinstance(Dataset[PBE].load(file_path, lazy=True), LazyDataset)
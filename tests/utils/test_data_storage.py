@@ -0,0 +1,57 @@
+import io
+import pathlib
+from typing import Any
+
+import pytest
+
+from synth.utils.data_storage import (
+    KIND_OBJECT,
+    _FRAME,
+    FrameReader,
+    FrameWriter,
+    available_codecs,
+    is_binary_file,
+    load_object,
+    save_object,
+)
+
+
+def test_save_and_load(tmp_path: pathlib.Path) -> None:
+    file_path = (tmp_path / "object.pickle").as_posix()
+    obj = {"a": [1, 2, 3], "b": ("x", None), 4: 5.0}
+    save_object(file_path, obj)
+    assert not is_binary_file(file_path)
+    assert load_object(file_path) == obj
+    for codec in available_codecs():
+        save_object(file_path, obj, codec=codec)
+        assert is_binary_file(file_path)
+        assert load_object(file_path) == obj
+
+
+def test_unknown_codec(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(ValueError):
+        save_object((tmp_path / "object.pickle").as_posix(), 1, codec="unknown")
+
+
+class _Huge:
+    # Stands for a compressed payload of more than 4 GiB
+    def __len__(self) -> int:
+        return 2**32 + 1
+
+
+class _Recorder(io.BytesIO):
+    def write(self, data: Any) -> int:
+        if isinstance(data, _Huge):
+            return len(data)
+        return super().write(data)
+
+
+def test_large_frame() -> None:
+    fd = _Recorder()
+    writer = FrameWriter(fd, KIND_OBJECT, "none")
+    writer._compress = lambda payload: _Huge()  # type: ignore
+    writer.write(b"")
+    fd.seek(0)
+    FrameReader(fd, KIND_OBJECT)
+    (length,) = _FRAME.unpack(fd.read())
+    assert length == 2**32 + 1